@@ -1,5 +1,5 @@
 import os
-import scipy.signal
+import sys
 import scipy.optimize
 import pickle
 import numpy as np
@@ -7,6 +7,9 @@ import pandas as pd
 from datetime import datetime
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dodobot_py", "dodobot_py"))
+from lib.filters import BiquadCascade
+
 
 def parse_msg(msg):
     line_data = msg.split("\t")
@@ -86,12 +89,11 @@ def open_pickled_df(path):
 
 
 def noise_filter(xn, Wn=0.1):
-    b, a = scipy.signal.butter(3, Wn)
-    zi = scipy.signal.lfilter_zi(b, a)
-    z, _ = scipy.signal.lfilter(b, a, xn, zi=zi * xn[0])
-    z2, _ = scipy.signal.lfilter(b, a, z, zi=zi * z[0])
-    y = scipy.signal.filtfilt(b, a, xn)
-    return y
+    # zero phase: forward then backward through a 3rd order Butterworth, the same response as
+    # scipy.signal.butter(3, Wn) with filtfilt. Wn is a fraction of nyquist like scipy's.
+    # The ends start at steady state instead of filtfilt's odd padding
+    forward = BiquadCascade.butter_lowpass(3, Wn / 2.0, 1.0).filter_array(xn)
+    return BiquadCascade.butter_lowpass(3, Wn / 2.0, 1.0).filter_array(forward[::-1])[::-1]
 
 
 def estimate_capacity(df, start_date=None, stop_date=None):
@@ -1,10 +1,14 @@
+import os
+import sys
 import argparse
 from datetime import datetime
 import numpy as np
 # import pandas as pd
 import dateutil.parser
 import matplotlib.pyplot as plt
-from scipy import signal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dodobot_py", "dodobot_py"))
+from lib.filters import BiquadCascade, RollingMedian
 
 try:
     from lib.config import ConfigManager
@@ -26,12 +30,12 @@ args = parser.parse_args()
 
 
 def noise_filter(xn):
-    b, a = signal.butter(3, 0.01)
-    zi = signal.lfilter_zi(b, a)
-    z, _ = signal.lfilter(b, a, xn, zi=zi * xn[0])
-    z2, _ = signal.lfilter(b, a, z, zi=zi * z[0])
-    y = signal.filtfilt(b, a, xn)
-    return y
+    # a 5 sample median first drops short spikes. The scipy version didn't have this pre-pass.
+    # Then zero phase low pass: forward and backward through a 3rd order Butterworth,
+    # the same response as scipy.signal.butter(3, 0.01) with filtfilt
+    xn = RollingMedian(5).filter_array(xn)
+    forward = BiquadCascade.butter_lowpass(3, 0.005, 1.0).filter_array(xn)
+    return BiquadCascade.butter_lowpass(3, 0.005, 1.0).filter_array(forward[::-1])[::-1]
 
 
 def main():
@@ -1,6 +1,6 @@
+import os
 import math
 import numpy as np
-from scipy.interpolate import interp1d
 
 armature_length = 0.06
 hinge_pin_to_armature_end = 0.004
@@ -13,21 +13,44 @@ hinge_pin_to_pad_plane = 0.0055
 pad_extension_offset = 0.01998285
 central_axis_dist = 0.015
 
+# the jaws touch at open_angle and are furthest apart at closed_angle
+open_angle = math.radians(344.89282)
+closed_angle = math.radians(302.560457)
+
+gripper_table_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dodobot_py", "dodobot_py", "config", "gripper_table.csv")
+
+
 def angle_to_parallel_dist(angle_rad):
     angle_adj = angle_rad - math.pi*2 + math.pi/2
-    hinge_pin_x = rotation_offset_x * math.cos(angle_adj) - rotation_offset_y * math.sin(angle_adj)
+    hinge_pin_x = rotation_offset_x * np.cos(angle_adj) - rotation_offset_y * np.sin(angle_adj)
     parallel_dist = 2.0 * (hinge_pin_x - hinge_pin_to_pad_plane - pad_extension_offset + central_axis_dist)
     return parallel_dist
 
-open_angle = math.radians(344.89282)
-closed_angle = math.radians(302.560457)
-angle_samples = np.linspace(open_angle, closed_angle, 180)
-dist_samples = []
-for angle in angle_samples:
-    parallel_dist = angle_to_parallel_dist(angle)
-    dist_samples.append(parallel_dist)
 
-parallel_dist_interp_fn = interp1d(dist_samples, angle_samples, kind="linear")
+def make_gripper_table(num_samples=1001):
+    """
+    Jaw opening (mm) at evenly spaced fractions of servo travel. Travel is 0.0 at gripper_closed
+    (jaws touching) and 1.0 at gripper_open. The servo is assumed to move linearly in armature angle
+    between those positions.
+    """
+    travel = np.linspace(0.0, 1.0, num_samples)
+    angles = open_angle + travel * (closed_angle - open_angle)
+    opening_mm = np.maximum(angle_to_parallel_dist(angles) * 1000.0, 0.0)
+    return travel, np.degrees(angles), opening_mm
+
+
+def write_gripper_table(path, travel, angles_deg, opening_mm):
+    rows = np.column_stack((travel, angles_deg, opening_mm))
+    np.savetxt(path, rows, delimiter=",", fmt="%0.6f", header="travel,angle_deg,opening_mm", comments="")
+    print("Wrote %s gripper table rows to %s" % (len(rows), path))
+
+
+def main():
+    travel, angles_deg, opening_mm = make_gripper_table()
+    for d in np.arange(0, 0.075, 0.01):
+        print(np.interp(d * 1000.0, opening_mm, angles_deg))
+    write_gripper_table(gripper_table_path, travel, angles_deg, opening_mm)
+
 
-for d in np.arange(0, 0.075, 0.01):
-    print(math.degrees(parallel_dist_interp_fn(d)))
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import math
 import numpy as np
+import scipy.optimize
 import matplotlib.pyplot as plt
 
 # physical_parameters = dict(
@@ -50,9 +51,14 @@ g = 9.81
 robot_force = robot_mass * g
 robot_payload_force = (robot_mass + payload_mass) * g
 
+# at the nominal assembly angle, the combined spring force should sit between the robot's weight
+# and its weight with a payload, less this margin (N)
+nominal_angle = 12.1  # deg
+factor_of_safety = 0.5
+
 
 def get_spring_len(theta, params):
-    # meters:
+    # meters. Any of theta or params' values can be numpy arrays that broadcast together
     la = params["la"]
     lb = params["lb"]
     lc = params["lc"]
@@ -60,34 +66,96 @@ def get_spring_len(theta, params):
 
     x0 = -ld
     y0 = -lc
-    x1 = la * math.cos(theta) - lb * math.sin(theta)
-    y1 = -la * math.sin(theta) - lb * math.cos(theta)
+    x1 = la * np.cos(theta) - lb * np.sin(theta)
+    y1 = -la * np.sin(theta) - lb * np.cos(theta)
 
-    theta_spring = math.atan2(y1 - y0, x1 - x0)
-    l = (x1 - x0) / math.cos(theta_spring)
+    theta_spring = np.arctan2(y1 - y0, x1 - x0)
+    l = np.hypot(x1 - x0, y1 - y0)
 
     return l, theta_spring, ((x0, y0), (x1, y1))
 
 
-
-
-def motor_normal_force(l, y1):
-    x0 = spring_parameters["x0"]
-
+def get_spring_constant():
     if "k" in spring_parameters:
-        k = spring_parameters["k"]
+        return spring_parameters["k"]
     else:
         m = spring_parameters["m"]
+        x0 = spring_parameters["x0"]
         x1 = spring_parameters["x1"]
-        k = m * g / (x1 - x0)
+        return m * g / (x1 - x0)
+
+
+def motor_normal_force(l, y1):
+    x0 = spring_parameters["x0"]
+    k = get_spring_constant()
 
     lm = 0.065
 
-    return k * (l - x0) * (abs(y1) / lm)
+    return k * (l - x0) * (np.abs(y1) / lm)
+
+
+def dual_motor_force(theta, la, lb, params=None):
+    """Combined force of both motor springs. theta (radians), la and lb broadcast against each other"""
+    if params is None:
+        params = physical_parameters
+    l, theta_spring, ((x0, y0), (x1, y1)) = get_spring_len(theta, dict(params, la=la, lb=lb))
+    return motor_normal_force(l, y1) * 2
+
+
+def force_grid(thetas, las, lbs, params=None):
+    """Returns forces indexed by [la, lb, theta]"""
+    return dual_motor_force(
+        np.asarray(thetas)[np.newaxis, np.newaxis, :],
+        np.asarray(las)[:, np.newaxis, np.newaxis],
+        np.asarray(lbs)[np.newaxis, :, np.newaxis],
+        params
+    )
+
 
+def force_limits():
+    return robot_force - factor_of_safety, robot_payload_force - factor_of_safety
 
-def print_results(theta):
-    l, theta_spring, ((x0, y0), (x1, y1)) = get_spring_len(math.radians(theta), physical_parameters)
+
+def feasible_geometries(las, lbs, theta=nominal_angle):
+    """Mask of la, lb pairs whose force at theta (degrees) is within force_limits"""
+    forces = force_grid([math.radians(theta)], las, lbs)[:, :, 0]
+    lower, upper = force_limits()
+    return (forces >= lower) & (forces <= upper), forces
+
+
+def optimize_geometry(theta=nominal_angle, bounds=((0.03, 0.07), (0.005, 0.03)), params=None):
+    """
+    Smallest relative change to la and lb that puts the force at theta (degrees) in the middle of
+    force_limits while staying between them.
+    """
+    if params is None:
+        params = physical_parameters
+    theta = math.radians(theta)
+    lower, upper = force_limits()
+    target = (lower + upper) / 2.0
+    initial = np.array([params["la"], params["lb"]])
+
+    def force(x):
+        return dual_motor_force(theta, x[0], x[1], params)
+
+    def cost(x):
+        change = (x - initial) / initial
+        return np.dot(change, change) + ((force(x) - target) / (upper - lower)) ** 2
+
+    constraints = [
+        dict(type="ineq", fun=lambda x: force(x) - lower),
+        dict(type="ineq", fun=lambda x: upper - force(x)),
+    ]
+    result = scipy.optimize.minimize(cost, initial, method="SLSQP", bounds=bounds, constraints=constraints)
+    if not result.success:
+        print("Geometry optimization failed: %s" % result.message)
+    return dict(params, la=result.x[0], lb=result.x[1]), float(force(result.x))
+
+
+def print_results(theta, params=None):
+    if params is None:
+        params = physical_parameters
+    l, theta_spring, ((x0, y0), (x1, y1)) = get_spring_len(math.radians(theta), params)
     motor_F = motor_normal_force(l, y1)
     dual_motor_F = motor_F * 2
     net_force = dual_motor_F - robot_force
@@ -96,7 +164,6 @@ def print_results(theta):
     print("%0.1f\t%0.3f\t%0.3f\t%0.3f\t%0.3f" % (theta, l, dual_motor_F, net_force, net_force_payload))
 
 
-
 def main():
     print_results(9.0)
     print_results(12.1)
@@ -107,33 +174,42 @@ def main():
     # plt.plot([0.065], [0.0], 'x')
 
     thetas = np.linspace(0.0, math.radians(22.0), 50)
-    ls = []
     spring_spacing = np.linspace(0.048, 0.052, 10)
     # spring_spacing = [physical_parameters["la"]]
+    forces = force_grid(thetas, spring_spacing, [physical_parameters["lb"]])[:, 0, :]
 
     plt.figure(2)
-    for length in spring_spacing:
-        forces = []
-        physical_parameters["la"] = length
-        for theta in thetas:
-            l, theta_spring, ((x0, y0), (x1, y1)) = get_spring_len(theta, physical_parameters)
-            motor_F = motor_normal_force(l, y1)
-            dual_motor_F = motor_F * 2
-
-            ls.append(l)
-            forces.append(dual_motor_F)
-
-            # plt.plot([x0, x1], [y0, y1])
+    for length, length_forces in zip(spring_spacing, forces):
+        plt.plot(np.degrees(thetas), length_forces, label="%0.4f" % length)
+    plt.xlabel("Assembly angle (deg)")
+    plt.ylabel("Force (N)")
 
-        plt.plot(np.degrees(thetas), forces, label="%0.4f" % length)
-        plt.xlabel("Assembly angle (deg)")
-        plt.ylabel("Force (N)")
-
-    factor_of_safety = 0.5
-    plt.plot([12.1, 12.1], [robot_force - factor_of_safety, robot_payload_force - factor_of_safety])
+    lower, upper = force_limits()
+    plt.plot([nominal_angle, nominal_angle], [lower, upper])
     plt.legend()
-    # plt.plot(thetas, ls)
+
+    las = np.linspace(0.03, 0.07, 401)
+    lbs = np.linspace(0.005, 0.03, 251)
+    feasible, nominal_forces = feasible_geometries(las, lbs)
+    print("%s of %s la, lb pairs meet the force limits at %0.1f deg" % (
+        np.count_nonzero(feasible), feasible.size, nominal_angle))
+
+    plt.figure(3)
+    plt.contourf(lbs * 1000.0, las * 1000.0, nominal_forces, levels=30)
+    plt.colorbar(label="Force at %0.1f deg (N)" % nominal_angle)
+    plt.contour(lbs * 1000.0, las * 1000.0, nominal_forces, levels=[lower, upper], colors="k")
+    plt.xlabel("lb (mm)")
+    plt.ylabel("la (mm)")
+
+    params, force = optimize_geometry()
+    print("Optimized geometry: la=%0.5f, lb=%0.5f -> %0.3f N (limits %0.3f..%0.3f N)" % (
+        params["la"], params["lb"], force, lower, upper))
+    plt.plot([params["lb"] * 1000.0], [params["la"] * 1000.0], "rx")
+    for theta in (9.0, 12.1, 22.0):
+        print_results(theta, params)
 
     plt.show()
 
-main()
+
+if __name__ == "__main__":
+    main()
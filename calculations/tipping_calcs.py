@@ -1,4 +1,6 @@
+import os
 import math
+import collections
 import numpy as np
 # import matplotlib.pyplot as plt
 
@@ -63,10 +65,7 @@ def calc_linear_mass(linear_type, linear_stroke_mm):
     else:
         raise ValueError("Not valid linear type: %s" % linear_type)
 
-def does_it_tip(scenario):
-    if "deceleration" not in scenario:
-        scenario["deceleration"] = scenario["initial_velocity"] / scenario["stopping_time"]
-
+def center_of_mass(scenario):
     if "m_linear" not in scenario:
         m_linear = calc_linear_mass(scenario["linear_type"], scenario["linear_stroke_mm"])
     else:
@@ -82,6 +81,13 @@ def does_it_tip(scenario):
         m_linear * scenario["ly_linear"] +
         scenario["m_payload"] * scenario["ly_payload"]
     ) / total_m
+    return total_m, x_cm, y_cm
+
+def does_it_tip(scenario):
+    if "deceleration" not in scenario:
+        scenario["deceleration"] = scenario["initial_velocity"] / scenario["stopping_time"]
+
+    total_m, x_cm, y_cm = center_of_mass(scenario)
 
     l_cm = scenario["y_ground"] + y_cm
     l_nf = scenario["wheel_spacing_base"] / 2.0 - x_cm
@@ -93,14 +99,42 @@ def does_it_tip(scenario):
 
     return f_nb
 
+def max_deceleration(scenario, min_rear_force=0.0):
+    # the deceleration at which does_it_tip's rear normal force drops to min_rear_force
+    total_m, x_cm, y_cm = center_of_mass(scenario)
+
+    l_cm = scenario["y_ground"] + y_cm
+    l_nf = scenario["wheel_spacing_base"] / 2.0 - x_cm
+
+    f_g = total_m * scenario["g"]
+    return (f_g * l_nf - min_rear_force * scenario["wheel_spacing_base"]) / (total_m * l_cm)
+
+dodobot_scenario = dict(
+    # deceleration=deceleration,  # m/s^2
+    initial_velocity=0.33,
+    stopping_time=0.09,
+    m_base=3.6,  # kg (total: 4.427)
+    m_payload=0.6,  # kg
+    m_linear=0.827,
+    g=9.81,
+    wheel_spacing_base=0.125,  # m
+
+    lx_base=0.0,
+    ly_base=0.0,
+    lx_linear=0.0,
+    ly_linear=0.1,  # m
+    lx_payload=0.25,  # m
+    ly_payload=0.15,  # m with the linear axis at the bottom
+    y_ground=0.05,  # m
+)
+
 def max_load_exceeded(scenario):
     m_linear = calc_linear_mass(scenario["linear_type"], scenario["linear_stroke_mm"])
     total_m = m_linear + scenario["m_payload"]
     # return total_m > scenario.get("max_base_payload", 0.0)
     return total_m
 
-def test_points():
-    deceleration = 5.0
+def example_scenarios(deceleration=5.0):
 
     short_omron_ld = dict(
         deceleration=deceleration,  # m/s^2
@@ -223,32 +257,22 @@ def test_points():
         y_ground=0.175,  # m
     )
 
-    dodobot = dict(
-        # deceleration=deceleration,  # m/s^2
-        initial_velocity=0.33,
-        stopping_time=0.09,
-        m_base=3.6,  # kg (total: 4.427)
-        m_payload=0.6,  # kg
-        m_linear=0.827,
-        g=9.81,
-        wheel_spacing_base=0.125,  # m
-
-        lx_base=0.0,
-        ly_base=0.0,
-        lx_linear=0.0,
-        ly_linear=0.1,  # m
-        lx_payload=0.25,  # m
-        ly_payload=0.15,  # m
-        y_ground=0.05,  # m
-    )
+    return collections.OrderedDict([
+        ("short_omron_ld", short_omron_ld),
+        ("tall_omron_ld", tall_omron_ld),
+        ("clearpath_dingo", clearpath_dingo),
+        ("clearpath_boxer", clearpath_boxer),
+        ("short_mir100", short_mir100),
+        ("tall_mir100", tall_mir100),
+        ("dodobot", dict(dodobot_scenario)),
+    ])
 
-    print("short_omron_ld\t", does_it_tip(short_omron_ld))
-    print("tall_omron_ld\t", does_it_tip(tall_omron_ld))
-    print("clearpath_dingo\t", does_it_tip(clearpath_dingo), max_load_exceeded(clearpath_dingo))
-    print("clearpath_boxer\t", does_it_tip(clearpath_boxer), max_load_exceeded(clearpath_boxer))
-    print("short_mir100\t", does_it_tip(short_mir100), max_load_exceeded(short_mir100))
-    print("tall_mir100\t", does_it_tip(tall_mir100), max_load_exceeded(tall_mir100))
-    print("dodobot\t", does_it_tip(dodobot))
+def test_points():
+    for name, scenario in example_scenarios().items():
+        if "max_base_payload" in scenario:
+            print(name + "\t", does_it_tip(scenario), max_load_exceeded(scenario))
+        else:
+            print(name + "\t", does_it_tip(scenario))
 
 
 def test_combinations():
@@ -321,17 +345,108 @@ def test_combinations():
 
     # combinations = cartesian([m_base, deceleration, lx_payload, m_payload])
     combinations = cartesian([m_base, deceleration, lx_payload])
-    for combination in combinations:
-        base_config["m_base"] = combination[0]
-        base_config["deceleration"] = combination[1]
-        base_config["lx_payload"] = combination[2]
-        # base_config["m_payload"] = combination[3]
-        rear_force = does_it_tip(base_config)
-
-        # print(rear_force > 0, rear_force, combination)
-        if rear_force > base_config["safety_offset"]:
-            print(rear_force, combination)
-
-test_points()
-# test_combinations()
-# print(calc_linear_mass("MTJ40", np.linspace(750, 1250, 25)))
+    base_config["m_base"] = combinations[:, 0]
+    base_config["deceleration"] = combinations[:, 1]
+    base_config["lx_payload"] = combinations[:, 2]
+    # base_config["m_payload"] = combinations[:, 3]
+    rear_force = does_it_tip(base_config)
+
+    # print(rear_force > 0, rear_force, combinations)
+    for index in np.flatnonzero(rear_force > base_config["safety_offset"]):
+        print(rear_force[index], combinations[index])
+
+    # lightest base that doesn't tip for each deceleration and payload offset
+    print(tipping_boundary(base_config, dict(deceleration=deceleration, lx_payload=lx_payload, m_base=m_base),
+                           "m_base", base_config["safety_offset"]))
+
+def tipping_boundary(scenario, axes, boundary_axis, min_rear_force=0.0, largest=False, chunk_size=2 ** 22):
+    """
+    Evaluates does_it_tip over every combination of the values in axes (name -> 1D array) and returns,
+    for each combination of the other axes, the smallest value along boundary_axis (the largest
+    if largest is set) with a rear normal force above min_rear_force. nan where no value is safe.
+    The result has one dimension per other axis, in the order of axes. Combinations are
+    evaluated as numpy arrays of at most chunk_size elements at a time.
+    """
+    other_axes = [name for name in axes if name != boundary_axis]
+    other_shape = tuple(len(axes[name]) for name in other_axes)
+    boundary_values = np.asarray(axes[boundary_axis], dtype=np.float64)
+    num_rows = int(np.prod(other_shape))
+    rows_per_chunk = max(1, chunk_size // len(boundary_values))
+    no_value = -np.inf if largest else np.inf
+
+    boundary = np.empty(num_rows)
+    for start in range(0, num_rows, rows_per_chunk):
+        stop = min(start + rows_per_chunk, num_rows)
+        coords = np.unravel_index(np.arange(start, stop), other_shape)
+        chunk = dict(scenario)
+        for name, coord in zip(other_axes, coords):
+            chunk[name] = np.asarray(axes[name], dtype=np.float64)[coord][:, np.newaxis]
+        chunk[boundary_axis] = boundary_values[np.newaxis, :]
+
+        rear_force = np.broadcast_to(does_it_tip(chunk), (stop - start, len(boundary_values)))
+        candidates = np.where(rear_force > min_rear_force, boundary_values, no_value)
+        boundary[start:stop] = candidates.max(axis=1) if largest else candidates.min(axis=1)
+
+    boundary[np.isinf(boundary)] = np.nan
+    return boundary.reshape(other_shape)
+
+def benchmark_sweep(num_values=100):
+    # the per row loop test_combinations used to run against tipping_boundary
+    import time
+    scenario = dict(dodobot_scenario)
+    axes = dict(
+        m_payload=np.linspace(0.0, 1.0, num_values),
+        lx_payload=np.linspace(0.1, 0.3, num_values),
+        deceleration=np.linspace(0.5, 6.0, num_values),
+    )
+    num_loop_rows = 20000
+    loop_scenario = dict(scenario)
+    start_time = time.perf_counter()
+    for combination in cartesian(list(axes.values()))[:num_loop_rows]:
+        loop_scenario["m_payload"], loop_scenario["lx_payload"], loop_scenario["deceleration"] = combination
+        does_it_tip(loop_scenario)
+    loop_time = (time.perf_counter() - start_time) * num_values ** 3 / num_loop_rows
+
+    start_time = time.perf_counter()
+    boundary = tipping_boundary(scenario, axes, "deceleration", largest=True)
+    sweep_time = time.perf_counter() - start_time
+    print("%s combinations. loop: %0.2fs (extrapolated), vectorized: %0.3fs" % (num_values ** 3, loop_time, sweep_time))
+    return boundary
+
+def make_stability_table(scenario, heights_mm, payloads_kg, safety_factor=1.5):
+    """
+    Max safe deceleration (m/s^2) for every linear axis height and payload mass.
+    forward is stopping while driving forward, toward the payload side. reverse mirrors the
+    geometry for stopping while backing up. The payload rides on the linear axis.
+    """
+    rows = []
+    for height_mm in heights_mm:
+        for payload_kg in payloads_kg:
+            forward = dict(scenario)
+            forward["m_payload"] = payload_kg
+            forward["ly_payload"] = scenario["ly_payload"] + height_mm / 1000.0
+            reverse = dict(forward)
+            for key in ("lx_base", "lx_linear", "lx_payload"):
+                reverse[key] = -forward[key]
+            rows.append((
+                height_mm, payload_kg,
+                max_deceleration(forward) / safety_factor,
+                max_deceleration(reverse) / safety_factor
+            ))
+    return np.array(rows)
+
+def write_stability_table(path, table):
+    np.savetxt(path, table, delimiter=",", fmt="%0.4f",
+               header="height_mm,payload_kg,forward_decel,reverse_decel", comments="")
+
+if __name__ == "__main__":
+    test_points()
+    # test_combinations()
+    # benchmark_sweep()
+    # print(calc_linear_mass("MTJ40", np.linspace(750, 1250, 25)))
+
+    # linear axis travel is 153.6mm (see stepper_calcs.py)
+    table = make_stability_table(dodobot_scenario, np.linspace(0.0, 153.6, 9), np.linspace(0.0, 1.0, 6))
+    write_stability_table(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "dodobot_py", "dodobot_py", "config", "stability_table.csv"
+    ), table)
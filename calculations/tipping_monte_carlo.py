@@ -0,0 +1,145 @@
+import os
+import math
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from tipping_calcs import does_it_tip, calc_linear_mass, example_scenarios
+
+# Monte Carlo version of tipping_calcs.does_it_tip. Each scenario's parameters are drawn from the
+# distributions below around their nominal values, evaluated in numpy batches spread over a
+# process pool, and counted as tipped when the rear normal force goes negative.
+
+NUM_SAMPLES = 20000000
+BATCH_SIZE = 1000000
+NUM_WORKERS = os.cpu_count()
+SEED = 5489
+SCENARIOS = ["dodobot", "clearpath_dingo", "short_mir100"]
+
+# parameter -> (distribution, spread)
+#   normal: standard deviation as a fraction of the nominal value
+#   uniform: +- fraction of the nominal value
+#   normal_abs: standard deviation in the parameter's units
+uncertainty = dict(
+    m_base=("normal", 0.05),
+    m_linear=("normal", 0.05),
+    m_payload=("uniform", 0.25),
+    lx_base=("normal_abs", 0.005),  # m
+    ly_base=("normal_abs", 0.005),  # m
+    lx_payload=("normal", 0.1),
+    ly_payload=("normal", 0.1),
+    ly_linear=("normal", 0.05),
+    deceleration=("normal", 0.2),
+)
+
+
+def nominal_values(scenario):
+    scenario = dict(scenario)
+    if "deceleration" not in scenario:
+        scenario["deceleration"] = scenario["initial_velocity"] / scenario["stopping_time"]
+    if "m_linear" not in scenario:
+        scenario["m_linear"] = calc_linear_mass(scenario["linear_type"], scenario["linear_stroke_mm"])
+    return scenario
+
+
+def sample_parameter(rng, nominal, distribution, spread, size):
+    if distribution == "normal":
+        return rng.normal(nominal, abs(nominal) * spread, size)
+    elif distribution == "uniform":
+        return rng.uniform(nominal - abs(nominal) * spread, nominal + abs(nominal) * spread, size)
+    elif distribution == "normal_abs":
+        return rng.normal(nominal, spread, size)
+    else:
+        raise ValueError("Not valid distribution: %s" % distribution)
+
+
+def run_batches(scenario, num_samples, seed_sequence):
+    """
+    Returns the number of tipped samples and, per sampled parameter, the sums needed to merge
+    correlations across workers: sum x, sum x^2, sum x*f, sum x*tipped. f is the rear force.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    names = list(uncertainty.keys())
+    num_tipped = 0
+    force_sums = np.zeros(3)  # sum f, sum f^2, count
+    param_sums = np.zeros((len(names), 4))
+
+    for start in range(0, num_samples, BATCH_SIZE):
+        size = min(BATCH_SIZE, num_samples - start)
+        batch = dict(scenario)
+        for name in names:
+            distribution, spread = uncertainty[name]
+            batch[name] = sample_parameter(rng, scenario[name], distribution, spread, size)
+        for name in ("m_base", "m_linear", "m_payload", "deceleration"):
+            np.maximum(batch[name], 0.0, out=batch[name])
+
+        rear_force = does_it_tip(batch)
+        tipped = rear_force < 0.0
+        num_tipped += int(np.count_nonzero(tipped))
+        force_sums += (rear_force.sum(), np.dot(rear_force, rear_force), size)
+        for index, name in enumerate(names):
+            values = batch[name]
+            param_sums[index] += (values.sum(), np.dot(values, values), np.dot(values, rear_force), values[tipped].sum())
+
+    return num_tipped, force_sums, param_sums
+
+
+def correlation(n, sum_x, sum_xx, sum_y, sum_yy, sum_xy):
+    cov = sum_xy / n - (sum_x / n) * (sum_y / n)
+    var_x = sum_xx / n - (sum_x / n) ** 2
+    var_y = sum_yy / n - (sum_y / n) ** 2
+    if var_x <= 0.0 or var_y <= 0.0:
+        return 0.0
+    return cov / math.sqrt(var_x * var_y)
+
+
+def simulate(executor, scenario, num_samples, seed):
+    scenario = nominal_values(scenario)
+    num_tasks = NUM_WORKERS * 4
+    seed_sequences = np.random.SeedSequence(seed).spawn(num_tasks)
+    samples_per_task = [num_samples // num_tasks + (1 if index < num_samples % num_tasks else 0)
+                        for index in range(num_tasks)]
+
+    futures = [executor.submit(run_batches, scenario, task_samples, seed_sequence)
+               for task_samples, seed_sequence in zip(samples_per_task, seed_sequences)]
+    num_tipped = 0
+    force_sums = np.zeros(3)
+    param_sums = np.zeros((len(uncertainty), 4))
+    for future in futures:
+        task_tipped, task_force_sums, task_param_sums = future.result()
+        num_tipped += task_tipped
+        force_sums += task_force_sums
+        param_sums += task_param_sums
+
+    n = force_sums[2]
+    p_tip = num_tipped / n
+    sensitivity = {}
+    for index, name in enumerate(uncertainty):
+        sum_x, sum_xx, sum_xf, sum_x_tipped = param_sums[index]
+        # tipped is 0 or 1, so its sum and sum of squares are both num_tipped
+        sensitivity[name] = (
+            correlation(n, sum_x, sum_xx, force_sums[0], force_sums[1], sum_xf),
+            correlation(n, sum_x, sum_xx, num_tipped, num_tipped, sum_x_tipped),
+        )
+    return p_tip, sensitivity
+
+
+def main():
+    scenarios = example_scenarios()
+    with ProcessPoolExecutor(max_workers=NUM_WORKERS) as executor:
+        for name in SCENARIOS:
+            start_time = time.perf_counter()
+            p_tip, sensitivity = simulate(executor, scenarios[name], NUM_SAMPLES, SEED)
+            duration = time.perf_counter() - start_time
+
+            # normal approximation of the binomial confidence interval
+            interval = 1.96 * math.sqrt(max(p_tip * (1.0 - p_tip), 1.0 / NUM_SAMPLES) / NUM_SAMPLES)
+            print("%s: P(tip) = %0.6f +- %0.6f (%s samples in %0.2fs, %0.1fM samples/s)" % (
+                name, p_tip, interval, NUM_SAMPLES, duration, NUM_SAMPLES / duration / 1e6))
+            print("\tparameter\tcorr(rear force)\tcorr(tipped)")
+            for parameter, (force_corr, tip_corr) in sorted(sensitivity.items(), key=lambda item: -abs(item[1][0])):
+                print("\t%s\t%0.4f\t%0.4f" % (parameter, force_corr, tip_corr))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import time
+import asyncio
+
+from lib import arguments
+arguments.init()  # initialize ConfigManager and LoggerManager
+
+from lib.logger_manager import LoggerManager
+from lib.nodes.robot.emulator import DeviceEmulator
+from lib.nodes.robot.aio_client import AsyncRobot
+
+logger = LoggerManager.get_logger()
+
+
+# Exercises AsyncRobot against pty stand-ins for the microcontroller. Usage:
+#   python3 aio_client_check.py <base_dir>
+
+async def check_client(address):
+    robot = AsyncRobot(address)
+    await robot.connect()
+    await robot.check_ready(timeout=2.0)
+
+    packet_num = await robot.write("<>", 1)
+    assert await robot.ack(packet_num), "packet %s was not acknowledged" % packet_num
+
+    start_time = time.time()
+    num_packets = 0
+    async for packet in robot.telemetry("batt"):
+        num_packets += 1
+        assert len(packet.data) == 4, packet
+        if num_packets >= 5:
+            break
+    logger.info("%s: received %s batt packets in %0.3fs" % (address, num_packets, time.time() - start_time))
+
+    assert await robot.write_sd(b"#" * 0x2800, "BR-TEST")
+
+    # cancelling an upload part way through must leave the link usable
+    transfer = asyncio.ensure_future(robot.write_sd(b"#" * 0x10000, "BR-CNCL"))
+    await asyncio.sleep(0.02)
+    transfer.cancel()
+    try:
+        await transfer
+    except asyncio.CancelledError:
+        pass
+    assert await robot.request("<>", 0), "link not usable after a cancelled transfer"
+
+    await robot.close()
+
+
+async def check_clients(addresses):
+    # several clients in one event loop
+    await asyncio.gather(*[check_client(address) for address in addresses])
+
+
+def main():
+    emulators = [DeviceEmulator(telemetry_rate_hz=50.0).start() for _ in range(3)]
+    try:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(check_clients([emulator.address for emulator in emulators]))
+        for emulator in emulators:
+            assert emulator.received["delete"] == 1, emulator.received
+            logger.info("%s received: %s" % (emulator.address, dict(emulator.received)))
+        logger.info("AsyncRobot checks passed")
+    finally:
+        for emulator in emulators:
+            emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
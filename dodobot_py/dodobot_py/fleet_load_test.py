@@ -0,0 +1,72 @@
+import time
+import multiprocessing
+
+from lib import arguments
+arguments.init()  # initialize ConfigManager and LoggerManager
+
+from lib.io_loop import IOLoop
+from lib.logger_manager import LoggerManager
+from lib.nodes.robot.fleet import RobotFleet
+from lib.nodes.robot.emulator import DeviceEmulator
+
+logger = LoggerManager.get_logger()
+
+# Measures how many emulated serial links one IO loop (one core) can sustain. Usage:
+#   python3 fleet_load_test.py <base_dir>
+# The emulators run in a child process so the CPU time measured here is only the fleet's.
+
+FLEET_SIZES = [1, 2, 4, 8, 16, 32]
+TELEMETRY_RATE_HZ = 100.0  # each tick sends a batt and a state packet
+DURATION_S = 5.0
+
+
+class LoadTestSession:
+    def __init__(self):
+        self.io_loop = IOLoop()
+
+
+def run_emulators(connection, num_robots, telemetry_rate_hz):
+    emulators = [DeviceEmulator(telemetry_rate_hz=telemetry_rate_hz).start() for _ in range(num_robots)]
+    connection.send([emulator.address for emulator in emulators])
+    connection.recv()  # wait for the stop signal
+    for emulator in emulators:
+        emulator.stop()
+
+
+def measure(num_robots):
+    connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=run_emulators, args=(child_connection, num_robots, TELEMETRY_RATE_HZ))
+    process.start()
+    addresses = connection.recv()
+
+    session = LoadTestSession()
+    fleet = RobotFleet(session, [dict(name="robot%s" % index, address=address) for index, address in enumerate(addresses)])
+    fleet.start()
+    session.io_loop.call_later(DURATION_S, session.io_loop.stop)
+
+    start_time = time.monotonic()
+    start_cpu_time = time.process_time()
+    session.io_loop.run()
+    duration = time.monotonic() - start_time
+    cpu_time = time.process_time() - start_cpu_time
+
+    stats = fleet.get_stats().values()
+    fleet.stop()
+    connection.send(None)
+    process.join()
+
+    packets_read = sum(link_stats["packets_read"] for link_stats in stats)
+    errors = sum(link_stats["packet_errors"] + link_stats["dropped_packets"] for link_stats in stats)
+    return packets_read / duration, cpu_time / duration, errors
+
+
+def main():
+    logger.info("robots\tpackets/s\tcpu %\terrors\tlinks per core")
+    for num_robots in FLEET_SIZES:
+        packet_rate, cpu_usage, errors = measure(num_robots)
+        links_per_core = num_robots / cpu_usage if cpu_usage > 0.0 else float("inf")
+        logger.info("%s\t%0.1f\t%0.1f\t%s\t%0.0f" % (num_robots, packet_rate, cpu_usage * 100.0, errors, links_per_core))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import sys
+
+from lib import arguments
+arguments.init()  # initialize ConfigManager and LoggerManager
+
+from lib.config import ConfigManager
+from lib.logger_manager import LoggerManager
+from lib import import_profile
+
+logger = LoggerManager.get_logger()
+general_config = ConfigManager.get_general_config()
+
+# Reports how long importing the session takes in a fresh interpreter, per package and module,
+# and exits with 1 if it's over general.yaml's import_budget_ms. Usage:
+#   python3 import_time_check.py <base_dir>
+# Run it twice to compare a cold and a warm file cache.
+
+
+def main():
+    entries = import_profile.measure_session_imports(general_config.base_dir)
+    lines = import_profile.format_report(entries, general_config.import_budget_ms)
+    logger.info("\n".join(lines))
+
+    total_ms = import_profile.total_import_us(entries) / 1000.0
+    if total_ms > general_config.import_budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,20 @@ class BatteryConfig(Config):
         self.critical_voltage = 5.5
         self.critical_voltage_timeout_s = 3.0
         self.battery_log_report_time = 30.0
+        self.voltage_median_window = 5
+        self.threshold_time_constant_s = 3.0
+        self.charge_rise_V = 0.5
+
+        self.capacity_mAh = 3000.0
+        self.discharge_curve = [[5.5, 0.0], [8.5, 1.0]]  # [load voltage, state of charge], increasing
+        self.shutdown_remaining_min = 0.0
+        self.voltage_time_constant_s = 30.0
+        self.current_time_constant_s = 60.0
+        self.estimator_window_mAh = 1000.0
+        self.estimator_min_samples = 100.0
+        self.estimator_min_used_mAh = 100.0
+        self.estimator_min_current_mA = 10.0
+        self.estimator_max_gap_s = 5.0
 
         super(BatteryConfig, self).__init__("battery.yaml", base_dir)
 
@@ -20,4 +34,17 @@ class BatteryConfig(Config):
             "critical_voltage": self.critical_voltage,
             "critical_voltage_timeout_s": self.critical_voltage_timeout_s,
             "battery_log_report_time": self.battery_log_report_time,
+            "voltage_median_window": self.voltage_median_window,
+            "threshold_time_constant_s": self.threshold_time_constant_s,
+            "charge_rise_V": self.charge_rise_V,
+            "capacity_mAh": self.capacity_mAh,
+            "discharge_curve": self.discharge_curve,
+            "shutdown_remaining_min": self.shutdown_remaining_min,
+            "voltage_time_constant_s": self.voltage_time_constant_s,
+            "current_time_constant_s": self.current_time_constant_s,
+            "estimator_window_mAh": self.estimator_window_mAh,
+            "estimator_min_samples": self.estimator_min_samples,
+            "estimator_min_used_mAh": self.estimator_min_used_mAh,
+            "estimator_min_current_mA": self.estimator_min_current_mA,
+            "estimator_max_gap_s": self.estimator_max_gap_s,
         }
@@ -8,6 +8,7 @@ class DevicePortConfig(Config):
         self.timeout = 5.0
         self.write_timeout = 5.0
         self.update_rate_hz = 30
+        self.fleet = []
         super(DevicePortConfig, self).__init__("device_port.yaml", base_dir)
 
     def to_dict(self):
@@ -17,4 +18,5 @@ class DevicePortConfig(Config):
             "timeout": self.timeout,
             "write_timeout": self.write_timeout,
             "update_rate_hz": self.update_rate_hz,
+            "fleet": self.fleet,
         }
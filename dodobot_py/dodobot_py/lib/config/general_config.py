@@ -4,5 +4,14 @@ from .config import Config
 class GeneralConfig(Config):
     def __init__(self, base_dir):
         self.update_rate_hz = 15
+        self.use_io_loop = False
+        self.node_rates_hz = {}
+        self.jetson_stats_enabled = True
+        self.import_budget_ms = 2000.0
+        self.parallel_startup = True
+        self.process_offload = []
+        self.profile_nodes = False
+        self.profile_report_interval = 60.0
+        self.profile_window_size = 512
 
         super(GeneralConfig, self).__init__("general.yaml", base_dir)
@@ -5,6 +5,10 @@ class JoystickConfig(Config):
     def __init__(self, base_dir):
         self.path = "/dev/input/js0"
         self.enabled = True
+        self.axis_curves = {}  # axis name -> deadzone, expo, gain overrides
+        self.record_path = ""
+        self.replay_path = ""
+        self.replay_speed = 1.0
 
         super(JoystickConfig, self).__init__("joystick.yaml", base_dir)
 
@@ -12,4 +16,8 @@ class JoystickConfig(Config):
         return {
             "path": self.path,
             "enabled": self.enabled,
+            "axis_curves": self.axis_curves,
+            "record_path": self.record_path,
+            "replay_path": self.replay_path,
+            "replay_speed": self.replay_speed,
         }
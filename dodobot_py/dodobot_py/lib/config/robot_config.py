@@ -12,6 +12,18 @@ class RobotConfig(Config):
         self.drive_command_timeout = 30.0
         self.drive_command_repeat_timeout = 0.75
         self.drive_command_update_rate = 30.0
+        self.direct_teleop = True
+        self.direct_teleop_max_rate_hz = 60.0
+        self.drive_control_thread = False
+        self.drive_control_rate_hz = 50.0
+        self.drive_max_accel = 0.0
+        self.drive_max_jerk = 0.0
+        self.drive_units_per_mps = 20600.0
+
+        self.tipping_limit = False
+        self.stability_table_path = "stability_table.csv"
+        self.tipping_payload_kg = 0.6
+        self.linear_mm_per_step = 0.00177
 
         self.joystick_deadzone = 0.1
         self.max_joy_val = 1.0
@@ -30,6 +42,7 @@ class RobotConfig(Config):
 
         self.gripper_open = 0
         self.gripper_closed = 180
+        self.gripper_table_path = "gripper_table.csv"
 
         self.breakout_levels = "breakout"
 
@@ -40,13 +53,22 @@ class RobotConfig(Config):
 
         self.wifi_name = "wlan0"
         self.hotspot_name = "dodobot-host"
+        self.network_list_length = 15
+        self.network_rescan_timeout = 10.0
+
+        self.warm_relaunch = True
+        self.warm_state_tolerance_ms = 2000
 
         super(RobotConfig, self).__init__("robot.yaml", base_dir)
 
+        self.warm_state_path = os.path.join(self.base_dir, "warm_state.json")
+
     def load(self):
         super(RobotConfig, self).load()
         self.startup_image_path = os.path.join(self.config_dir, self.startup_image_path)
         self.breakout_levels = os.path.join(self.config_dir, self.breakout_levels)
+        self.stability_table_path = os.path.join(self.config_dir, self.stability_table_path)
+        self.gripper_table_path = os.path.join(self.config_dir, self.gripper_table_path)
 
     def to_dict(self):
         return {
@@ -56,6 +78,17 @@ class RobotConfig(Config):
             "packet_read_timeout": self.packet_read_timeout,
             "drive_command_timeout": self.drive_command_timeout,
             "drive_command_update_delay": self.drive_command_update_delay,
+            "direct_teleop": self.direct_teleop,
+            "direct_teleop_max_rate_hz": self.direct_teleop_max_rate_hz,
+            "drive_control_thread": self.drive_control_thread,
+            "drive_control_rate_hz": self.drive_control_rate_hz,
+            "drive_max_accel": self.drive_max_accel,
+            "drive_max_jerk": self.drive_max_jerk,
+            "drive_units_per_mps": self.drive_units_per_mps,
+            "tipping_limit": self.tipping_limit,
+            "stability_table_path": self.stability_table_path,
+            "tipping_payload_kg": self.tipping_payload_kg,
+            "linear_mm_per_step": self.linear_mm_per_step,
             "joystick_deadzone": self.joystick_deadzone,
             "max_joy_val": self.max_joy_val,
             "shutdown_time_limit": self.shutdown_time_limit,
@@ -65,9 +98,14 @@ class RobotConfig(Config):
             "drive_min_speed": self.drive_min_speed,
             "gripper_open": self.gripper_open,
             "gripper_closed": self.gripper_closed,
+            "gripper_table_path": self.gripper_table_path,
             "startup_image_path": self.startup_image_path,
             "startup_image_size": self.startup_image_size,
             "startup_image_quality": self.startup_image_quality,
             "wifi_name": self.wifi_name,
+            "network_list_length": self.network_list_length,
+            "network_rescan_timeout": self.network_rescan_timeout,
+            "warm_relaunch": self.warm_relaunch,
+            "warm_state_path": self.warm_state_path,
 
         }
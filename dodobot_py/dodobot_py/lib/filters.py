@@ -0,0 +1,208 @@
+import math
+import bisect
+import collections
+
+# The session only uses process(). numpy and scipy are imported by the filter_array methods the
+# offline scripts use. scipy is optional: without it filter_array falls back to the per-sample loop
+
+
+def get_lfilter():
+    try:
+        from scipy.signal import lfilter
+    except ImportError:
+        return None
+    return lfilter
+
+
+class Biquad:
+    """
+    Second order IIR section in transposed direct form II. process() takes one sample at a time.
+    filter_array() runs a whole array through the same state (with scipy.signal.lfilter if scipy
+    is installed), so a stream can be filtered in chunks and match the sample by sample result.
+    The first sample starts the filter at steady state instead of ramping up from zero.
+    """
+
+    def __init__(self, b, a):
+        a0 = float(a[0])
+        self.b = [b[0] / a0, b[1] / a0, b[2] / a0]
+        self.a = [1.0, a[1] / a0, a[2] / a0]
+        self.z1 = 0.0
+        self.z2 = 0.0
+        self.initialized = False
+
+    @classmethod
+    def butter_lowpass(cls, cutoff_hz, sample_rate_hz):
+        k = math.tan(math.pi * cutoff_hz / sample_rate_hz)
+        norm = 1.0 / (1.0 + math.sqrt(2.0) * k + k * k)
+        b0 = k * k * norm
+        return cls(
+            [b0, 2.0 * b0, b0],
+            [1.0, 2.0 * (k * k - 1.0) * norm, (1.0 - math.sqrt(2.0) * k + k * k) * norm]
+        )
+
+    def reset(self, value=0.0):
+        b0, b1, b2 = self.b
+        _, a1, a2 = self.a
+        output = value * (b0 + b1 + b2) / (1.0 + a1 + a2)
+        self.z2 = b2 * value - a2 * output
+        self.z1 = b1 * value - a1 * output + self.z2
+        self.initialized = True
+
+    def process(self, value):
+        if not self.initialized:
+            self.reset(value)
+        b0, b1, b2 = self.b
+        _, a1, a2 = self.a
+        output = b0 * value + self.z1
+        self.z1 = b1 * value - a1 * output + self.z2
+        self.z2 = b2 * value - a2 * output
+        return output
+
+    def filter_array(self, values):
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return values
+        if not self.initialized:
+            self.reset(values[0])
+        lfilter = get_lfilter()
+        if lfilter is None:
+            return np.array([self.process(value) for value in values])
+        output, state = lfilter(self.b, self.a, values, zi=[self.z1, self.z2])
+        self.z1, self.z2 = float(state[0]), float(state[1])
+        return output
+
+
+class BiquadCascade:
+    """
+    Biquads in series, each feeding the next. butter_lowpass builds a Butterworth low pass of any order
+    from second order sections, plus a first order section (b2 = a2 = 0) when the order is odd.
+    """
+
+    def __init__(self, sections):
+        self.sections = list(sections)
+
+    @classmethod
+    def butter_lowpass(cls, order, cutoff_hz, sample_rate_hz):
+        k = math.tan(math.pi * cutoff_hz / sample_rate_hz)
+        sections = []
+        for index in range(order // 2):
+            # analog section s^2 + damping * s + 1 from one pair of Butterworth poles
+            damping = 2.0 * math.sin(math.pi * (2 * index + 1) / (2 * order))
+            norm = 1.0 / (1.0 + damping * k + k * k)
+            b0 = k * k * norm
+            sections.append(Biquad(
+                [b0, 2.0 * b0, b0],
+                [1.0, 2.0 * (k * k - 1.0) * norm, (1.0 - damping * k + k * k) * norm]
+            ))
+        if order % 2 == 1:
+            norm = 1.0 / (1.0 + k)
+            sections.append(Biquad([k * norm, k * norm, 0.0], [1.0, (k - 1.0) * norm, 0.0]))
+        return cls(sections)
+
+    def reset(self, value=0.0):
+        for section in self.sections:
+            section.reset(value)
+
+    def process(self, value):
+        for section in self.sections:
+            value = section.process(value)
+        return value
+
+    def filter_array(self, values):
+        for section in self.sections:
+            values = section.filter_array(values)
+        return values
+
+
+class EMA:
+    """
+    Exponential moving average: value += alpha * (sample - value). alpha can be passed per sample
+    for streams that don't arrive at a fixed rate, see alpha_from_time_constant.
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.value = None
+
+    @staticmethod
+    def alpha_from_time_constant(dt, time_constant):
+        if time_constant <= 0.0:
+            return 1.0
+        return 1.0 - math.exp(-dt / time_constant)
+
+    def reset(self, value=None):
+        self.value = value
+
+    def process(self, sample, alpha=None):
+        if self.value is None:
+            self.value = float(sample)
+        else:
+            if alpha is None:
+                alpha = self.alpha
+            self.value += alpha * (sample - self.value)
+        return self.value
+
+    def filter_array(self, samples):
+        import numpy as np
+
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) == 0:
+            return samples
+        if self.value is None:
+            self.value = float(samples[0])
+        lfilter = get_lfilter()
+        if lfilter is None:
+            return np.array([self.process(sample) for sample in samples])
+        # y[n] = alpha * x[n] + z, z = (1 - alpha) * y[n]
+        output, state = lfilter([self.alpha], [1.0, self.alpha - 1.0], samples,
+                                zi=[(1.0 - self.alpha) * self.value])
+        self.value = float(output[-1])
+        return output
+
+
+class RollingMedian:
+    """Median of the last window_size samples. Rejects short spikes that would drag an average"""
+
+    def __init__(self, window_size=5):
+        self.window_size = window_size
+        self.samples = collections.deque()
+        self.sorted_samples = []
+
+    def reset(self):
+        self.samples.clear()
+        self.sorted_samples = []
+
+    def process(self, sample):
+        if len(self.samples) == self.window_size:
+            oldest = self.samples.popleft()
+            del self.sorted_samples[bisect.bisect_left(self.sorted_samples, oldest)]
+        self.samples.append(sample)
+        bisect.insort(self.sorted_samples, sample)
+
+        count = len(self.sorted_samples)
+        middle = count // 2
+        if count % 2 == 1:
+            return self.sorted_samples[middle]
+        return (self.sorted_samples[middle - 1] + self.sorted_samples[middle]) / 2.0
+
+    def filter_array(self, samples):
+        import numpy as np
+
+        samples = np.asarray(samples, dtype=np.float64)
+        history = np.concatenate((np.array(self.samples, dtype=np.float64), samples))
+        num_history = len(self.samples)
+
+        output = np.empty(len(samples))
+        # outputs whose window isn't full yet go one at a time, the rest are a sliding window view
+        num_partial = max(0, min(len(samples), self.window_size - 1 - num_history))
+        for index in range(num_partial):
+            output[index] = self.process(samples[index])
+        if num_partial < len(samples):
+            windows = np.lib.stride_tricks.sliding_window_view(history, self.window_size)
+            output[num_partial:] = np.median(windows[num_history + num_partial - self.window_size + 1:], axis=1)
+            self.reset()
+            for sample in history[-self.window_size:]:
+                self.process(sample)
+        return output
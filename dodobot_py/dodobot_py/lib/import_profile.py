@@ -0,0 +1,72 @@
+import os
+import re
+import sys
+import subprocess
+import collections
+
+ImportTime = collections.namedtuple("ImportTime", "module self_us cumulative_us depth")
+
+# import time:       123 |       4567 |   lib.session
+importtime_regex = re.compile(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def parse_importtime(output):
+    """Parse the stderr of python -X importtime into ImportTime entries (times in microseconds)"""
+    entries = []
+    for line in output.splitlines():
+        match = importtime_regex.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        entries.append(ImportTime(module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def measure_imports(statement, cwd=None):
+    """Run statement in a fresh interpreter with -X importtime and return the parsed entries"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd
+    )
+    output = process.stderr.decode()
+    if process.returncode != 0:
+        # keep only the traceback, not the import timings
+        errors = [line for line in output.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("Import failed:\n%s" % "\n".join(errors))
+    return parse_importtime(output)
+
+
+def measure_session_imports(base_dir):
+    """Times importing lib.session the way main.py does, in a fresh interpreter"""
+    statement = (
+        "import sys; sys.argv = ['main.py', %r, '--log_only']; "
+        "from lib import arguments; arguments.init(); import lib.session" % base_dir
+    )
+    return measure_imports(statement, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def total_import_us(entries):
+    # top level imports have depth 0. Their cumulative times add up to the whole import
+    return sum(entry.cumulative_us for entry in entries if entry.depth == 0)
+
+
+def group_by_package(entries):
+    """Cumulative time of each top level package. Self times are summed so nested imports aren't counted twice"""
+    packages = collections.Counter()
+    for entry in entries:
+        packages[entry.module.split(".")[0]] += entry.self_us
+    return packages
+
+
+def format_report(entries, budget_ms, num_modules=15):
+    total_ms = total_import_us(entries) / 1000.0
+    lines = ["Import time: %0.1fms (budget %0.1fms)%s" % (total_ms, budget_ms, " OVER BUDGET" if total_ms > budget_ms else "")]
+
+    lines.append("Slowest packages (self time, ms):")
+    for package, self_us in group_by_package(entries).most_common(num_modules):
+        lines.append("%10.1f  %s" % (self_us / 1000.0, package))
+
+    lines.append("Slowest modules (cumulative, ms):")
+    for entry in sorted(entries, key=lambda entry: entry.cumulative_us, reverse=True)[:num_modules]:
+        lines.append("%10.1f  %10.1f  %s" % (entry.cumulative_us / 1000.0, entry.self_us / 1000.0, entry.module))
+    return lines
@@ -0,0 +1,67 @@
+import json
+import hashlib
+
+# numpy is imported where the tables are computed, not when the session is imported
+
+# every value a joystick axis can report (js_event.value is an int16)
+NUM_AXIS_VALUES = 65536
+RAW_AXIS_OFFSET = 32768
+
+
+def axis_curve(deadzone=0.1, expo=0.0, gain=1.0, max_joy_val=1.0):
+    """
+    Shaped value of every raw axis value. The deadzone is cut out and the rest rescaled so output
+    starts at 0 at its edge, then expo bends the curve: 0.0 is linear, 1.0 is cubic.
+    """
+    import numpy as np
+
+    value = np.arange(-RAW_AXIS_OFFSET, NUM_AXIS_VALUES - RAW_AXIS_OFFSET) / 32767.0
+    magnitude = np.maximum(np.abs(value) - deadzone, 0.0) / (max_joy_val - deadzone)
+    magnitude = (1.0 - expo) * magnitude + expo * magnitude ** 3
+    return np.copysign(magnitude, value) * gain
+
+
+def threshold_curve(curve, threshold):
+    # zero below the threshold and rescaled to still reach full scale above it
+    import numpy as np
+
+    magnitude = np.maximum(np.abs(curve) - threshold, 0.0) / (1.0 - threshold)
+    return np.copysign(magnitude, curve)
+
+
+class InputShaper:
+    """
+    Lookup tables from raw axis values to commands, one per command:
+
+        shaper.build({"x": axis_curve(0.1, 0.3) * 6800.0})
+        rotate = shaper.get("x", raw_value)
+
+    The tables are computed with numpy and stored as lists so a lookup is a single index
+    that returns a plain python int or float, ready to be written to the serial device.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.config_hash = None
+
+    @staticmethod
+    def get_config_hash(config):
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def needs_build(self, config):
+        return self.get_config_hash(config) != self.config_hash
+
+    def build(self, tables, config=None):
+        built = {}
+        for name, table in tables.items():
+            assert len(table) == NUM_AXIS_VALUES, "%s table has %s entries" % (name, len(table))
+            built[name] = table.tolist()
+        # swap in the new tables in one assignment. The joystick thread may be reading them
+        self.tables = built
+        self.config_hash = None if config is None else self.get_config_hash(config)
+
+    def get(self, name, raw_value):
+        return self.tables[name][raw_value + RAW_AXIS_OFFSET]
+
+    def __contains__(self, name):
+        return name in self.tables
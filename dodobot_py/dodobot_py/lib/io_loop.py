@@ -0,0 +1,139 @@
+import os
+import time
+import heapq
+import selectors
+import threading
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+
+class Timer:
+    def __init__(self, deadline, period, callback):
+        self.deadline = deadline
+        self.period = period
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class IOLoop:
+    """
+    Single threaded event loop. Multiplexes file descriptors (serial port, joystick) and timers
+    so nodes can register callbacks instead of each owning a polling thread.
+    Callbacks run in registration/deadline order on the loop's thread. Exceptions raised by a
+    callback propagate out of run() so the main loop can handle them like any other node error.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = []
+        self.timer_counter = 0
+
+        self.pending_callbacks = []
+        self.pending_lock = threading.Lock()
+
+        self.wakeup_read_fd, self.wakeup_write_fd = os.pipe()
+        os.set_blocking(self.wakeup_read_fd, False)
+        os.set_blocking(self.wakeup_write_fd, False)
+        self.selector.register(self.wakeup_read_fd, selectors.EVENT_READ, self._drain_wakeup)
+
+        self.should_stop = False
+        self.num_iterations = 0
+
+    def add_reader(self, fileobj, callback):
+        """Call callback() whenever fileobj (an fd or an object with fileno()) is readable"""
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj):
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def call_later(self, delay, callback):
+        return self._add_timer(Timer(time.monotonic() + delay, None, callback))
+
+    def call_every(self, period, callback):
+        """Call callback() every period seconds. Deadlines don't drift with callback duration"""
+        return self._add_timer(Timer(time.monotonic() + period, period, callback))
+
+    def call_soon_threadsafe(self, callback):
+        with self.pending_lock:
+            self.pending_callbacks.append(callback)
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            os.write(self.wakeup_write_fd, b"\x00")
+        except BlockingIOError:
+            pass  # loop already has a pending wakeup
+
+    def _add_timer(self, timer):
+        heapq.heappush(self.timers, (timer.deadline, self.timer_counter, timer))
+        self.timer_counter += 1
+        return timer
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self.wakeup_read_fd, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def time_until_next_timer(self):
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+        if not self.timers:
+            return None
+        return max(0.0, self.timers[0][0] - time.monotonic())
+
+    def run_once(self, timeout=None):
+        timer_timeout = self.time_until_next_timer()
+        if timer_timeout is not None and (timeout is None or timer_timeout < timeout):
+            timeout = timer_timeout
+
+        for key, mask in self.selector.select(timeout):
+            key.data()
+
+        with self.pending_lock:
+            pending_callbacks = self.pending_callbacks
+            self.pending_callbacks = []
+        for callback in pending_callbacks:
+            callback()
+
+        self._run_timers()
+        self.num_iterations += 1
+
+    def _run_timers(self):
+        current_time = time.monotonic()
+        while self.timers and self.timers[0][0] <= current_time:
+            deadline, _, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            if timer.period is not None:
+                timer.deadline = deadline + timer.period
+                if timer.deadline <= current_time:
+                    # fell more than a period behind. skip the missed calls instead of bursting
+                    timer.deadline = current_time + timer.period
+                self._add_timer(timer)
+            timer.callback()
+
+    def run(self):
+        logger.info("Starting IO loop")
+        self.should_stop = False
+        while not self.should_stop:
+            self.run_once()
+        logger.info("IO loop stopped after %s iterations" % self.num_iterations)
+
+    def stop(self):
+        self.should_stop = True
+        self.wakeup()
+
+    def close(self):
+        self.selector.close()
+        os.close(self.wakeup_read_fd)
+        os.close(self.wakeup_write_fd)
@@ -1,5 +1,4 @@
 import re
-import time
 import logging
 import subprocess
 from logging import handlers
@@ -19,23 +18,23 @@ class DataLogger(Node):
 
         self.cpu_temp_regex = r"temp=([\d.]*)'C"
 
-        self.prev_log_time = time.time()
-        self.log_timeout = 1.0 / data_log_config.log_freq_hz
         self.logger.info(self.start_flag)
 
         super(DataLogger, self).__init__(session)
+        self.update_rate_hz = data_log_config.log_freq_hz
 
     def update(self):
-        if time.time() - self.prev_log_time < self.log_timeout:
-            return
-        self.prev_log_time = time.time()
-
         self.log(
             "power",
             self.session.robot.power_state["recv_time"],
             self.session.robot.power_state["current_mA"],
             self.session.robot.power_state["load_voltage_V"],
         )
+        self.log(
+            "battery",
+            self.session.robot.power_state["soc"],
+            self.session.robot.power_state["remaining_min"],
+        )
         # cpu_temp = self.get_cpu_temp()
         # self.log("cpu_temp", cpu_temp)
 
@@ -1,13 +1,14 @@
 import time
 import pprint
-import threading
-from jtop import jtop
 
 from lib.config import ConfigManager
 from lib.logger_manager import LoggerManager
 from .node import Node
+from .robot.task import Task
+from lib.supervisor import RestartPolicy
 
 logger = LoggerManager.get_logger()
+general_config = ConfigManager.get_general_config()
 
 
 class JetsonStats(Node):
@@ -16,14 +17,22 @@ class JetsonStats(Node):
 
         self.log_delay = 60.0
         self.log_timer = time.time()
+        self.power_check_delay = 1.0
+        self.high_usage_threshold = 10000.0  # mW
+
+        # monitoring isn't needed to drive. If jtop keeps failing, stop monitoring instead of relaunching
+        self.task = self.session.supervisor.supervise(
+            Task(self.update_task, "jetson_stats", daemon=True),
+            RestartPolicy(initial_backoff=1.0, max_backoff=60.0, max_restarts=5, escalate=False)
+        )
+
+        self.jetson = None
+        self.io_loop = None
+        self.io_loop_timers = []
 
-        self.should_stop = False
-        self.should_stop_fn = (lambda: self.should_stop,)
-        self.thread = threading.Thread(target=self.update_task, args=self.should_stop_fn)
-        self.thread.daemon = True
-        self.thread_exception = None
-    
     def update_task(self, should_stop):
+        from jtop import jtop  # jtop is slow to import and only exists on the Jetson
+
         with jtop() as jetson:
             self.log_one_time_stats(jetson)
 
@@ -31,7 +40,7 @@ class JetsonStats(Node):
                 if should_stop():
                     break
                 
-                self.check_power_usage()
+                self.check_power_usage(jetson)
                 current_time = time.time()
                 if current_time - self.log_timer < self.log_delay:
                     continue
@@ -70,17 +79,34 @@ class JetsonStats(Node):
         logger.info("*** %s ***" % name)
         logger.info(pprint.pformat(stat))
 
-    def task_running(self):
-        return self.thread_exception is None
-
     def start(self):
-        self.thread.start()
-    
-    def update(self):
-        if not self.task_running():
-            logger.error("Error detected in read task. Raising exception")
-            raise self.thread_exception
+        if not general_config.jetson_stats_enabled:
+            logger.info("Jetson stats are disabled")
+            return
+        if self.session.io_loop is None:
+            self.task.start()
+        else:
+            from jtop import jtop
+
+            # jtop polls the stats service on its own thread. Only logging happens on the IO loop
+            self.io_loop = self.session.io_loop
+            self.jetson = jtop()
+            self.jetson.start()
+            self.log_one_time_stats(self.jetson)
+            self.io_loop_timers.append(self.io_loop.call_every(self.power_check_delay, self.io_loop_check_power))
+            self.io_loop_timers.append(self.io_loop.call_every(self.log_delay, self.io_loop_log_stats))
+
+    def io_loop_check_power(self):
+        # jetson.ok() blocks until jtop's next sample, so read the latest values directly
+        self.check_power_usage(self.jetson)
+
+    def io_loop_log_stats(self):
+        self.log_continuous_stats(self.jetson)
 
     def stop(self):
-        self.should_stop = True
+        self.task.stop()
         logger.info("Set jetson stats thread stop flag")
+        for timer in self.io_loop_timers:
+            timer.cancel()
+        if self.jetson is not None:
+            self.jetson.close()
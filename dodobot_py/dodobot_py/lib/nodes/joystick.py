@@ -4,7 +4,6 @@ import os
 import time
 import array
 import queue
-import struct
 import select
 import threading
 from fcntl import ioctl
@@ -14,6 +13,10 @@ from lib.logger_manager import LoggerManager
 from lib.config import ConfigManager
 
 from .node import Node
+from .joystick_events import JoystickEvents
+from .joystick_recording import JoystickRecorder, JoystickReplay, js_event_struct
+from .robot.task import Task
+from lib.supervisor import RestartPolicy
 
 logger = LoggerManager.get_logger()
 
@@ -95,8 +98,12 @@ class Joystick(Node):
     def __init__(self, session):
         super(Joystick, self).__init__(session)
 
-        self.jsdev = None
+        self.jsdev = None  # file descriptor of the opened device
+        self.open_lock = threading.Lock()  # start() and the reader thread may both try to open the device
         self.address = joystick_config.path
+        self.max_events_per_read = 64
+        self.select_timeout = 0.1  # how long the reader waits for events before checking its stop flag
+        self.partial_event = b""
         self.prev_open_attempt_time = time.time()
 
         self.axis_states = {}
@@ -108,14 +115,29 @@ class Joystick(Node):
         self.num_axes = 0
         self.num_buttons = 0
 
-        self.axis_events = []
-        self.button_events = []
+        self.events = JoystickEvents()
+
+        self.recorder = None
+        self.replay = None  # set while joystick.yaml's replay_path stands in for the device
+
+        # axis values are kept as the raw int16 from the driver. Dodobot maps them through its input shaping tables
+        # called from the reader with each batch's axis events and the kernel time (ms) of its last event
+        self.axis_listeners = []
+        self.axis_batch = []
+        self.batch_event_time = 0
+        # smallest difference seen between time.monotonic() and the kernel's event time. The event clock
+        # has its own epoch, so event ages are measured relative to the fastest read
+        self.event_time_offset_ms = None
 
-        self.should_stop = False
-        self.should_stop_fn = (lambda: self.should_stop,)
-        self.thread = threading.Thread(target=self.update_task, args=self.should_stop_fn)
-        self.thread.daemon = True
-        self.thread_exception = None
+        # a crashed reader closes the device and starts over instead of relaunching the whole client
+        self.task = self.session.supervisor.supervise(
+            Task(self.update_task, "joystick", daemon=True),
+            RestartPolicy(initial_backoff=0.05, max_backoff=5.0),
+            on_restart=self.close_joystick
+        )
+
+        self.io_loop = None
+        self.io_loop_timer = None
 
         self.prev_load_time = time.time()
         self.config_load_interval = 1.0
@@ -125,15 +147,25 @@ class Joystick(Node):
         self.evbuf_queue = queue.Queue()
 
     def start(self):
-        self.thread.start()
+        if self.session.io_loop is None:
+            self.task.start()
+        else:
+            self.io_loop = self.session.io_loop
+            self.io_loop_timer = self.io_loop.call_every(self.config_load_interval, self.io_loop_update)
         self.prev_open_attempt_time = time.time()
 
         if joystick_config.enabled:
             self.open_joystick()
 
     def stop(self):
-        self.should_stop = True
+        self.task.stop()
         logger.info("Set joystick thread stop flag")
+        if self.io_loop is not None:
+            self.io_loop_timer.cancel()
+            if self.is_open():
+                self.io_loop.remove_reader(self.jsdev)
+        if self.replay is not None:
+            self.replay.stop()
 
         # self.close_joystick()
 
@@ -142,29 +174,83 @@ class Joystick(Node):
             joystick_config.load()
             self.prev_load_time = time.time()
 
+    def update_enabled_state(self):
+        if joystick_config.enabled != self.prev_enabled_state and not joystick_config.enabled:
+            self.close_joystick()
+        self.prev_enabled_state = joystick_config.enabled
+
     def is_open(self):
         return self.jsdev is not None
 
     def open_joystick(self):
+        with self.open_lock:
+            if not self.is_open():
+                self._open_joystick()
+
+    def _open_joystick(self):
         try:
-            self.jsdev = open(self.address, 'rb')
+            self.partial_event = b""
+            self.axis_map = []
+            self.button_map = []
+
+            if joystick_config.replay_path:
+                if not self.open_replay():
+                    return
+            else:
+                self.jsdev = os.open(self.address, os.O_RDONLY | os.O_NONBLOCK)
 
-            logger.info("Joystick: %s" % self.get_device_name())
-            self.get_axes_buttons()
-            self.get_axis_map()
-            self.get_button_map()
+                logger.info("Joystick: %s" % self.get_device_name())
+                self.get_axes_buttons()
+                self.get_axis_map()
+                self.get_button_map()
 
             logger.info("%d axes found: %s" % (self.num_axes, ", ".join(self.axis_map)))
             logger.info("%d buttons found: %s" % (self.num_buttons, ", ".join(self.button_map)))
+
+            if joystick_config.record_path:
+                path = time.strftime(os.path.expanduser(joystick_config.record_path))
+                self.recorder = JoystickRecorder(path, self.axis_map, self.button_map)
+
+            if self.io_loop is not None:
+                self.io_loop.add_reader(self.jsdev, self.read_joystick_event)
         except FileNotFoundError:
             pass
         except BaseException as e:
             logger.error(str(e), exc_info=True)
 
+    def open_replay(self):
+        if self.replay is not None:
+            return False  # a recording is played once
+        self.replay = JoystickReplay(os.path.expanduser(joystick_config.replay_path), joystick_config.replay_speed)
+        self.jsdev = self.replay.read_fd
+        self.axis_map = self.replay.axis_map
+        self.button_map = self.replay.button_map
+        self.num_axes = len(self.axis_map)
+        self.num_buttons = len(self.button_map)
+        for axis_name in self.axis_map:
+            self.axis_states[axis_name] = 0
+        for btn_name in self.button_map:
+            self.button_states[btn_name] = 0
+        return True
+
+    def is_replay_finished(self):
+        return self.replay is not None and not self.is_open()
+
     def close_joystick(self):
+        if self.jsdev is None:
+            return
         logger.info("Closing joystick")
-        self.jsdev.close()
+        if self.io_loop is not None:
+            self.io_loop.remove_reader(self.jsdev)
+        os.close(self.jsdev)
         self.jsdev = None
+        if self.replay is not None:
+            self.replay.stop()  # its last events are left for the main loop to take
+        else:
+            self.events.clear()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
     def get_device_name(self):
         buf = array.array('B', [0] * 64)
@@ -187,7 +273,7 @@ class Joystick(Node):
         for axis in buf[:self.num_axes]:
             axis_name = axis_names.get(axis, 'unknown(0x%02x)' % axis)
             self.axis_map.append(axis_name)
-            self.axis_states[axis_name] = 0.0
+            self.axis_states[axis_name] = 0
 
     def get_button_map(self):
         buf = array.array('H', [0] * 200)
@@ -199,21 +285,34 @@ class Joystick(Node):
             self.button_states[btn_name] = 0
 
     def get_axis_events(self):
-        while len(self.axis_events) > 0:
-            yield self.axis_events.pop(0)
+        # latest value of each axis that moved since the last call
+        return self.events.take_axes()
 
-        raise StopIteration
+    def has_pending_events(self):
+        return self.events.has_pending()
 
     def get_button_events(self):
-        while len(self.button_events) > 0:
-            yield self.button_events.pop(0)
+        return self.events.take_buttons()
+
+    def add_axis_listener(self, callback):
+        self.axis_listeners.append(callback)
 
-        raise StopIteration
+    def get_event_age_ms(self, event_time_ms):
+        # js_event.time is a wrapping 32 bit millisecond counter
+        delta = (time.monotonic() * 1000.0 - event_time_ms) % 0x100000000
+        if self.event_time_offset_ms is None:
+            return 0.0
+        return max(0.0, delta - self.event_time_offset_ms)
+
+    def update_event_time_offset(self, event_time_ms):
+        delta = (time.monotonic() * 1000.0 - event_time_ms) % 0x100000000
+        if self.event_time_offset_ms is None or delta < self.event_time_offset_ms:
+            self.event_time_offset_ms = delta
 
     def update(self):
-        if not self.task_running():
-            logger.error("Error detected in read task. Raising exception")
-            raise self.thread_exception
+        # nodes are only updated once the session has started, so the replay doesn't play into startup
+        if self.replay is not None and not self.replay.is_started:
+            self.replay.start()
         # if not joystick_config.enabled:
         #     return
 
@@ -221,31 +320,21 @@ class Joystick(Node):
         #     evbuf = self.evbuf_queue.get()
         #     self.parse_joystick_bytes(evbuf)
 
-    def task_running(self):
-        return self.thread_exception is None
-
     def update_task(self, should_stop):
         # update_delay = 1.0 / 30.0
-        try:
-            while True:
-                self.reload_config()
-                if joystick_config.enabled != self.prev_enabled_state and not joystick_config.enabled:
-                    self.close_joystick()
-                self.prev_enabled_state = joystick_config.enabled
-
-                # time.sleep(update_delay)
-                if should_stop():
-                    logger.info("Exiting joystick thread\n\n")
-                    return
+        while True:
+            self.reload_config()
+            self.update_enabled_state()
 
-                if joystick_config.enabled:
-                    self.check_joystick_events()
-                else:
-                    time.sleep(1.0)
+            # time.sleep(update_delay)
+            if should_stop():
+                logger.info("Exiting joystick thread\n\n")
+                return
 
-        except BaseException as e:
-            logger.error("An exception occurred in the joystick thread", exc_info=True)
-            self.thread_exception = e
+            if joystick_config.enabled:
+                self.check_joystick_events()
+            else:
+                time.sleep(1.0)
 
     def check_joystick_events(self):
         if not self.is_open():
@@ -253,38 +342,63 @@ class Joystick(Node):
                 # self.prev_open_attempt_time = time.time()
             self.open_joystick()
             time.sleep(1.0)
-            if self.jsdev:
+            if self.is_open():
                 logger.info("Joystick opened with address {}".format(self.address))
             return
 
+        # wait in select instead of a blocking read so the stop flag is checked at least every select_timeout
+        r, w, e = select.select([self.jsdev], [], [], self.select_timeout)
+        if self.jsdev in r:
+            self.read_joystick_event()
+
+    def io_loop_update(self):
+        joystick_config.load()
+        self.prev_load_time = time.time()
+        self.update_enabled_state()
+
+        if joystick_config.enabled and not self.is_open():
+            self.open_joystick()
+            if self.is_open():
+                logger.info("Joystick opened with address {}".format(self.address))
+
+    def read_joystick_event(self):
+        # read every queued event with one syscall
         try:
-            evbuf = self.jsdev.read(8)
-            # self.evbuf_queue.put(evbuf)
-            self.parse_joystick_bytes(evbuf)
+            evbuf = os.read(self.jsdev, self.max_events_per_read * js_event_struct.size)
+        except BlockingIOError:
+            return
         except OSError:
             self.close_joystick()
+            return
+        if len(evbuf) == 0:
+            self.close_joystick()
+            return
+        if self.recorder is not None:
+            self.recorder.write(evbuf)
+        try:
+            self.parse_joystick_bytes(evbuf)
         except BaseException as e:
             logger.error(str(e), exc_info=True)
             self.close_joystick()
 
-        # r, w, e = select.select([self.jsdev], [], [], 0.0)
-        #
-        # if self.jsdev in r:
-        #     try:
-        #         start_time = time.time()
-        #         while time.time() - start_time < 1.0:
-        #             evbuf = self.jsdev.read(8)
-        #             self.parse_joystick_bytes(evbuf)
-        #     except OSError:
-        #         self.close_joystick()
-        #         return
-        # else:
-        #     return
-
     def parse_joystick_bytes(self, evbuf):
-        # logger.info("evbuf: %s" % evbuf)
-        evtime, value, type, number = struct.unpack('IhBB', evbuf)
-
+        # the device only returns whole events, but keep any remainder in case a read ever splits one
+        evbuf = self.partial_event + evbuf
+        num_bytes = len(evbuf) - len(evbuf) % js_event_struct.size
+        self.partial_event = evbuf[num_bytes:]
+        self.axis_batch = []
+        for event in js_event_struct.iter_unpack(evbuf[:num_bytes]):
+            self.parse_joystick_event(*event)
+
+        if len(self.axis_batch) > 0:
+            self.update_event_time_offset(self.batch_event_time)
+            for callback in self.axis_listeners:
+                try:
+                    callback(self.axis_batch, self.batch_event_time)
+                except BaseException as e:
+                    logger.error("Joystick listener failed: %s" % e, exc_info=True)
+
+    def parse_joystick_event(self, evtime, value, type, number):
         # if type & 0x80:
         #      logger.info("(initial)")
 
@@ -292,7 +406,7 @@ class Joystick(Node):
             button = self.button_map[number]
             if button:
                 self.button_states[button] = value
-                self.button_events.append((button, value))
+                self.events.put_button(button, value)
                 # if value:
                 #     logger.info("%s pressed" % (button))
                 # else:
@@ -301,7 +415,8 @@ class Joystick(Node):
         if type & 0x02:
             axis = self.axis_map[number]
             if axis:
-                fvalue = value / 32767.0
-                self.axis_states[axis] = fvalue
-                self.axis_events.append((axis, fvalue))
-                # logger.info("%s: %.3f" % (axis, fvalue))
+                self.axis_states[axis] = value
+                self.events.put_axis(axis, value)
+                self.axis_batch.append((axis, value))
+                self.batch_event_time = evtime
+                # logger.info("%s: %s" % (axis, value))
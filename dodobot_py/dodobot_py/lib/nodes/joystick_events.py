@@ -0,0 +1,55 @@
+import threading
+import collections
+
+
+class JoystickEvents:
+    """
+    Hands joystick events from the reader thread to the main loop. Axis events are coalesced: only the
+    latest value of each axis since the last take_axes() is kept, so a stalled main loop doesn't replay
+    stale stick positions. Button edges are all kept, in order, up to max_button_events. Past that the
+    oldest are dropped.
+    """
+
+    def __init__(self, max_button_events=64):
+        self.lock = threading.Lock()
+        self.axis_values = collections.OrderedDict()
+        self.button_events = collections.deque(maxlen=max_button_events)
+        self.num_coalesced_axis_events = 0
+        self.num_dropped_button_events = 0
+
+    def put_axis(self, name, value):
+        with self.lock:
+            if name in self.axis_values:
+                self.num_coalesced_axis_events += 1
+            self.axis_values[name] = value
+
+    def put_button(self, name, value):
+        with self.lock:
+            if len(self.button_events) == self.button_events.maxlen:
+                self.num_dropped_button_events += 1
+            self.button_events.append((name, value))
+
+    def take_axes(self):
+        with self.lock:
+            if len(self.axis_values) == 0:
+                return ()
+            axis_values = self.axis_values
+            self.axis_values = collections.OrderedDict()
+        return axis_values.items()
+
+    def take_buttons(self):
+        with self.lock:
+            if len(self.button_events) == 0:
+                return ()
+            button_events = list(self.button_events)
+            self.button_events.clear()
+        return button_events
+
+    def has_pending(self):
+        with self.lock:
+            return len(self.axis_values) > 0 or len(self.button_events) > 0
+
+    def clear(self):
+        with self.lock:
+            self.axis_values.clear()
+            self.button_events.clear()
@@ -0,0 +1,126 @@
+import os
+import time
+import struct
+import threading
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+# File layout: header, axis names, button names, then js_event records exactly as the driver returned them.
+# Names are newline separated utf-8
+header_struct = struct.Struct("<4sBHH")  # magic, version, axis names length, button names length
+recording_magic = b"DJSR"
+recording_version = 1
+
+# struct js_event from linux/joystick.h: time (ms), value, type, number
+js_event_struct = struct.Struct('IhBB')
+
+
+def encode_header(axis_map, button_map):
+    axis_names = "\n".join(axis_map).encode()
+    button_names = "\n".join(button_map).encode()
+    return header_struct.pack(recording_magic, recording_version, len(axis_names), len(button_names)) + \
+        axis_names + button_names
+
+
+def split_names(data):
+    return data.decode().split("\n") if len(data) > 0 else []
+
+
+def read_recording(path):
+    """Returns the axis map, button map and the event records of a recording"""
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version, axis_names_len, button_names_len = header_struct.unpack_from(data)
+    if magic != recording_magic or version != recording_version:
+        raise ValueError("%s is not a version %s joystick recording" % (path, recording_version))
+    start = header_struct.size
+    axis_map = split_names(data[start: start + axis_names_len])
+    start += axis_names_len
+    button_map = split_names(data[start: start + button_names_len])
+    start += button_names_len
+    events = data[start:]
+    events = events[:len(events) - len(events) % js_event_struct.size]
+    return axis_map, button_map, events
+
+
+def write_recording(path, axis_map, button_map, events):
+    """Writes (time ms, value, type, number) events as a recording. Used to generate test input"""
+    with open(path, "wb") as file:
+        file.write(encode_header(axis_map, button_map))
+        for event in events:
+            file.write(js_event_struct.pack(*event))
+
+
+class JoystickRecorder:
+    """Appends everything read from the joystick to a recording file"""
+
+    def __init__(self, path, axis_map, button_map):
+        self.path = path
+        self.num_bytes = 0
+        # unbuffered: the reader thread is a daemon and may not get to close the file
+        self.file = open(path, "wb", buffering=0)
+        self.file.write(encode_header(axis_map, button_map))
+        logger.info("Recording joystick events to %s" % path)
+
+    def write(self, evbuf):
+        self.file.write(evbuf)
+        self.num_bytes += len(evbuf)
+
+    def close(self):
+        self.file.close()
+        logger.info("Recorded %s joystick events to %s" % (self.num_bytes // js_event_struct.size, self.path))
+
+
+class JoystickReplay:
+    """
+    Plays a recording into a pipe that the joystick reads in place of the device.
+    Events keep their recorded spacing divided by speed. speed 0.0 writes them as fast as the
+    reader takes them. Event times are rewritten to the current time, like the driver stamps them.
+    The write end is closed at the end so the reader sees the device go away.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.axis_map, self.button_map, self.events = read_recording(path)
+        self.num_events = len(self.events) // js_event_struct.size
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)  # like the O_NONBLOCK device
+        self.should_stop = False
+        self.is_started = False
+        self.thread = threading.Thread(target=self.run, name="joystick_replay")
+        self.thread.daemon = True
+
+    def start(self):
+        logger.info("Replaying %s joystick events from %s at %sx" % (self.num_events, self.path, self.speed))
+        self.is_started = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        start_time = time.monotonic()
+        first_event_time = None
+        try:
+            for event_time, value, type, number in js_event_struct.iter_unpack(self.events):
+                if self.should_stop:
+                    break
+                if first_event_time is None:
+                    first_event_time = event_time
+                if self.speed > 0.0:
+                    # recorded times are a wrapping 32 bit ms counter
+                    offset = ((event_time - first_event_time) % 0x100000000) / 1000.0 / self.speed
+                    delay = start_time + offset - time.monotonic()
+                    if delay > 0.0:
+                        time.sleep(delay)
+                now_ms = int(time.monotonic() * 1000.0) & 0xffffffff
+                os.write(self.write_fd, js_event_struct.pack(now_ms, value, type, number))
+        except OSError:
+            pass  # the reader closed its end
+        finally:
+            os.close(self.write_fd)
+        logger.info("Joystick replay finished in %0.3fs" % (time.monotonic() - start_time))
+
+    def stop(self):
+        self.should_stop = True
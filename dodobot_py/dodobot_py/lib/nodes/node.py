@@ -1,10 +1,19 @@
 class Node:
+    update_rate_hz = None  # how often the session calls update(). None runs at general update_rate_hz
+
     def __init__(self, session):
         self.session = session
 
     def start(self):
         pass
 
+    def startup_steps(self):
+        """
+        (name, fn, after) tuples Session runs to start this node. Names in after refer to this node's steps
+        or, with a "node." prefix, to another node's. Nodes that don't split their startup run start()
+        """
+        return [("start", self.start, ())]
+
     def update(self):
         pass
 
@@ -0,0 +1,302 @@
+import os
+import tty
+import time
+import termios
+import asyncio
+import collections
+
+from . import packet as packet_codec
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+# segment formats of the packets the device sends. Matches Robot.process_packet and Dodobot.process_packet
+TELEMETRY_FORMATS = {
+    "txrx": "dd",
+    "ready": "ds",
+    "batt": "ufff",
+    "state": "uddfu",
+    "latch_btn": "ud",
+    "unlatch": "u",
+    "control": "sd",
+    "ir": "udd",
+    "tilt": "ud",
+    "grip": "ud",
+    "le": "ud",
+    "breakout": "ud",
+    "bump": "udd",
+    "listdir": "sd",
+    "network": "d",
+}
+
+Telemetry = collections.namedtuple("Telemetry", "num category recv_time data")
+
+
+def open_serial_fd(address, baud_rate):
+    fd = os.open(address, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attributes = termios.tcgetattr(fd)
+        speed = getattr(termios, "B%s" % baud_rate)
+        attributes[4] = speed  # ispeed
+        attributes[5] = speed  # ospeed
+        termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+class RobotProtocol(asyncio.Protocol):
+    def __init__(self, client):
+        self.client = client
+        self.framer = packet_codec.PacketFramer()
+
+    def data_received(self, data):
+        for packet in self.framer.feed(data):
+            self.client.dispatch(packet)
+        while len(self.framer.messages) > 0:
+            logger.info("Device message: %s" % self.framer.messages.popleft())
+
+    def connection_lost(self, exc):
+        self.client.connection_lost(exc)
+
+
+class WriteProtocol(asyncio.BaseProtocol):
+    def __init__(self):
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    def connection_lost(self, exc):
+        self.can_write.set()
+
+
+class AsyncRobot:
+    """
+    asyncio client for the framed serial link. Shares the packet format with Robot but never blocks
+    the event loop, so several clients and servers can run in one loop.
+
+        robot = AsyncRobot(address, baud_rate)
+        await robot.connect()
+        await robot.check_ready()
+        packet_num = await robot.write("<>", 1)
+        ok = await robot.ack(packet_num)
+        async for packet in robot.telemetry("batt"):
+            ...
+    """
+
+    def __init__(self, address, baud_rate=115200, name="dodobot"):
+        self.address = address
+        self.baud_rate = baud_rate
+        self.name = name
+
+        self.read_transport = None
+        self.write_transport = None
+        self.write_protocol = None
+        self.write_lock = None
+        self.sd_lock = None
+        self.ready_event = None
+
+        self.write_packet_num = 0
+        self.write_delay = 0.0005  # give the microcontroller a chance to not drop the next packet
+        self.ack_timeout = 1.0
+        self.max_recent_acks = 256
+        self.recent_acks = collections.OrderedDict()
+        self.pending_acks = {}
+        self.subscribers = collections.defaultdict(list)
+        self.telemetry_queue_size = 16
+
+        self.ready_state = {
+            "name": "",
+            "is_ready": False,
+            "time_ms": 0
+        }
+        self.device_start_time = 0.0
+        self.offset_time_ms = 0
+
+        self.large_packet_len = packet_codec.LARGE_PACKET_LEN
+        self.read_packet_num = -1
+        self.num_dropped_telemetry = 0
+
+    async def connect(self):
+        loop = asyncio.get_event_loop()
+        self.write_lock = asyncio.Lock()
+        self.sd_lock = asyncio.Lock()
+        self.ready_event = asyncio.Event()
+
+        fd = open_serial_fd(self.address, self.baud_rate)
+        read_file = os.fdopen(fd, 'rb', buffering=0)
+        write_file = os.fdopen(os.dup(fd), 'wb', buffering=0)
+        self.read_transport, _ = await loop.connect_read_pipe(lambda: RobotProtocol(self), read_file)
+        self.write_transport, self.write_protocol = await loop.connect_write_pipe(WriteProtocol, write_file)
+        logger.info("Connected to %s" % self.address)
+
+    async def close(self):
+        if self.write_transport is not None:
+            self.write_transport.close()
+        if self.read_transport is not None:
+            self.read_transport.close()
+        await asyncio.sleep(0)  # let the transports finish closing
+        self.connection_lost(None)
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            logger.error("Lost connection to %s: %s" % (self.address, exc))
+        for future in self.pending_acks.values():
+            if not future.done():
+                future.set_result(None)
+        self.pending_acks.clear()
+
+    async def write(self, name, *args):
+        """Write a packet and return its packet number. Pass the number to ack() to wait for the response"""
+        async with self.write_lock:
+            # the packet number and the transport write happen together so a cancelled writer
+            # can't leave a gap or a partial packet in the stream
+            packet_num = self.write_packet_num
+            self.write_transport.write(packet_codec.encode_packet(packet_num, name, *args))
+            self.write_packet_num += 1
+            await self.write_protocol.can_write.wait()
+            await asyncio.sleep(self.write_delay)
+        return packet_num
+
+    async def ack(self, packet_num, timeout=None):
+        """Wait for the device's txrx response to packet_num. Returns True if the packet was accepted"""
+        if timeout is None:
+            timeout = self.ack_timeout
+        if packet_num in self.recent_acks:
+            error_code = self.recent_acks[packet_num]
+        else:
+            future = self.pending_acks.get(packet_num)
+            if future is None:
+                future = asyncio.get_event_loop().create_future()
+                self.pending_acks[packet_num] = future
+            try:
+                error_code = await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                logger.warn("Timed out while waiting for response from packet #%s" % packet_num)
+                return False
+            finally:
+                self.pending_acks.pop(packet_num, None)
+        if error_code is None:
+            return False
+        if error_code != 0:
+            logger.warning("Packet %s returned an error: %s" % (
+                packet_num, packet_codec.PACKET_ERROR_CODES.get(error_code, error_code)))
+        return error_code == 0 or error_code == 6
+
+    async def request(self, name, *args, timeout=None):
+        packet_num = await self.write(name, *args)
+        return await self.ack(packet_num, timeout)
+
+    async def telemetry(self, category):
+        """
+        Async iterator over parsed packets of one category. Each subscriber gets its own bounded queue.
+        A slow subscriber loses its oldest packets instead of delaying everyone else.
+        """
+        queue = asyncio.Queue(self.telemetry_queue_size)
+        self.subscribers[category].append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.subscribers[category].remove(queue)
+
+    def dispatch(self, packet):
+        if self.read_packet_num != -1 and packet.num != self.read_packet_num:
+            logger.debug("Received packet num doesn't match local count. recv %s != local %s" % (
+                packet.num, self.read_packet_num))
+        self.read_packet_num = packet.num + 1
+
+        formats = TELEMETRY_FORMATS.get(packet.category)
+        try:
+            if formats is None:
+                data = [packet.payload]
+            else:
+                data = packet_codec.parse_segments(packet.payload, formats)
+        except packet_codec.PacketFormatError as e:
+            logger.error("Failed to parse %s packet: %s" % (packet.category, e))
+            return
+
+        if packet.category == "txrx":
+            self.set_ack(data[0], data[1])
+        elif packet.category == "ready":
+            self.ready_state["time_ms"] = data[0]
+            self.ready_state["name"] = data[1]
+            self.ready_state["is_ready"] = True
+            self.ready_event.set()
+
+        queues = self.subscribers.get(packet.category)
+        if not queues:
+            return
+        item = Telemetry(packet.num, packet.category, time.time(), data)
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                self.num_dropped_telemetry += 1
+            queue.put_nowait(item)
+
+    def set_ack(self, packet_num, error_code):
+        self.recent_acks[packet_num] = error_code
+        while len(self.recent_acks) > self.max_recent_acks:
+            self.recent_acks.popitem(last=False)
+        future = self.pending_acks.pop(packet_num, None)
+        if future is not None and not future.done():
+            future.set_result(error_code)
+
+    async def check_ready(self, timeout=5.0, write_interval=1.0):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while not self.ready_state["is_ready"]:
+            remaining = deadline - loop.time()
+            if remaining <= 0.0:
+                raise asyncio.TimeoutError("Failed to receive ready signal within %ss" % timeout)
+            await self.write("?", self.name)
+            try:
+                await asyncio.wait_for(self.ready_event.wait(), min(write_interval, remaining))
+            except asyncio.TimeoutError:
+                logger.info("Writing ready signal again")
+        self.set_start_time(self.ready_state["time_ms"])
+        logger.info("Serial device is ready. Robot name is %s" % self.ready_state["name"])
+
+    def set_start_time(self, time_ms):
+        self.device_start_time = time.time()
+        self.offset_time_ms = time_ms
+
+    def get_device_time(self, time_ms):
+        return self.device_start_time + (time_ms - self.offset_time_ms) / 1000.0
+
+    async def delete_sd(self, dest_name):
+        if not await self.request("delete", dest_name):
+            logger.warn("Failed to receive ok signal for delete SD file: %s" % str(dest_name))
+            return False
+        return True
+
+    async def write_sd(self, data, dest_name):
+        """
+        Upload data to the SD card in acknowledged segments. dest_name must already be an 8.3 file name.
+        Only one transfer runs at a time since the device keeps a single destination path. If the transfer is cancelled, the partially
+        written file is deleted before the cancellation is re-raised.
+        """
+        if type(data) == str:
+            data = data.encode()
+        async with self.sd_lock:
+            await self.write("setpath", dest_name)
+            segments = [data[index: index + self.large_packet_len] for index in range(0, len(data), self.large_packet_len)]
+            num_segments = len(segments)
+            try:
+                for index, segment in enumerate(segments):
+                    if not await self.request("file", index, num_segments, segment):
+                        logger.warn("Failed to receive ok signal on segment %s of %s. %s" % (
+                            index + 1, num_segments, dest_name))
+                        return False
+            except asyncio.CancelledError:
+                logger.warn("SD transfer of %s cancelled. Removing partial file" % dest_name)
+                await asyncio.shield(self.delete_sd(dest_name))
+                raise
+        return True
@@ -1,12 +1,117 @@
+import math
 import time
 
 from lib.config import ConfigManager
+from lib.filters import EMA, RollingMedian
 from lib.logger_manager import LoggerManager
 
 battery_config = ConfigManager.get_battery_config()
 logger = LoggerManager.get_logger()
 
 
+class BatteryEstimator:
+    """
+    Streaming battery estimate that costs O(1) per batt packet. current_mA is coulomb counted into
+    mAh used. The filtered voltage is mapped to a state of charge through discharge_curve and fit
+    against mAh used with exponentially weighted least squares (older samples fade out per
+    estimator_window_mAh used). Where the fit crosses zero charge is the mAh used at the cutoff,
+    and its slope is the capacity. Until the fit has seen enough of the discharge, the charge left
+    comes from capacity_mAh and the voltage at the start.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.prev_time = None
+        self.used_mAh = 0.0
+        self.initial_soc = 0.0
+        self.filtered_V = 0.0
+        self.filtered_mA = 0.0
+        self.voltage_filter = EMA()
+        self.current_filter = EMA()
+        self.sums = [0.0] * 5  # weight, mAh, soc, mAh^2, mAh*soc
+        self.fit_valid = False
+
+        self.remaining_mAh = None
+        self.soc = None
+        self.remaining_min = None
+
+    @staticmethod
+    def voltage_soc(voltage_V):
+        curve = battery_config.discharge_curve
+        if voltage_V <= curve[0][0]:
+            return curve[0][1]
+        for (v0, soc0), (v1, soc1) in zip(curve[:-1], curve[1:]):
+            if voltage_V <= v1:
+                return soc0 + (soc1 - soc0) * (voltage_V - v0) / (v1 - v0)
+        return curve[-1][1]
+
+    def update(self, recv_time, current_mA, voltage_V):
+        if voltage_V <= 0.0:
+            return
+        if self.prev_time is None:
+            self.initial_soc = self.voltage_soc(voltage_V)
+            dt = 0.0
+        else:
+            dt = recv_time - self.prev_time
+            if dt < 0.0 or dt > battery_config.estimator_max_gap_s:
+                dt = 0.0  # device restarted or packets dropped. Don't count across the gap
+        self.prev_time = recv_time
+
+        self.filtered_V = self.voltage_filter.process(
+            voltage_V, EMA.alpha_from_time_constant(dt, battery_config.voltage_time_constant_s))
+        self.filtered_mA = self.current_filter.process(
+            current_mA, EMA.alpha_from_time_constant(dt, battery_config.current_time_constant_s))
+
+        used_step = max(0.0, current_mA) * dt / 3600.0
+        self.used_mAh += used_step
+
+        decay = math.exp(-used_step / battery_config.estimator_window_mAh)
+        q = self.used_mAh
+        soc = self.voltage_soc(self.filtered_V)
+        sums = self.sums
+        sums[0] = sums[0] * decay + 1.0
+        sums[1] = sums[1] * decay + q
+        sums[2] = sums[2] * decay + soc
+        sums[3] = sums[3] * decay + q * q
+        sums[4] = sums[4] * decay + q * soc
+
+        self.update_estimate()
+
+    def update_estimate(self):
+        weight, sum_q, sum_soc, sum_qq, sum_qsoc = self.sums
+        mean_q = sum_q / weight
+        mean_soc = sum_soc / weight
+        var_q = max(0.0, sum_qq / weight - mean_q * mean_q)
+        slope = (sum_qsoc / weight - mean_q * mean_soc) / var_q if var_q > 0.0 else 0.0
+
+        self.fit_valid = (
+                weight >= battery_config.estimator_min_samples and
+                math.sqrt(var_q) >= battery_config.estimator_min_used_mAh and
+                slope < 0.0  # charge goes down as it's used
+        )
+        if self.fit_valid:
+            soc = mean_soc + slope * (self.used_mAh - mean_q)
+            used_at_cutoff = mean_q - mean_soc / slope
+            self.remaining_mAh = max(0.0, used_at_cutoff - self.used_mAh)
+            self.soc = max(0.0, min(1.0, soc))
+        else:
+            self.remaining_mAh = max(0.0, battery_config.capacity_mAh * self.initial_soc - self.used_mAh)
+            self.soc = self.remaining_mAh / battery_config.capacity_mAh
+
+        if self.filtered_mA >= battery_config.estimator_min_current_mA:
+            self.remaining_min = self.remaining_mAh / self.filtered_mA * 60.0
+        else:
+            self.remaining_min = None
+
+    def get_state(self):
+        return {
+            "soc": self.soc,
+            "remaining_min": self.remaining_min,
+        }
+
+
 class BatteryState:
     UNKNOWN = 0
     FULL = 1
@@ -20,8 +125,17 @@ class BatteryState:
         self.current_mA = 0.0
         self.power_mW = 0.0
         self.voltage_V = 0.0
+        self.filtered_V = 0.0
+        self.prev_recv_time = None
+        # thresholds use filtered voltage so motor load sag doesn't start the critical timer
+        self.voltage_median = RollingMedian(battery_config.voltage_median_window)
+        self.voltage_filter = EMA()
         self.prev_critical_time = None
+        self.prev_low_runtime_time = None
         self.prev_V = 0.0
+        self.estimator = BatteryEstimator()
+        self.min_V = None  # lowest filtered voltage since the estimator was reset
+        self.prev_report_time = 0.0
 
     def update_state(self, power_state):
         self.recv_time = power_state["recv_time"]
@@ -29,47 +143,118 @@ class BatteryState:
         self.power_mW = power_state["power_mW"]
         self.voltage_V = power_state["load_voltage_V"]
 
+    def filter_voltage(self):
+        if self.prev_recv_time is None:
+            dt = 0.0
+        else:
+            dt = self.recv_time - self.prev_recv_time
+            if dt < 0.0 or dt > battery_config.estimator_max_gap_s:
+                self.voltage_median.reset()
+                self.voltage_filter.reset()
+                dt = 0.0
+        self.prev_recv_time = self.recv_time
+
+        median_V = self.voltage_median.process(self.voltage_V)
+        self.filtered_V = self.voltage_filter.process(
+            median_V, EMA.alpha_from_time_constant(dt, battery_config.threshold_time_constant_s))
+
     def set(self, power_state):
         self.update_state(power_state)
-        if self.voltage_V >= battery_config.full_voltage:
+        self.filter_voltage()
+        if self.min_V is None or self.filtered_V < self.min_V:
+            self.min_V = self.filtered_V
+        if self.filtered_V >= battery_config.full_voltage:
             state = self.FULL
             self.prev_critical_time = None
+            if self.state != self.FULL and self.was_charged():
+                self.estimator.reset()
+                self.min_V = self.filtered_V
         # elif self.voltage_V >= battery_config.ok_voltage:
-        elif self.voltage_V > battery_config.low_voltage:
+        elif self.filtered_V > battery_config.low_voltage:
             state = self.OK
             self.prev_critical_time = None
-        elif self.voltage_V <= battery_config.critical_voltage:
+        elif self.filtered_V <= battery_config.critical_voltage:
             state = self.CRITICAL
             if self.prev_critical_time is None:
                 self.prev_critical_time = time.time()
-        elif self.voltage_V <= battery_config.low_voltage:
+        elif self.filtered_V <= battery_config.low_voltage:
             state = self.LOW
             self.prev_critical_time = None
         else:
             state = self.state
 
+        self.update_estimate()
+
         if state != self.state:
             self.state = state
-            if abs(self.voltage_V - self.prev_V) > 0.25:
-                self.prev_V = self.voltage_V
+            if abs(self.filtered_V - self.prev_V) > 0.25:
+                self.prev_V = self.filtered_V
                 return True
         return False
 
+    def was_charged(self):
+        # a battery hovering around full_voltage crosses it back and forth without being charged.
+        # Only a drop below low_voltage or a sustained rise since the last reset counts
+        return (
+                self.min_V <= battery_config.low_voltage or
+                self.filtered_V - self.min_V >= battery_config.charge_rise_V
+        )
+
+    def update_estimate(self):
+        self.estimator.update(self.recv_time, self.current_mA, self.filtered_V)
+        if self.is_runtime_low():
+            if self.prev_low_runtime_time is None:
+                self.prev_low_runtime_time = time.time()
+        else:
+            self.prev_low_runtime_time = None
+
+        if time.time() - self.prev_report_time > battery_config.battery_log_report_time:
+            self.prev_report_time = time.time()
+            self.log_estimate()
+
+    def is_runtime_low(self):
+        # only trust the runtime once the fit has seen the discharge curve
+        return (
+                battery_config.shutdown_remaining_min > 0.0 and
+                self.estimator.fit_valid and
+                self.estimator.remaining_min is not None and
+                self.estimator.remaining_min < battery_config.shutdown_remaining_min
+        )
+
+    def get_estimate(self):
+        return self.estimator.get_state()
+
     def should_shutdown(self):
         return (
                 self.state == self.CRITICAL and
                 self.prev_critical_time is not None and
                 time.time() - self.prev_critical_time > battery_config.critical_voltage_timeout_s
+        ) or (
+                self.prev_low_runtime_time is not None and
+                time.time() - self.prev_low_runtime_time > battery_config.critical_voltage_timeout_s
         )
 
     def log_state(self):
         if self.state == self.FULL:
-            logger.info("Fully charged: %0.2f" % self.voltage_V)
+            logger.info("Fully charged: %0.2f" % self.filtered_V)
         elif self.state == self.OK:
-            logger.info("Battery ok: %0.2f" % self.voltage_V)
+            logger.info("Battery ok: %0.2f" % self.filtered_V)
         elif self.state == self.LOW:
-            logger.warn("Battery is low: %0.2f" % self.voltage_V)
+            logger.warn("Battery is low: %0.2f" % self.filtered_V)
         elif self.state == self.CRITICAL:
-            logger.error("Battery is critically low: %0.2f!!" % self.voltage_V)
+            logger.error("Battery is critically low: %0.2f!!" % self.filtered_V)
         else:
             logger.error("Battery is in an unknown state")
+
+    def log_estimate(self):
+        estimator = self.estimator
+        if estimator.remaining_mAh is None:
+            return
+        if estimator.remaining_min is None:
+            remaining_time = "unknown time"
+        else:
+            remaining_time = "%0.1f min" % estimator.remaining_min
+        logger.info("Battery: %0.0f%%, %0.0f mAh left (%s at %0.0f mA). %0.0f mAh used. Estimate from %s" % (
+            estimator.soc * 100.0, estimator.remaining_mAh, remaining_time, estimator.filtered_mA,
+            estimator.used_mAh, "discharge fit" if estimator.fit_valid else "capacity"
+        ))
@@ -89,6 +89,9 @@ class DevicePort:
         else:
             raise DevicePortReadException("Serial port wasn't open for reading...")
 
+    def fileno(self):
+        return self.device.fileno()
+
     def readline(self):
         return self.device.readline()
 
@@ -1,17 +1,27 @@
 import os
-import math
+import json
 import time
 import pprint
+import hashlib
+import threading
 
 from .robot_client import Robot
 from .task import Task
 from .network_proxy import NetworkProxy
+from .drive_controller import DriveController
+from .stability_table import StabilityTable
+from .gripper_table import GripperTable
 from . import image
 from lib.config import ConfigManager
 from lib.logger_manager import LoggerManager
+from lib.process_node import ProcessProxy
+from lib.profiler import RollingStats
+from lib.input_shaping import InputShaper, axis_curve, threshold_curve
 
 device_port_config = ConfigManager.get_device_port_config()
 robot_config = ConfigManager.get_robot_config()
+joystick_config = ConfigManager.get_joystick_config()
+general_config = ConfigManager.get_general_config()
 logger = LoggerManager.get_logger()
 
 
@@ -21,27 +31,58 @@ class Dodobot(Robot):
 
         self.gripper_state = {
             "recv_time": 0.0,
-            "pos"      : 0
+            "pos"      : 0,
+            "opening_mm": None
         }
+        if os.path.isfile(robot_config.gripper_table_path):
+            self.gripper_table = GripperTable(
+                robot_config.gripper_table_path, robot_config.gripper_open, robot_config.gripper_closed
+            )
+        else:
+            logger.warning("Gripper table not found: %s. Millimetre gripper commands are disabled" % robot_config.gripper_table_path)
+            self.gripper_table = None
 
         self.brake_pedal_gripper_threshold = 0
 
         self.prev_drive_command_time = 0.0
         self.prev_drive_repeat_command_time = 0.0
         self.prev_drive_repeat_stop_time = 0.0
-        self.prev_sent_command_time = 0.0
         self.drive_command_timeout = robot_config.drive_command_timeout
         self.drive_command_repeat_timeout = robot_config.drive_command_repeat_timeout
         self.drive_stop_repeat_timeout = self.drive_command_repeat_timeout + 0.5
-        self.drive_command_update_delay = 1.0 / robot_config.drive_command_update_rate
+        self.update_rate_hz = robot_config.drive_command_update_rate  # drive commands go out once per update
 
-        self.joystick_deadzone = robot_config.joystick_deadzone
-        self.max_joy_val = robot_config.max_joy_val
         self.drive_cmd_forward = 0.0
         self.drive_cmd_rotate = 0.0
         self.prev_cmd_A = 0.0
         self.prev_cmd_B = 0.0
 
+        # drive state is shared between the main loop and the joystick thread
+        self.drive_lock = threading.RLock()
+        self.direct_teleop = robot_config.direct_teleop
+        self.direct_teleop_delay = 1.0 / robot_config.direct_teleop_max_rate_hz
+        self.prev_direct_teleop_time = 0.0
+        self.pending_drive_event_time = None  # kernel time of the oldest stick event not yet written
+        self.teleop_latency = RollingStats(512)  # ms from stick event to drive command write
+        self.prev_latency_report_time = 0.0
+        self.latency_report_interval = 60.0
+        if robot_config.drive_control_thread:
+            self.drive_controller = DriveController(self)
+        else:
+            self.drive_controller = None
+
+        self.linear_state = {
+            "recv_time": 0.0,
+            "pos"      : None  # steps from home. Unknown until the first linear packet
+        }
+        self.stability_table = None
+        if robot_config.tipping_limit:
+            if self.drive_controller is None:
+                logger.warning("tipping_limit is only applied by the drive control thread. "
+                               "Set drive_control_thread to enable it. Not loading the stability table")
+            else:
+                self.stability_table = StabilityTable(robot_config.stability_table_path)
+
         self.stepper_max_speed = robot_config.stepper_max_speed
         self.stepper_max_accel = robot_config.stepper_max_accel
 
@@ -93,6 +134,11 @@ class Dodobot(Robot):
 
         self.enable_tilt_axis = False
 
+        self.input_shaper = InputShaper()
+        self.prev_input_shaping_check_time = 0.0
+        self.input_shaping_check_interval = 1.0
+        self.update_input_shaping()
+
         self.thumbl_pressed = False
         self.thumbr_pressed = False
         self.set_pid_event = True
@@ -102,26 +148,115 @@ class Dodobot(Robot):
 
         self.interface_name = robot_config.wifi_name
         self.hotspot_name = robot_config.hotspot_name
-        self.network_proxy = NetworkProxy()
-
-    def start(self):
-        super(Dodobot, self).start()
-
+        if "network_proxy" in general_config.process_offload:
+            # nmcli output parsing happens in the child. Rescans still stream their results
+            self.network_proxy = ProcessProxy(NetworkProxy, iter_methods=["iter_rescan", "iter_list_report"])
+        else:
+            self.network_proxy = NetworkProxy()
+        self.network_list_task = None
+        self.network_list_length = robot_config.network_list_length
+        self.network_rescan_timeout = robot_config.network_rescan_timeout
+
+        self.prepared_levels = []
+        self.prepared_network_info = None
+        self.pushed_config_hash = None
+        self.pushed_levels_hash = None
+
+    def startup_steps(self):
+        # serial writes stay in one chain (handshake -> configs -> levels -> network) so packets keep their order.
+        # Reading level files and querying nmcli don't touch the device and run alongside the handshake
+        return super(Dodobot, self).startup_steps() + [
+            ("prepare_levels", self.prepare_levels, ()),
+            ("prepare_network_info", self.prepare_network_info, ()),
+            ("configs", self.write_configs, ("handshake",)),
+            ("startup_sound", self.play_startup_sound, ("configs", "sounds.load", "sounds.controller")),
+            ("levels", self.write_prepared_levels, ("configs", "prepare_levels")),
+            ("network_info", self.write_prepared_network_info, ("levels", "prepare_network_info")),
+            ("drive_control", self.start_drive_controller, ("handshake",)),
+        ]
+
+    def start_drive_controller(self):
+        if self.drive_controller is not None:
+            self.drive_controller.start()
+
+    def start_device(self):
         self.joystick = self.session.joystick
+        self.joystick.add_axis_listener(self.on_joystick_axes)
         self.sounds = self.session.sounds
+        super(Dodobot, self).start_device()
 
-        self.set_pid_ks()
-        self.set_gripper_config()
-        self.set_linear_max_speed(self.stepper_max_speed)
-        self.set_linear_max_accel(self.stepper_max_accel)
-
+    def write_configs(self):
+        config_hash = self.get_config_hash()
+        if self.is_warm_start and self.warm_state.get("config_hash") == config_hash:
+            logger.info("Device already has the current config. Skipping config upload")
+        else:
+            success = self.set_pid_ks()
+            self.set_gripper_config()
+            self.set_linear_max_speed(self.stepper_max_speed)
+            self.set_linear_max_accel(self.stepper_max_accel)
+            if not success:
+                # a warm relaunch has to upload it again
+                logger.warn("Config upload failed")
+                config_hash = None
+        self.pushed_config_hash = config_hash
+
+    def get_config_hash(self):
+        config = [
+            self.pid_ks,
+            int(robot_config.gripper_open), int(robot_config.gripper_closed),
+            self.stepper_max_speed, self.stepper_max_accel
+        ]
+        return hashlib.sha1(json.dumps(config).encode()).hexdigest()
+
+    def get_levels_hash(self, levels):
+        levels_hash = hashlib.sha1()
+        for path, dest_name, level in levels:
+            levels_hash.update(dest_name.encode())
+            levels_hash.update(level)
+        return levels_hash.hexdigest()
+
+    def get_warm_state(self):
+        state = super(Dodobot, self).get_warm_state()
+        state["config_hash"] = self.pushed_config_hash
+        state["levels_hash"] = self.pushed_levels_hash
+        return state
+
+    def play_startup_sound(self):
         self.sounds["startup"].play()
 
+    def prepare_levels(self):
+        self.prepared_levels = []
+        try:
+            self.prepared_levels = self.load_levels(robot_config.breakout_levels)
+        except BaseException as e:
+            logger.error(str(e), exc_info=True)
+
+    def write_prepared_levels(self):
+        levels_hash = self.get_levels_hash(self.prepared_levels)
+        if self.is_warm_start and self.warm_state.get("levels_hash") == levels_hash:
+            logger.info("Device already has the current levels. Skipping level upload")
+            self.pushed_levels_hash = levels_hash
+            return
         time.sleep(0.35)
         try:
-            self.write_levels(robot_config.breakout_levels)
+            if self.write_level_data(self.prepared_levels):
+                self.pushed_levels_hash = levels_hash
+            else:
+                logger.warn("Level upload failed")
+                self.pushed_levels_hash = None
+        except BaseException as e:
+            logger.error(str(e), exc_info=True)
+
+    def prepare_network_info(self):
+        try:
+            self.prepared_network_info = self.get_network_info()
         except BaseException as e:
             logger.error(str(e), exc_info=True)
+
+    def write_prepared_network_info(self):
+        if self.prepared_network_info is not None:
+            self.write("network", *self.prepared_network_info)
+            self.prepared_network_info = None
         # try:
         #     self.write_image(
         #         robot_config.startup_image_name,
@@ -154,6 +289,12 @@ class Dodobot(Robot):
         elif category == "grip" and self.parse_segments("ud"):
             self.gripper_state["recv_time"] = self.get_device_time(self.parsed_data[0])
             self.gripper_state["pos"] = self.parsed_data[1]
+            if self.gripper_table is not None:
+                self.gripper_state["opening_mm"] = self.gripper_table.position_to_mm(self.gripper_state["pos"])
+
+        elif category == "linear" and self.parse_segments("ud"):
+            self.linear_state["recv_time"] = self.get_device_time(self.parsed_data[0])
+            self.linear_state["pos"] = self.parsed_data[1]
 
         elif category == "le" and self.parse_segments("ud"):
             # recv_time = self.get_device_time(self.parsed_data[0])
@@ -253,6 +394,15 @@ class Dodobot(Robot):
         else:
             self.close_gripper(force_threshold, position)
 
+    def set_gripper_mm(self, opening_mm, force_threshold=-1):
+        if self.gripper_table is None:
+            logger.warning("Can't set gripper to %0.1f mm without a gripper table" % opening_mm)
+            return
+        self.set_gripper(self.gripper_table.mm_to_position(opening_mm), force_threshold)
+
+    def get_gripper_opening_mm(self):
+        return self.gripper_state["opening_mm"]
+
     def tilter_up(self):
         self.write("tilt", 0)
 
@@ -294,10 +444,12 @@ class Dodobot(Robot):
     def set_pid_ks(self):
         logger.info("Writing PID Ks: %s" % self.pid_ks)
         for attempt in range(5):
-            self.write("ks", *self.pid_ks)
-            if self.wait_for_ok():
-                break
+            packet_num = self.write("ks", *self.pid_ks)
+            if self.wait_for_ok(packet_num):
+                return True
             logger.warn("Failed to receive ok signal for PID. Trying again.")
+        logger.error("Failed to write PID Ks")
+        return False
 
     def set_gripper_config(self):
         logger.info(
@@ -310,27 +462,36 @@ class Dodobot(Robot):
         return level_config.encode()
 
     def sd_card_listdir(self, dir="/"):
-        self.write("listdir", dir)
-        if not self.wait_for_ok():
+        packet_num = self.write("listdir", dir)
+        if not self.wait_for_ok(packet_num):
             logger.warn("Failed to receive ok signal for listdir: %s" % str(dir))
             return False
         return True
 
     def write_levels(self, dir_path):
-        self.sd_card_listdir()
-        for filename in self.sd_card_directory:
-            filename = filename.decode()
-            if "BR-" in filename.upper():
-                self.delete_sd(filename)
+        return self.write_level_data(self.load_levels(dir_path))
 
+    def load_levels(self, dir_path):
+        levels = []
         for filename in os.listdir(dir_path):
             if "BR-" not in filename.upper():
                 continue
             dest_name = os.path.splitext(filename)[0]
             path = os.path.join(dir_path, filename)
-            level = self.load_level(path)
+            levels.append((path, dest_name, self.load_level(path)))
+        return levels
+
+    def write_level_data(self, levels):
+        success = self.sd_card_listdir()
+        for filename in self.sd_card_directory:
+            filename = filename.decode()
+            if "BR-" in filename.upper():
+                success = self.delete_sd(filename) and success
+
+        for path, dest_name, level in levels:
             logger.info("Writing level %s to %s" % (path, dest_name))
-            self.write_sd(level, dest_name)
+            success = self.write_sd(level, dest_name) and success
+        return success
 
     def reload_pid_ks(self):
         robot_config.load()
@@ -340,30 +501,67 @@ class Dodobot(Robot):
             self.pid_ks.append(robot_config.pid_ks[name])
         logger.info("Set PID Ks to:\n%s" % pprint.pformat(robot_config.pid_ks))
 
-    def write_network_info(self):
+    def get_network_info(self):
         info, devices = self.network_proxy.get_report()
         wifi_state = self.network_proxy.get_radio_state()
         hotspot_state = self.network_proxy.get_hotspot_state(self.interface_name, self.hotspot_name)
-        logger.info("Writing networking info:\n%s" % info)
+        logger.info("Networking info:\n%s" % info)
         logger.info("Wifi state: %s" % wifi_state)
         logger.info("Hotspot state: %s" % hotspot_state)
+        return int(wifi_state), int(hotspot_state), str(info)
 
-        self.write("network", int(wifi_state), int(hotspot_state), str(info))
+    def write_network_info(self):
+        self.write("network", *self.get_network_info())
 
     def write_network_list(self):
-        info = self.network_proxy.get_list_report(self.interface_name, 15)
+        # the rescan can take several seconds. Stream it from its own task so the read thread isn't blocked
+        if self.network_list_task is not None and not self.network_list_task.is_finished:
+            logger.info("Network list is already being written")
+            return
+        self.network_list_task = Task(self.write_network_list_task_fn)
+        self.network_list_task.start()
+
+    def write_network_list_task_fn(self, should_stop):
         logger.info("Writing network list:")
-        for index, line in enumerate(info):
-            logger.info("Network: %s" % str(line))
-            self.write("netlist", int(index), str(line[0]), int(line[1]))
+        displayed_netlist = {}
+        report_iter = self.network_proxy.iter_list_report(
+            self.interface_name, self.network_list_length, self.network_rescan_timeout
+        )
+        for info in report_iter:
+            if should_stop():
+                report_iter.close()
+                return
+            for index, line in enumerate(info):
+                line = (str(line[0]), int(line[1]))
+                if displayed_netlist.get(index) == line:
+                    continue
+                displayed_netlist[index] = line
+                logger.info("Network: %s" % str(line))
+                self.write("netlist", int(index), line[0], line[1])
+            # a shorter report than the last one leaves rows for networks that are gone
+            for index in sorted(displayed_netlist):
+                if index >= len(info):
+                    self.write("netlist", int(index), "", 0)
+                    del displayed_netlist[index]
 
     def update(self):
         super(Dodobot, self).update()
 
         self.update_joystick()
 
+        current_time = time.monotonic()
+        if current_time - self.prev_latency_report_time > self.latency_report_interval:
+            self.prev_latency_report_time = current_time
+            self.report_teleop_latency()
+
     def update_joystick(self):
-        if self.joystick.is_open():
+        current_time = time.monotonic()
+        if current_time - self.prev_input_shaping_check_time > self.input_shaping_check_interval:
+            self.prev_input_shaping_check_time = current_time
+            self.update_input_shaping()
+
+        # a replay can reach its end before the main loop takes its last events
+        if self.joystick.is_open() or self.joystick.has_pending_events():
             self.update_axis_events()
             self.update_button_events()
         else:
@@ -381,47 +579,97 @@ class Dodobot(Robot):
         self.update_drive_command()
         self.update_linear_command()
 
-    def update_axis_events(self):
-        for name, value in self.joystick.get_axis_events():
-            if abs(value) < self.joystick_deadzone:
-                value = 0.0
-            else:
-                joy_val = abs(value) - self.joystick_deadzone
-                joy_val = math.copysign(joy_val, value)
-                max_joy_val_adj = self.max_joy_val - self.joystick_deadzone
-                value = 1.0 / max_joy_val_adj * joy_val
+    def get_input_shaping_config(self):
+        curves = {}
+        for name in ("x", "y", "hat0x", "hat0y", "rx", "ry"):
+            curve = dict(deadzone=robot_config.joystick_deadzone, expo=0.0, gain=1.0)
+            curve.update(joystick_config.axis_curves.get(name, {}))
+            curves[name] = curve
+        return {
+            "curves": curves,
+            "max_joy_val": robot_config.max_joy_val,
+            "drive_max_speed": robot_config.drive_max_speed,
+            "drive_min_speed": robot_config.drive_min_speed,
+            "max_tilt_speed": robot_config.max_tilt_speed,
+            "stepper_max_speed": robot_config.stepper_max_speed,
+            "max_grab_speed": robot_config.max_grab_speed,
+            "grab_joy_val_threshold": self.grab_joy_val_threshold,
+        }
 
-            # logger.info("%s: %.3f" % (name, value))
+    def update_input_shaping(self):
+        # the joystick thread reloads joystick.yaml every second and robot.yaml is reloaded with the PID Ks
+        config = self.get_input_shaping_config()
+        if not self.input_shaper.needs_build(config):
+            return
+        start_time = time.monotonic()
+        curves = {
+            name: axis_curve(max_joy_val=config["max_joy_val"], **curve) for name, curve in config["curves"].items()
+        }
+        grab_curve = threshold_curve(curves["rx"], config["grab_joy_val_threshold"])
+        self.input_shaper.build({
+            "rotate": curves["x"] * config["drive_max_speed"],
+            "forward": curves["y"] * -config["drive_max_speed"],
+            "rotate_slow": curves["hat0x"] * config["drive_min_speed"],
+            "forward_slow": curves["hat0y"] * -config["drive_min_speed"],
+            "tilt": (curves["ry"] * -config["max_tilt_speed"]).astype(int),
+            "linear": (curves["ry"] * -config["stepper_max_speed"]).astype(int),
+            "grab": (grab_curve * -config["max_grab_speed"]).astype(int),
+        }, config)
+        logger.info("Built input shaping tables in %0.1fms" % ((time.monotonic() - start_time) * 1000.0))
+
+    def apply_drive_axis(self, name, value):
+        if name == "x":
+            self.drive_cmd_rotate = self.input_shaper.get("rotate", value)
+            # logger.info("rotate cmd: %s" % self.drive_cmd_rotate)
+        elif name == "y":
+            self.drive_cmd_forward = self.input_shaper.get("forward", value)
+            # logger.info("forward cmd: %s" % self.drive_cmd_forward)
+        elif name == "hat0x":
+            self.drive_cmd_rotate = self.input_shaper.get("rotate_slow", value)
+        elif name == "hat0y":
+            self.drive_cmd_forward = self.input_shaper.get("forward_slow", value)
+        else:
+            return False
+        self.prev_drive_command_time = time.time()
+        return True
 
-            if name == "ry":
-                if self.enable_tilt_axis:
-                    self.tilt_speed = int(-self.max_tilt_speed * value)
-                else:
-                    self.linear_vel_command = int(-self.stepper_max_speed * value)
-                # self.prev_drive_command_time = time.time()
-            elif name == "rx":
-                if abs(value) > self.grab_joy_val_threshold:
-                    value -= math.copysign(self.grab_joy_val_threshold, value)
-                    value *= 1.0 / (1.0 - self.grab_joy_val_threshold)
-                    self.grab_speed = int(-self.max_grab_speed * value)
+    def on_joystick_axes(self, events, event_time_ms):
+        # runs on the joystick thread as soon as a batch of events is read
+        with self.drive_lock:
+            if not any(name in ("x", "y", "hat0x", "hat0y") for name, value in events):
+                return
+            if self.pending_drive_event_time is None:
+                self.pending_drive_event_time = event_time_ms
+            if not self.direct_teleop or not self.ready_state["is_ready"]:
+                return
+            for name, value in events:
+                self.apply_drive_axis(name, value)
+
+            # events inside the rate cap are picked up by the next one or by the main loop's update
+            current_time = time.monotonic()
+            if current_time - self.prev_direct_teleop_time < self.direct_teleop_delay:
+                return
+            self.prev_direct_teleop_time = current_time
+            self.update_drive_command()
+
+    def update_axis_events(self):
+        # hold the drive lock so values taken here can't overwrite newer ones from on_joystick_axes
+        with self.drive_lock:
+            for name, value in self.joystick.get_axis_events():
+                # logger.info("%s: %s" % (name, value))
+
+                if name == "ry":
+                    if self.enable_tilt_axis:
+                        self.tilt_speed = self.input_shaper.get("tilt", value)
+                    else:
+                        self.linear_vel_command = self.input_shaper.get("linear", value)
+                    # self.prev_drive_command_time = time.time()
+                elif name == "rx":
+                    self.grab_speed = self.input_shaper.get("grab", value)
                 else:
-                    self.grab_speed = 0
-            elif name == "x":
-                self.drive_cmd_rotate = self.drive_max_speed * value
-                self.prev_drive_command_time = time.time()
-                # logger.info("rotate cmd: %s" % self.drive_cmd_rotate)
-            elif name == "y":
-                self.drive_cmd_forward = -self.drive_max_speed * value
-                self.prev_drive_command_time = time.time()
-                # logger.info("forward cmd: %s" % self.drive_cmd_forward)
-            elif name == "hat0x":
-                self.drive_cmd_rotate = self.drive_min_speed * value
-                self.prev_drive_command_time = time.time()
-            elif name == "hat0y":
-                self.drive_cmd_forward = -self.drive_min_speed * value
-                self.prev_drive_command_time = time.time()
-            # elif name == "rz":
-            #     self.set_brake_pedal_gripper(value)
+                    self.apply_drive_axis(name, value)
+                # elif name == "rz":
+                #     self.set_brake_pedal_gripper(value)
 
     def update_button_events(self):
         for name, value in self.joystick.get_button_events():
@@ -461,7 +709,10 @@ class Dodobot(Robot):
 
         if self.thumbl_pressed and self.thumbr_pressed and self.set_pid_event:
             self.reload_pid_ks()
-            self.set_pid_ks()
+            if self.set_pid_ks():
+                self.pushed_config_hash = self.get_config_hash()
+            else:
+                self.pushed_config_hash = None
             self.set_pid_event = False
 
     def joy_to_gripper(self, joy_value):
@@ -486,38 +737,69 @@ class Dodobot(Robot):
             self.set_linear_vel(linear_vel)
             self.prev_linear_vel_command = linear_vel
 
-    def update_drive_command(self):
-        current_time = time.time()
-        if self.drive_cmd_forward != 0.0 or self.drive_cmd_rotate != 0.0:
-            if current_time - self.prev_sent_command_time < self.drive_command_update_delay:
-                return
-            self.prev_sent_command_time = current_time
+    def get_linear_height_mm(self):
+        if self.linear_state["pos"] is None:
+            return self.stability_table.max_height()  # assume the worst until the axis reports in
+        return self.linear_state["pos"] * robot_config.linear_mm_per_step
+
+    def get_max_deceleration(self):
+        return self.stability_table.max_deceleration(self.get_linear_height_mm(), robot_config.tipping_payload_kg)
 
+    def get_drive_targets(self, current_time):
         if current_time - self.prev_drive_command_time > self.drive_command_timeout:
-            cmd_A = 0.0
-            cmd_B = 0.0
+            return 0.0, 0.0
         else:
-            cmd_A = self.drive_cmd_forward + self.drive_cmd_rotate
-            cmd_B = self.drive_cmd_forward - self.drive_cmd_rotate
+            return self.drive_cmd_forward + self.drive_cmd_rotate, self.drive_cmd_forward - self.drive_cmd_rotate
 
-        if (self.prev_cmd_A != cmd_A or self.prev_cmd_B != cmd_B or
-                current_time - self.prev_drive_repeat_command_time > self.drive_command_repeat_timeout):
-            self.prev_drive_repeat_command_time = current_time
+    def update_drive_command(self):
+        if self.drive_controller is not None:
+            return  # the control thread writes drive commands
+        with self.drive_lock:
+            cmd_A, cmd_B = self.get_drive_targets(time.time())
+            self.write_drive_command(cmd_A, cmd_B)
+
+    def write_drive_command(self, cmd_A, cmd_B):
+        with self.drive_lock:
+            event_time = self.pending_drive_event_time
+            self.pending_drive_event_time = None
+
+            current_time = time.time()
+            if (self.prev_cmd_A != cmd_A or self.prev_cmd_B != cmd_B or
+                    current_time - self.prev_drive_repeat_command_time > self.drive_command_repeat_timeout):
+                self.prev_drive_repeat_command_time = current_time
+
+                if (cmd_A == 0.0 and cmd_B == 0.0):
+                    if current_time - self.prev_drive_repeat_stop_time > self.drive_stop_repeat_timeout:
+                        return
+                else:
+                    self.prev_drive_repeat_stop_time = current_time
 
-            if (cmd_A == 0.0 and cmd_B == 0.0):
-                if current_time - self.prev_drive_repeat_stop_time > self.drive_stop_repeat_timeout:
-                    return
-            else:
-                self.prev_drive_repeat_stop_time = current_time
+                self.prev_cmd_A = cmd_A
+                self.prev_cmd_B = cmd_B
 
-            self.prev_cmd_A = cmd_A
-            self.prev_cmd_B = cmd_B
+                self.set_drive_motors(cmd_A, cmd_B)
+                if event_time is not None:
+                    self.teleop_latency.add(self.joystick.get_event_age_ms(event_time))
+                logger.info("A: %s, B: %s" % (cmd_A, cmd_B))
 
-            self.set_drive_motors(cmd_A, cmd_B)
-            logger.info("A: %s, B: %s" % (cmd_A, cmd_B))
+    def report_teleop_latency(self):
+        stats = self.teleop_latency.summary()
+        if stats["count"] == 0:
+            return
+        logger.info("Teleop latency (ms, %s path): p50 %0.1f, p99 %0.1f, max %0.1f over %s commands" % (
+            "direct" if self.direct_teleop else "update loop",
+            stats["p50"], stats["p99"], stats["max"], stats["count"]
+        ))
 
     def pre_serial_stop_callback(self):
-        pass  # stop any running tasks
+        # stop any running tasks
+        if self.network_list_task is not None:
+            self.network_list_task.stop()
+        if self.drive_controller is not None:
+            self.drive_controller.stop()
+        self.report_teleop_latency()
+        if isinstance(self.network_proxy, ProcessProxy):
+            self.network_proxy.close()
 
     def write_image(self, name, path, size, quality=15):
         img_bytes = image.bytes_from_file(path, size, quality)
@@ -535,8 +817,8 @@ class Dodobot(Robot):
 
     def delete_sd(self, dest_name):
         logger.info("Deleting file on SD: %s" % str(dest_name))
-        self.write("delete", dest_name)
-        if not self.wait_for_ok():
+        packet_num = self.write("delete", dest_name)
+        if not self.wait_for_ok(packet_num):
             logger.warn("Failed to receive ok signal for delete SD file: %s" % str(dest_name))
             return False
         return True
@@ -544,7 +826,7 @@ class Dodobot(Robot):
     def write_sd(self, data, dest_name):
         if len(dest_name) == 0:
             logger.error("Destination name is empty!")
-            return
+            return False
         name, ext = os.path.splitext(dest_name)
         if len(ext) > 0:
             ext = ext[1:]  # remove "."
@@ -561,11 +843,11 @@ class Dodobot(Robot):
         logger.info("Writing to SD: %s" % str(dest_name))
 
         self.write("setpath", dest_name)
-        self.write_large("file", data)
+        return self.write_large("file", data)
 
     def write_file(self, path, dest_name):
         if not os.path.isfile(path):
             logger.error("File %s does not exist" % path)
-            return
+            return False
         with open(path, 'rb') as file:
-            self.write_sd(file.read(), dest_name)
+            return self.write_sd(file.read(), dest_name)
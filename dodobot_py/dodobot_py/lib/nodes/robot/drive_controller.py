@@ -0,0 +1,123 @@
+import math
+import time
+
+from lib.config import ConfigManager
+from lib.logger_manager import LoggerManager
+from lib.profiler import RollingStats
+from .task import Task
+
+robot_config = ConfigManager.get_robot_config()
+logger = LoggerManager.get_logger()
+
+
+class SlewRateLimiter:
+    """
+    Moves toward a target with limited acceleration (units/s) and jerk (units/s^2).
+    The rate of change is also capped by what can still be braked to zero before the target,
+    so the output settles on the target instead of overshooting it. A limit of 0.0 disables it.
+    max_decel, if set, replaces max_accel while the output is moving toward zero.
+    """
+
+    def __init__(self, max_accel, max_jerk):
+        self.max_accel = max_accel
+        self.max_jerk = max_jerk
+        self.max_decel = 0.0
+        self.value = 0.0
+        self.rate = 0.0
+
+    def reset(self, value=0.0):
+        self.value = value
+        self.rate = 0.0
+
+    def update(self, target, dt):
+        error = target - self.value
+        max_accel = self.max_decel if self.max_decel > 0.0 and self.value * error < 0.0 else self.max_accel
+        if max_accel <= 0.0 or dt <= 0.0:
+            self.reset(target)
+            return self.value
+
+        desired_rate = min(max_accel, abs(error) / dt)
+        if self.max_jerk > 0.0:
+            # fastest rate that can still be brought to zero in jerk limited steps of dt before the target
+            half_step = self.max_jerk * dt / 2.0
+            braking_rate = math.sqrt(half_step ** 2 + 2.0 * self.max_jerk * abs(error)) - half_step
+            desired_rate = min(desired_rate, braking_rate)
+            desired_rate = math.copysign(desired_rate, error)
+            max_rate_change = self.max_jerk * dt
+            self.rate += max(-max_rate_change, min(max_rate_change, desired_rate - self.rate))
+        else:
+            self.rate = math.copysign(desired_rate, error)
+
+        self.value += self.rate * dt
+        if (target - self.value) * error <= 0.0:  # reached or passed the target
+            self.reset(target)
+        return self.value
+
+
+class DriveController:
+    """
+    Writes drive commands from its own thread at drive_control_rate_hz. The main loop and the
+    joystick only set the targets. Motor commands are slew rate limited on the way to the targets
+    and the thread's timing is measured as jitter: how far each tick started from its schedule.
+    """
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.rate_hz = robot_config.drive_control_rate_hz
+        self.period = 1.0 / self.rate_hz
+        self.limiter_A = SlewRateLimiter(robot_config.drive_max_accel, robot_config.drive_max_jerk)
+        self.limiter_B = SlewRateLimiter(robot_config.drive_max_accel, robot_config.drive_max_jerk)
+        self.jitter = RollingStats(1024)  # ms
+        self.num_missed_ticks = 0
+
+        self.task = robot.session.supervisor.supervise(Task(self.control_task_fn, "drive_control"))
+
+    def start(self):
+        logger.info("Drive control thread running at %0.1f Hz" % self.rate_hz)
+        self.task.start()
+
+    def stop(self):
+        self.task.stop()
+        self.report_jitter()
+
+    def control_task_fn(self, should_stop):
+        next_tick_time = time.monotonic()
+        prev_tick_time = next_tick_time
+        while not should_stop():
+            delay = next_tick_time - time.monotonic()
+            if delay > 0.0:
+                time.sleep(delay)
+
+            tick_time = time.monotonic()
+            self.jitter.add((tick_time - next_tick_time) * 1000.0)
+            # keep the schedule fixed. If a tick was skipped entirely, start over from now
+            next_tick_time += self.period
+            if tick_time > next_tick_time:
+                self.num_missed_ticks += int((tick_time - next_tick_time) / self.period) + 1
+                next_tick_time = tick_time + self.period
+
+            self.step(tick_time - prev_tick_time)
+            prev_tick_time = tick_time
+
+    def update_tipping_limit(self):
+        # the stability table's limits are in m/s^2. Positive drive commands are forward
+        forward, reverse = self.robot.get_max_deceleration()
+        for limiter in (self.limiter_A, self.limiter_B):
+            max_decel = forward if limiter.value >= 0.0 else reverse
+            limiter.max_decel = max_decel * robot_config.drive_units_per_mps
+
+    def step(self, dt):
+        robot = self.robot
+        if robot.stability_table is not None:
+            self.update_tipping_limit()
+        with robot.drive_lock:
+            target_A, target_B = robot.get_drive_targets(time.time())
+            cmd_A = self.limiter_A.update(target_A, dt)
+            cmd_B = self.limiter_B.update(target_B, dt)
+            robot.write_drive_command(cmd_A, cmd_B)
+
+    def report_jitter(self):
+        stats = self.jitter.summary()
+        logger.info("Drive control jitter (ms): p50 %0.3f, p99 %0.3f, max %0.3f over %s ticks. %s missed ticks" % (
+            stats["p50"], stats["p99"], stats["max"], stats["count"], self.num_missed_ticks
+        ))
@@ -0,0 +1,94 @@
+import os
+import tty
+import time
+import select
+import threading
+import collections
+
+from .packet import PacketFramer, encode_packet
+
+
+class DeviceEmulator:
+    """
+    Stand-in for the microcontroller on a pseudo terminal. Open emulator.address like the real
+    serial port. It answers ready requests, acknowledges every packet with txrx and streams
+    battery and state telemetry at telemetry_rate_hz.
+    """
+
+    def __init__(self, name="dodobot", telemetry_rate_hz=10.0):
+        self.name = name
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.address = os.ttyname(self.slave_fd)
+
+        self.framer = PacketFramer()
+        self.write_packet_num = 0
+        self.start_time = time.monotonic()
+
+        self.telemetry_delay = 1.0 / telemetry_rate_hz if telemetry_rate_hz > 0.0 else None
+        self.received = collections.Counter()
+        self.received_packets = collections.deque(maxlen=256)
+        self.write_lock = threading.Lock()
+
+        self.should_stop = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def time_ms(self):
+        return int((time.monotonic() - self.start_time) * 1000)
+
+    def send(self, name, *args):
+        with self.write_lock:
+            data = encode_packet(self.write_packet_num, name, *args)
+            self.write_packet_num += 1
+        while len(data) > 0:
+            try:
+                written = os.write(self.master_fd, data)
+                data = data[written:]
+            except BlockingIOError:
+                # nobody is reading the other end fast enough. Wait like a UART with a full buffer would
+                if self.should_stop:
+                    return
+                select.select([], [self.master_fd], [], 0.01)
+
+    def send_telemetry(self):
+        self.send("batt", self.time_ms(), 350.0, 4000.0, 11.4)
+        self.send("state", self.time_ms(), 1, 0, 1000.0, 20000)
+
+    def handle_packet(self, packet):
+        self.received[packet.category] += 1
+        self.received_packets.append(packet)
+        self.send("txrx", packet.num, 0)
+        if packet.category == "?":
+            self.send("ready", self.time_ms(), self.name)
+
+    def run(self):
+        next_telemetry_time = time.monotonic()
+        while not self.should_stop:
+            timeout = 0.05
+            if self.telemetry_delay is not None:
+                timeout = max(0.0, min(timeout, next_telemetry_time - time.monotonic()))
+            readable, _, _ = select.select([self.master_fd], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self.master_fd, 0x1000)
+                except (BlockingIOError, OSError):
+                    data = b""
+                for packet in self.framer.feed(data):
+                    self.handle_packet(packet)
+
+            if self.telemetry_delay is not None and time.monotonic() >= next_telemetry_time:
+                next_telemetry_time += self.telemetry_delay
+                self.send_telemetry()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.should_stop = True
+        if self.thread.is_alive():
+            self.thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
@@ -0,0 +1,244 @@
+import time
+import threading
+
+from .device_port import DevicePort
+from .battery_state import BatteryState
+from .task import Task
+from . import packet as packet_codec
+from ..node import Node
+from lib.io_loop import IOLoop
+from lib.config import ConfigManager
+from lib.logger_manager import LoggerManager
+
+device_port_config = ConfigManager.get_device_port_config()
+robot_config = ConfigManager.get_robot_config()
+logger = LoggerManager.get_logger()
+
+
+class FleetLink:
+    """One serial device of the fleet with its own state, stats and logger"""
+
+    def __init__(self, name, address, baud_rate=115200, timeout=5.0, write_timeout=5.0):
+        self.name = name
+        self.device = DevicePort(address, baud_rate, timeout, write_timeout)
+        self.framer = packet_codec.PacketFramer()
+        self.logger = logger.getChild(name)
+
+        self.write_lock = threading.Lock()
+        self.write_packet_num = 0
+        self.read_packet_num = -1
+        self.is_reporting = False
+        self.ready_request_time = 0.0
+
+        self.ready_state = {
+            "name"    : "",
+            "is_ready": False,
+            "time_ms" : 0
+        }
+
+        self.power_state = {
+            "recv_time"     : 0.0,
+            "current_mA"    : 0.0,
+            "power_mW"      : 0.0,
+            "load_voltage_V": 0.0,
+            "soc"           : None,
+            "remaining_min" : None
+        }
+
+        self.robot_state = {
+            "recv_time"    : 0.0,
+            "battery_ok"   : True,
+            "motors_active": False,
+            "loop_rate"    : 0.0,
+            "free_mem"     : 0,
+        }
+        self.battery_state = BatteryState()
+
+        self.device_start_time = 0.0
+        self.offset_time_ms = 0
+
+        self.stats = {
+            "bytes_read"     : 0,
+            "packets_read"   : 0,
+            "packets_written": 0,
+            "dropped_packets": 0,
+            "packet_errors"  : 0,
+            "read_calls"     : 0,
+        }
+
+    def open(self):
+        self.device.configure()
+        self.request_ready()
+
+    def close(self):
+        self.device.stop()
+
+    def request_ready(self):
+        self.ready_request_time = time.time()
+        self.write("?", "dodobot")
+
+    def write(self, name, *args):
+        with self.write_lock:
+            packet = packet_codec.encode_packet(self.write_packet_num, name, *args)
+            try:
+                self.device.write(packet)
+            except BaseException as e:
+                self.logger.error("Exception while writing packet %s: %s" % (packet, str(e)))
+            self.write_packet_num += 1
+            self.stats["packets_written"] += 1
+
+    def on_readable(self):
+        data = self.device.read()
+        self.stats["read_calls"] += 1
+        self.stats["bytes_read"] += len(data)
+
+        num_errors = self.framer.num_errors
+        for packet in self.framer.feed(data):
+            self.process_packet(packet)
+        num_new_errors = self.framer.num_errors - num_errors
+        for index in range(-min(num_new_errors, len(self.framer.error_log)), 0):
+            self.logger.error(self.framer.error_log[index])
+        self.stats["packet_errors"] += num_new_errors
+        while len(self.framer.messages) > 0:
+            self.logger.info("Device message: %s" % self.framer.messages.popleft())
+
+    def process_packet(self, packet):
+        self.stats["packets_read"] += 1
+        if self.read_packet_num != -1 and packet.num != self.read_packet_num:
+            num_lost = (packet.num - self.read_packet_num) & packet_codec.PACKET_NUM_MASK
+            if num_lost <= packet_codec.PACKET_NUM_MASK // 2:  # a jump back is the device restarting its count
+                self.stats["dropped_packets"] += num_lost
+        self.read_packet_num = (packet.num + 1) & packet_codec.PACKET_NUM_MASK
+
+        try:
+            if packet.category == "txrx":
+                packet_num, error_code = packet_codec.parse_segments(packet.payload, "dd")
+                if error_code != 0:
+                    self.logger.warning("Packet %s returned an error: %s" % (
+                        packet_num, packet_codec.PACKET_ERROR_CODES.get(error_code, error_code)))
+
+            elif packet.category == "ready":
+                time_ms, name = packet_codec.parse_segments(packet.payload, "ds")
+                self.ready_state["time_ms"] = time_ms
+                self.ready_state["name"] = name
+                self.ready_state["is_ready"] = True
+                self.set_start_time(time_ms)
+                self.logger.info("Ready signal received! %s" % self.ready_state)
+
+            elif packet.category == "batt":
+                recv_time, current_mA, power_mW, load_voltage_V = packet_codec.parse_segments(packet.payload, "ufff")
+                self.power_state["recv_time"] = self.get_device_time(recv_time)
+                self.power_state["current_mA"] = current_mA
+                self.power_state["power_mW"] = power_mW
+                self.power_state["load_voltage_V"] = load_voltage_V
+                if self.battery_state.set(self.power_state):
+                    self.battery_state.log_state()
+                self.power_state.update(self.battery_state.get_estimate())
+
+            elif packet.category == "state":
+                data = packet_codec.parse_segments(packet.payload, "uddfu")
+                self.robot_state["recv_time"] = self.get_device_time(data[0])
+                self.robot_state["battery_ok"] = data[1]
+                self.robot_state["motors_active"] = data[2]
+                self.robot_state["loop_rate"] = data[3]
+                self.robot_state["free_mem"] = data[4]
+        except packet_codec.PacketFormatError as e:
+            self.stats["packet_errors"] += 1
+            self.logger.error("Failed to parse %s packet: %s" % (packet.category, e))
+
+    def set_start_time(self, time_ms):
+        self.device_start_time = time.time()
+        self.offset_time_ms = time_ms
+
+    def get_device_time(self, time_ms):
+        return self.device_start_time + (time_ms - self.offset_time_ms) / 1000.0
+
+
+class RobotFleet(Node):
+    """
+    Drives every device listed under "fleet" in device_port.yaml from one IO loop.
+    Uses the session's IO loop if there is one, otherwise runs its own on a single thread.
+    """
+
+    def __init__(self, session, fleet_config=None):
+        super(RobotFleet, self).__init__(session)
+
+        if fleet_config is None:
+            fleet_config = device_port_config.fleet
+        self.links = {}
+        for link_config in fleet_config:
+            link_config = dict(link_config)
+            link_config.setdefault("baud_rate", device_port_config.baud_rate)
+            link_config.setdefault("timeout", device_port_config.timeout)
+            link_config.setdefault("write_timeout", device_port_config.write_timeout)
+            link = FleetLink(**link_config)
+            self.links[link.name] = link
+
+        self.io_loop = None
+        self.loop_task = None
+        self.timers = []
+        self.check_links_delay = 0.25
+        self.ready_retry_delay = robot_config.write_timeout
+        self.stats_report_delay = 60.0
+
+    def __getitem__(self, name):
+        return self.links[name]
+
+    def start(self):
+        if len(self.links) == 0:
+            return
+        logger.info("Starting fleet of %s robots: %s" % (len(self.links), ", ".join(self.links.keys())))
+
+        if self.session.io_loop is not None:
+            self.io_loop = self.session.io_loop
+        else:
+            self.io_loop = IOLoop()
+            self.loop_task = self.session.supervisor.supervise(Task(self.loop_task_fn, "fleet_io_loop"))
+
+        for link in self.links.values():
+            link.open()
+            self.io_loop.add_reader(link.device, link.on_readable)
+
+        self.timers.append(self.io_loop.call_every(self.check_links_delay, self.check_links))
+        self.timers.append(self.io_loop.call_every(self.stats_report_delay, self.log_stats))
+        if self.loop_task is not None:
+            self.loop_task.start()
+
+    def loop_task_fn(self, should_stop):
+        self.io_loop.run()
+
+    def check_links(self):
+        current_time = time.time()
+        for link in self.links.values():
+            if not link.ready_state["is_ready"]:
+                if current_time - link.ready_request_time > self.ready_retry_delay:
+                    link.logger.info("Writing ready signal again")
+                    link.request_ready()
+            elif not link.is_reporting:
+                link.write("[]", 1)
+                link.is_reporting = True
+
+    def get_stats(self):
+        return {name: dict(link.stats) for name, link in self.links.items()}
+
+    def log_stats(self):
+        for name, stats in self.get_stats().items():
+            logger.info("Fleet %s: %s" % (name, stats))
+
+    def stop(self):
+        if self.io_loop is None:
+            return
+        logger.info("Stopping fleet")
+        for timer in self.timers:
+            timer.cancel()
+        if self.loop_task is not None:
+            # the loop's thread must be out of select before its readers change or their fds close
+            self.loop_task.stop()
+            self.io_loop.stop()
+            self.loop_task.join(1.0)
+        for link in self.links.values():
+            self.io_loop.remove_reader(link.device)
+            link.write("[]", 0)
+            link.close()
+        if self.loop_task is not None:
+            self.io_loop.close()
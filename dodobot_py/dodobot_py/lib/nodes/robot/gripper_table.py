@@ -0,0 +1,61 @@
+import bisect
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+
+class GripperTable:
+    """
+    Jaw opening (mm) by fraction of servo travel between gripper_closed (0.0) and gripper_open (1.0),
+    generated by calculations/parallel_dist_calcs.py. Travel is evenly spaced, so position to
+    opening is an index into the table. Opening to position bisects the opening column.
+    """
+
+    def __init__(self, path, open_position, closed_position):
+        import numpy as np  # only needed to parse the table, not when the session is imported
+
+        rows = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+        travel = rows[:, 0]
+        opening_mm = rows[:, 2]
+        if len(rows) < 2 or not np.allclose(np.diff(travel), travel[1] - travel[0]):
+            raise ValueError("%s isn't evenly spaced in travel" % path)
+        if np.any(np.diff(opening_mm) <= 0.0):
+            raise ValueError("%s openings don't increase with travel" % path)
+
+        self.travel_start = float(travel[0])
+        self.travel_step = float(travel[1] - travel[0])
+        self.travel = travel.tolist()
+        self.opening_mm = opening_mm.tolist()
+        self.open_position = open_position
+        self.closed_position = closed_position
+        logger.info("Loaded %s row gripper table from %s. Opening range: %0.1f..%0.1f mm" % (
+            len(rows), path, self.min_opening(), self.max_opening()))
+
+    def min_opening(self):
+        return self.opening_mm[0]
+
+    def max_opening(self):
+        return self.opening_mm[-1]
+
+    def position_to_mm(self, position):
+        travel = (position - self.closed_position) / (self.open_position - self.closed_position)
+        index = (travel - self.travel_start) / self.travel_step
+        if index <= 0.0:
+            return self.opening_mm[0]
+        if index >= len(self.opening_mm) - 1:
+            return self.opening_mm[-1]
+        lower = int(index)
+        fraction = index - lower
+        return self.opening_mm[lower] * (1.0 - fraction) + self.opening_mm[lower + 1] * fraction
+
+    def mm_to_position(self, opening_mm):
+        if opening_mm <= self.opening_mm[0]:
+            travel = self.travel[0]
+        elif opening_mm >= self.opening_mm[-1]:
+            travel = self.travel[-1]
+        else:
+            index = bisect.bisect_right(self.opening_mm, opening_mm) - 1
+            fraction = (opening_mm - self.opening_mm[index]) / (self.opening_mm[index + 1] - self.opening_mm[index])
+            travel = self.travel[index] * (1.0 - fraction) + self.travel[index + 1] * fraction
+        return int(round(self.closed_position + travel * (self.open_position - self.closed_position)))
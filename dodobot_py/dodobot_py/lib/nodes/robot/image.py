@@ -1,7 +1,8 @@
 import io
-from PIL import Image
 
 def bytes_from_file(path, size, quality=15):
+    from PIL import Image  # only needed when an image is uploaded. PIL is slow to import
+
     img = Image.open(path)
     img = img.resize(size)
 
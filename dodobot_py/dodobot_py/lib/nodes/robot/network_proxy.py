@@ -3,32 +3,29 @@ import time
 # import textwrap
 import subprocess
 
+from . import nmcli_parser
+
 
 class NetworkProxy:
     def __init__(self):
-        self.connection_cmd = "nmcli -p -m multiline -f common device show".split(" ")
-        self.list_cmd = "nmcli -p -m multiline -f common device".split(" ")
+        self.connection_fields = ["GENERAL.DEVICE", "GENERAL.STATE", "GENERAL.CONNECTION", "IP4.ADDRESS"]
+        self.connection_cmd = ["nmcli", "-t", "-f", ",".join(self.connection_fields), "device", "show"]
+        self.list_fields = ["DEVICE", "STATE"]
+        self.list_cmd = ["nmcli", "-t", "-f", ",".join(self.list_fields), "device"]
         self.hostname_cmd = ["hostname"]
         self.wifi_state_command = "nmcli radio wifi".split(" ")
         self.wifi_on_command = "nmcli radio wifi on".split(" ")
         self.wifi_off_command = "nmcli radio wifi off".split(" ")
-        self.list_wifi_command = "nmcli -m multiline dev wifi list".split(" ")
+        self.list_wifi_fields = ["IN-USE", "SSID", "MODE", "CHAN", "RATE", "SIGNAL", "BARS", "SECURITY"]
+        self.list_wifi_command = ["nmcli", "-t", "-f", ",".join(self.list_wifi_fields), "dev", "wifi", "list"]
         self.rescan_wifi_command = "nmcli dev wifi rescan".split(" ")
+        self.rescan_poll_interval = 0.25
+        self.rescan_settle_time = 2.0
         self.hotspot_off_command = "nmcli con down %s"
         self.hotspot_on_command = "nmcli con up %s"
 
-        self.device_regex = r"GENERAL\.DEVICE:(.*)"  # interface name
-        self.device_state_regex = r"GENERAL\.STATE:.*\((.*)\)"  # connected or not
-        self.connection_regex = r"GENERAL\.CONNECTION:(.*)"  # wifi SSID
-        self.ip_address = r"IP4\.ADDRESS.*:(.*)"  # ip address
-
-        self.device_regex = r"DEVICE:.* (.*)"  # device name
-        self.device_state_regex_list = r"STATE:.* (.*)"  # connection state
-
-        self.list_regex_templates = ["IN-USE", "SSID", "MODE", "CHAN", "RATE", "SIGNAL", "BARS", "SECURITY"]
-        self.list_regexs = []
-        for index, regex in enumerate(self.list_regex_templates):
-            self.list_regexs.append(r"%s:(.*)" % self.list_regex_templates[index])
+        self.device_state_regex = re.compile(r"\((.*)\)")  # "100 (connected)" -> connected
+        self.ip_address_key = "IP4.ADDRESS"
 
         # self.network_info_wrapper = textwrap.TextWrapper(width=17, break_long_words=True, replace_whitespace=False)
 
@@ -36,52 +33,39 @@ class NetworkProxy:
         result = subprocess.run(self.list_cmd, stdout=subprocess.PIPE)
         output = result.stdout.decode()
 
-        devices = []
-        matches = re.finditer(self.device_regex, output, re.MULTILINE)
-        for match in matches:
-            device_name = match.group(1)
-            devices.append(device_name)
-
-        conn_states = []
-        matches = re.finditer(self.device_state_regex_list, output, re.MULTILINE)
-        for index, match in enumerate(matches):
-            state = match.group(1)
-            conn_states.append(state)
-
-        assert len(conn_states) == len(devices), f"{len(conn_states)} != {len(devices)}"
-
         report = {}
-        for index in range(len(devices)):
-            report[devices[index]] = conn_states[index]
+        for record in nmcli_parser.parse_records(output, self.list_fields):
+            report[record["DEVICE"]] = record["STATE"]
         return report
-    
+
     def connection_report(self, interface_name):
         result = subprocess.run(self.connection_cmd + [str(interface_name)], stdout=subprocess.PIPE)
         output = result.stdout.decode()
+        report = nmcli_parser.parse_key_values(output)
 
         device_name = "--"
         device_state = "--"
         connection_state = "--"
         ip_address = "xx.xx.xx.xx"
 
-        match = re.search(self.device_regex, output)
-        if match:
-            device_name = match.group(1).strip()
+        if "GENERAL.DEVICE" in report:
+            device_name = report["GENERAL.DEVICE"].strip()
         else:
             print("Device name doesn't match interface name! %s != %s" % (device_name, interface_name))
 
-        match = re.search(self.device_state_regex, output)
-        if match:
-            device_state = match.group(1).strip()
+        if "GENERAL.STATE" in report:
+            match = self.device_state_regex.search(report["GENERAL.STATE"])
+            if match:
+                device_state = match.group(1).strip()
 
-        match = re.search(self.connection_regex, output)
-        if match:
-            connection_state = match.group(1).strip()
+        if report.get("GENERAL.CONNECTION"):
+            connection_state = report["GENERAL.CONNECTION"].strip()
+
+        for key, value in report.items():
+            if key.startswith(self.ip_address_key) and len(value) > 0:
+                ip_address = value.strip()
+                break
 
-        match = re.search(self.ip_address, output)
-        if match:
-            ip_address = match.group(1).strip()
-        
         return device_name, device_state, connection_state, ip_address
 
     def get_interface_info(self, interface_name):
@@ -149,58 +133,72 @@ class NetworkProxy:
         output = result.stdout.decode()
         return output
 
-    def get_list_report(self, device, length):
-        info = self.wait_for_rescan(device)
-
+    def get_list_report(self, device, length, timeout=10.0):
         report = []
-        for index in range(min(length, len(info))):
-            device_info = info[index]
-            bars = self.bars_to_int(device_info[6])
-            line = [device_info[0] + device_info[1], bars]
-            report.append(line)
+        for report in self.iter_list_report(device, length, timeout):
+            pass
         return report
 
-    def wait_for_rescan(self, device):
-        if not self.get_radio_state():
-            return []
-
-        result = subprocess.run(self.rescan_wifi_command, stdout=subprocess.PIPE)
-        output = result.stdout.decode()
-
+    def iter_list_report(self, device, length, timeout=10.0):
+        for info in self.iter_rescan(device, timeout):
+            report = []
+            for index in range(min(length, len(info))):
+                device_info = info[index]
+                bars = self.bars_to_int(device_info["BARS"])
+                line = [device_info["IN-USE"] + device_info["SSID"], bars]
+                report.append(line)
+            yield report
+
+    def wait_for_rescan(self, device, timeout=10.0):
         info = []
-        while len(info) <= 1:
-            info = self.list_wifi(device)
-            time.sleep(0.25)
-
-        info.sort(key=self.sort_network_info, reverse=True)
+        for info in self.iter_rescan(device, timeout):
+            pass
         return info
 
+    def iter_rescan(self, device, timeout=10.0):
+        """
+        Start a wifi rescan in the background and yield the sorted network list whenever it changes.
+        The cached list is yielded first so callers can show something right away. Stops once
+        the rescan has finished and the list has settled, or when the timeout expires.
+        """
+        if not self.get_radio_state():
+            return
+
+        process = subprocess.Popen(self.rescan_wifi_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + timeout
+        prev_info = None
+        prev_change_time = time.time()
+        try:
+            while True:
+                info = self.list_wifi(device)
+                info.sort(key=self.sort_network_info, reverse=True)
+                current_time = time.time()
+                if info != prev_info:
+                    prev_info = info
+                    prev_change_time = current_time
+                    yield info
+
+                rescan_finished = process.poll() is not None
+                if rescan_finished and current_time - prev_change_time > self.rescan_settle_time:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0.0:
+                    break
+                time.sleep(min(self.rescan_poll_interval, remaining))
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
     def list_wifi(self, device):
-        # 0: IN-USE
-        # 1: SSID
-        # 2: MODE
-        # 3: CHAN
-        # 4: RATE
-        # 5: SIGNAL
-        # 6: BARS
-        # 7: SECURITY
-
-        result = subprocess.run(self.list_wifi_command, stdout=subprocess.PIPE)
+        # only read the cached scan results. iter_rescan decides when to trigger a new scan
+        cmd = self.list_wifi_command + ["ifname", str(device), "--rescan", "no"]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE)
         output = result.stdout.decode()
 
-        info_list = []
-        for subindex, regex in enumerate(self.list_regexs):
-            matches = re.finditer(regex, output, re.MULTILINE)
-
-            entries = []
-            for match in matches:
-                entry = match.group(1).strip()
-                entries.append(entry)
-            while len(info_list) < len(entries):
-                info_list.append(["" for _ in range(len(self.list_regexs))])
-
-            for index, entry in enumerate(entries):
-                info_list[index][subindex] = entry
+        info_list = nmcli_parser.parse_records(output, self.list_wifi_fields)
+        for info in info_list:
+            info["IN-USE"] = info["IN-USE"].strip()
         return info_list
 
     def bars_to_int(self, bars):
@@ -229,9 +227,12 @@ class NetworkProxy:
     @staticmethod
     def sort_network_info(item):
         # priorize "IN-USE" otherwise use "SIGNAL"
-        if item[0] == "*":
+        if item["IN-USE"] == "*":
             return 100000
-        return int(item[5])
+        try:
+            return int(item["SIGNAL"])
+        except ValueError:
+            return 0
 
 
 if __name__ == '__main__':
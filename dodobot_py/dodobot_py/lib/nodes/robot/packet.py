@@ -0,0 +1,200 @@
+import struct
+import collections
+
+PACKET_START_0 = b'\x12'
+PACKET_START_1 = b'\x34'
+PACKET_STOP = b'\n'
+PACKET_SEP = b'\t'
+
+LARGE_PACKET_LEN = 0x1000
+
+PACKET_ERROR_CODES = {
+    0: "no error",
+    1: "c1 != \\x12",
+    2: "c2 != \\x34",
+    3: "packet is too short",
+    4: "checksums don't match",
+    5: "packet count segment not found",
+    6: "packet counts not synchronized",
+    7: "failed to find category segment",
+    8: "invalid format",
+    9: "packet didn't end with stop character",
+}
+
+Packet = collections.namedtuple("Packet", "num category payload")
+PACKET_NUM_MASK = 0xffffffff  # packet numbers are 32 bits on the wire and wrap
+
+
+class PacketFormatError(Exception):
+    pass
+
+
+def to_uint16_bytes(integer):
+    return integer.to_bytes(2, 'big')
+
+
+def to_int32_bytes(integer):
+    return integer.to_bytes(4, 'big', signed=True)
+
+
+def to_float_bytes(floating_point):
+    return struct.pack('f', floating_point)
+
+
+def encode_args(args):
+    encoded = b""
+    for arg in args:
+        if type(arg) == int:
+            encoded += to_int32_bytes(arg)
+        elif type(arg) == float:
+            encoded += to_float_bytes(arg)
+        elif type(arg) == str or type(arg) == bytes:
+            assert len(arg) <= LARGE_PACKET_LEN, arg
+            if type(arg) == str:
+                arg = arg.encode()
+            encoded += to_uint16_bytes(len(arg)) + arg
+        else:
+            raise PacketFormatError("Invalid argument type: %s, %s" % (type(arg), arg))
+    return encoded
+
+
+def packet_header(packet_num, name):
+    return to_int32_bytes(packet_num) + str(name).encode() + PACKET_SEP
+
+
+def packet_footer(packet):
+    calc_checksum = sum(packet) & 0xff
+    packet += b"%02x" % calc_checksum
+
+    packet_len_bytes = to_uint16_bytes(len(packet))
+    return PACKET_START_0 + PACKET_START_1 + packet_len_bytes + packet + PACKET_STOP
+
+
+def encode_packet(packet_num, name, *args):
+    return packet_footer(packet_header(packet_num, name) + encode_args(args))
+
+
+def parse_segments(payload, formats):
+    """
+    Parse the segments of a packet payload (everything after the category).
+    :param payload: bytes
+    :param formats: one character per segment. d/u: 32-bit int, f: float, s: length prefixed bytes
+    :return: list of parsed values
+    """
+    parsed_data = []
+    index = 0
+    for f in formats:
+        if f == 'd' or f == 'u' or f == 'f':
+            length = 4
+        elif f == 's':
+            if index + 2 > len(payload):
+                raise PacketFormatError("Missing length for segment #%s. Payload: %s" % (len(parsed_data), payload))
+            length = int.from_bytes(payload[index: index + 2], 'big')
+            index += 2
+        else:
+            raise PacketFormatError("Invalid segment format: %s" % f)
+
+        if index + length > len(payload):
+            raise PacketFormatError("Failed to parse segment #%s. Payload: %s" % (len(parsed_data), payload))
+        segment = payload[index: index + length]
+        index += length
+
+        if f == 'd' or f == 'u':
+            parsed_data.append(int.from_bytes(segment, 'big'))
+        elif f == 'f':
+            parsed_data.append(struct.unpack('f', segment)[0])
+        else:
+            parsed_data.append(segment)
+    return parsed_data
+
+
+class PacketFramer:
+    """
+    Incremental packet decoder. Feed it whatever bytes are available and it returns the complete,
+    checksum verified packets. Bytes outside of a packet are collected as device messages.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.messages = collections.deque(maxlen=64)
+        self.num_errors = 0
+        self.error_log = collections.deque(maxlen=16)
+
+    def feed(self, data):
+        self.buffer += data
+        packets = []
+        while True:
+            start_index = self.buffer.find(PACKET_START_0 + PACKET_START_1)
+            if start_index == -1:
+                self._collect_messages(len(self.buffer) - 1, keep_partial=True)  # keep a possible partial start
+                break
+            self._collect_messages(start_index)
+
+            if len(self.buffer) < 4:
+                break
+            packet_len = int.from_bytes(self.buffer[2:4], 'big')
+            if len(self.buffer) < 4 + packet_len + 1:
+                break
+
+            packet = bytes(self.buffer[4: 4 + packet_len])
+            stop_char = self.buffer[4 + packet_len: 4 + packet_len + 1]
+            if stop_char != PACKET_STOP:
+                # resync from the next byte. The length may have been corrupted
+                self._record_error("Packet didn't end with stop character: %s" % repr(stop_char))
+                del self.buffer[:2]
+                continue
+            del self.buffer[:4 + packet_len + 1]
+
+            result = self.decode(packet)
+            if result is not None:
+                packets.append(result)
+        return packets
+
+    def decode(self, packet):
+        if len(packet) < 5:
+            self._record_error("Received packet has an invalid number of characters! %s" % repr(packet))
+            return None
+        try:
+            recv_checksum = int(packet[-2:], 16)
+        except ValueError:
+            self._record_error("Failed to parsed checksum as hex int: %s" % repr(packet))
+            return None
+        calc_checksum = sum(packet[:-2]) & 0xff
+        if calc_checksum != recv_checksum:
+            self._record_error("Checksum failed! recv %02x != calc %02x. %s" % (recv_checksum, calc_checksum, repr(packet)))
+            return None
+        packet = packet[:-2]
+
+        packet_num = int.from_bytes(packet[0:4], 'big')
+        sep_index = packet.find(PACKET_SEP, 4)
+        if sep_index == -1:
+            category_bytes = packet[4:]
+            payload = b""
+        else:
+            category_bytes = packet[4: sep_index]
+            payload = packet[sep_index + 1:]
+        try:
+            category = category_bytes.decode()
+        except UnicodeDecodeError:
+            self._record_error("Category segment contains invalid characters: %s" % repr(packet))
+            return None
+        return Packet(packet_num, category, payload)
+
+    def _collect_messages(self, end_index, keep_partial=False):
+        if end_index <= 0:
+            return
+        lines = bytes(self.buffer[:end_index]).split(PACKET_STOP)
+        if keep_partial and len(self.buffer) <= LARGE_PACKET_LEN:
+            # the last line may still be arriving
+            consumed = end_index - len(lines[-1])
+            lines = lines[:-1]
+        else:
+            consumed = end_index
+        for line in lines:
+            if len(line) > 0:
+                self.messages.append(line)
+        del self.buffer[:consumed]
+
+    def _record_error(self, message):
+        self.num_errors += 1
+        self.error_log.append(message)
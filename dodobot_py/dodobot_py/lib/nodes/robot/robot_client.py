@@ -1,3 +1,5 @@
+import os
+import json
 import time
 import struct
 import serial
@@ -7,6 +9,7 @@ import threading
 from .device_port import DevicePort
 from .battery_state import BatteryState
 from .task import Task
+from . import packet as packet_codec
 from ..node import Node
 from lib.config import ConfigManager
 from lib.logger_manager import LoggerManager
@@ -31,10 +34,15 @@ class Robot(Node):
         self.should_stop = False
         self.serial_device_paused = False
 
-        self.read_task = Task(self.read_task_fn)
-        self.write_date_task = Task(self.write_date_task_fn)
+        # a failed serial thread is raised in the main loop right away, which relaunches the client
+        self.read_task = self.session.supervisor.supervise(Task(self.read_task_fn, "robot_read"))
+        self.write_date_task = self.session.supervisor.supervise(Task(self.write_date_task_fn, "robot_write_date"))
         self.write_date_delay = robot_config.write_date_delay
 
+        self.io_loop = None
+        self.write_date_timer = None
+        self.failed_write_date_attempts = 0
+
         self.read_update_rate_hz = device_port_config.update_rate_hz
         self.update_delay = 1.0 / self.read_update_rate_hz
 
@@ -49,13 +57,13 @@ class Robot(Node):
         self.write_lock = threading.Lock()
         self.read_lock = threading.Lock()
 
-        self.PACKET_START_0 = b'\x12'
-        self.PACKET_START_1 = b'\x34'
-        self.PACKET_STOP = b'\n'
-        self.PACKET_SEP = b'\t'
-        self.PACKET_SEP_STR = b'\t'
+        self.PACKET_START_0 = packet_codec.PACKET_START_0
+        self.PACKET_START_1 = packet_codec.PACKET_START_1
+        self.PACKET_STOP = packet_codec.PACKET_STOP
+        self.PACKET_SEP = packet_codec.PACKET_SEP
+        self.PACKET_SEP_STR = packet_codec.PACKET_SEP
 
-        self.large_packet_len = 0x1000
+        self.large_packet_len = packet_codec.LARGE_PACKET_LEN
 
         self.ready_state = {
             "name"    : "",
@@ -67,7 +75,9 @@ class Robot(Node):
             "recv_time"     : 0.0,
             "current_mA"    : 0.0,
             "power_mW"      : 0.0,
-            "load_voltage_V": 0.0
+            "load_voltage_V": 0.0,
+            "soc"           : None,
+            "remaining_min" : None
         }
 
         self.robot_state = {
@@ -81,7 +91,8 @@ class Robot(Node):
 
         self.battery_state = BatteryState()
 
-        self.read_buffer = ""
+        self.framer = packet_codec.PacketFramer()
+        self.read_buffer = b""
         self.buffer_index = 0
         self.current_segment = ""
         self.current_segment_num = 0
@@ -90,26 +101,17 @@ class Robot(Node):
 
         self.check_ready_timeout = robot_config.check_ready_timeout
         self.write_timeout = robot_config.write_timeout
-        self.packet_read_timeout = robot_config.packet_read_timeout
-
-        self.packet_error_codes = {
-            0: "no error",
-            1: "c1 != \\x12",
-            2: "c2 != \\x34",
-            3: "packet is too short",
-            4: "checksums don't match",
-            5: "packet count segment not found",
-            6: "packet counts not synchronized",
-            7: "failed to find category segment",
-            8: "invalid format",
-            9: "packet didn't end with stop character",
-        }
+
+        self.packet_error_codes = packet_codec.PACKET_ERROR_CODES
 
         self.device_start_time = 0.0
         self.offset_time_ms = 0
 
         self.is_active = False
 
+        self.warm_state = None
+        self.is_warm_start = False
+
         self.shutdown_timer = 0.0
         self.shutdown_starting = False
         self.prev_display_countdown = None
@@ -119,21 +121,43 @@ class Robot(Node):
         self.packet_ok_timeout = 1.0
 
     def start(self):
+        for name, fn, after in self.startup_steps():
+            fn()
+
+    def startup_steps(self):
+        return [
+            ("configure", self.start_device, ()),
+            ("handshake", self.handshake, ("configure",)),
+        ]
+
+    def start_device(self):
         logger.info("Starting rover client")
+        if robot_config.warm_relaunch:
+            self.warm_state = self.load_warm_state()
 
         self.device.configure()
         logger.info("Device configured")
 
-        self.read_task.start()
-        logger.info("Read thread started")
-        time.sleep(1.0)
+        if self.session.io_loop is None:
+            self.read_task.start()
+            logger.info("Read thread started")
+        if self.warm_state is None:
+            time.sleep(1.0)
 
+    def handshake(self):
         self.check_ready()
+        self.is_warm_start = self.check_warm_state()
         self.prev_command_time = time.time()
 
         self.set_reporting(True)
 
-        self.write_date_task.start()
+        if self.session.io_loop is None:
+            self.write_date_task.start()
+        else:
+            self.io_loop = self.session.io_loop
+            self.io_loop.add_reader(self.device, self.on_device_readable)
+            self.write_date_timer = self.io_loop.call_every(self.write_date_delay, self.write_date_callback)
+            logger.info("Registered serial device with the IO loop")
 
     def process_packet(self, category):
         if category == "txrx" and self.parse_segments("dd"):
@@ -167,11 +191,16 @@ class Robot(Node):
             self.power_state["load_voltage_V"] = self.parsed_data[3]
             logger.debug("power_state: %s" % str(self.power_state))
             state_changed = self.battery_state.set(self.power_state)
+            self.power_state.update(self.battery_state.get_estimate())
             if state_changed:
                 self.battery_state.log_state()
             if self.battery_state.should_shutdown():
-                raise LowBatteryException(
-                    "Battery is critically low: {load_voltage_V:0.2f}!! Shutting down.".format(**self.power_state))
+                if self.power_state["remaining_min"] is None:
+                    remaining_time = ""
+                else:
+                    remaining_time = ", %0.1f min left" % self.power_state["remaining_min"]
+                raise LowBatteryException("Battery is critically low: %0.2f%s!! Shutting down." % (
+                    self.power_state["load_voltage_V"], remaining_time))
 
         elif category == "state" and self.parse_segments("uddfu"):
             self.robot_state["recv_time"] = self.get_device_time(self.parsed_data[0])
@@ -267,6 +296,20 @@ class Robot(Node):
                 if failed_write_attempts >= 10:
                     return e
 
+    def write_date_callback(self):
+        if self.serial_device_paused:
+            return
+        try:
+            self.write_date()
+            self.failed_write_date_attempts = 0
+        except serial.SerialTimeoutException:
+            self.failed_write_date_attempts += 1
+            if self.failed_write_date_attempts >= 10:
+                raise
+
+    def on_device_readable(self):
+        self.read()
+
     def check_ready(self):
         self.write("?", "dodobot")
 
@@ -281,8 +324,8 @@ class Robot(Node):
                 self.write("?", "dodobot")
                 write_time = time.time()
 
-            if self.device.in_waiting() > 2:
-                self.read()
+            if self.read() == 0:
+                time.sleep(0.001)
 
         if self.ready_state["is_ready"]:
             self.set_start_time(self.ready_state["time_ms"])
@@ -291,14 +334,6 @@ class Robot(Node):
             raise DeviceNotReadyException("Failed to receive ready signal within %ss" % self.check_ready_timeout)
 
     def update(self):
-        if not self.read_task.is_errored():
-            logger.error("Error detected in read task. Raising exception")
-            raise self.read_task.thread_exception
-
-        if not self.write_date_task.is_errored():
-            logger.error("Error detected in write date task. Raising exception")
-            raise self.write_date_task.thread_exception
-
         self.check_shutdown_timer()
 
         current_time = time.time()
@@ -320,6 +355,9 @@ class Robot(Node):
 
         self.read_task.stop()
         self.write_date_task.stop()
+        if self.io_loop is not None:
+            self.io_loop.remove_reader(self.device)
+            self.write_date_timer.cancel()
 
         self.pre_serial_stop_callback()
 
@@ -337,30 +375,33 @@ class Robot(Node):
 
     @staticmethod
     def to_uint16_bytes(integer):
-        return integer.to_bytes(2, 'big')
+        return packet_codec.to_uint16_bytes(integer)
 
     @staticmethod
     def to_int32_bytes(integer):
-        return integer.to_bytes(4, 'big', signed=True)
+        return packet_codec.to_int32_bytes(integer)
 
     @staticmethod
     def to_float_bytes(floating_point):
-        return struct.pack('f', floating_point)
+        return packet_codec.to_float_bytes(floating_point)
 
-    def wait_for_ok(self, packet_num=None):
+    def wait_for_ok(self, packet_num):
         if packet_num is None:
-            packet_num = self.write_packet_num - 1
+            return False  # the packet wasn't written
         self.wait_for_ok_reqs[packet_num] = None
         start_timer = time.time()
         while True:
             if time.time() - start_timer > self.packet_ok_timeout:
                 logger.warn("Timed out while waiting for response from packet #%s" % packet_num)
+                self.wait_for_ok_reqs.pop(packet_num, None)
                 return False
             if self.wait_for_ok_reqs[packet_num] is not None:
                 error_code = self.wait_for_ok_reqs.pop(packet_num)
                 logger.info("Received response for packet #%s: %s" % (packet_num, error_code))
                 return error_code == 0 or error_code == 6
-            time.sleep(0.01)
+            # without a read thread nothing else reads while this blocks (during startup or inside a loop callback)
+            if self.session.io_loop is None or self.read() == 0:
+                time.sleep(0.01)
 
     def write_large(self, name, arg):
         assert type(arg) == str or type(arg) == bytes
@@ -373,36 +414,40 @@ class Robot(Node):
             segments.append(arg[index: index + offset])
         num_segments = len(segments)
         for index, segment in enumerate(segments):
-            self.write(name, index, num_segments, segment)
-            if not self.wait_for_ok():
+            packet_num = self.write(name, index, num_segments, segment)
+            if not self.wait_for_ok(packet_num):
                 logger.warn("Failed to receive ok signal on segment %s of %s. %s" % (index + 1, num_segments, name))
-                break
+                return False
+        return True
 
     def write(self, name, *args):
+        """Returns the packet number the packet was sent as, for wait_for_ok. None if it wasn't sent"""
         if self.serial_device_paused:
             logger.debug("Serial device is paused. Skipping write: %s, %s" % (str(name), str(args)))
-            return
+            return None
 
-        packet = self.packet_header(name)
+        body = b""
         for arg in args:
             if type(arg) == int:
-                packet += self.to_int32_bytes(arg)
+                body += self.to_int32_bytes(arg)
             elif type(arg) == float:
-                packet += self.to_float_bytes(arg)
+                body += self.to_float_bytes(arg)
             elif type(arg) == str or type(arg) == bytes:
                 assert len(arg) <= self.large_packet_len, arg
                 len_bytes = self.to_uint16_bytes(len(arg))
                 if type(arg) == str:
                     arg = arg.encode()
-                packet += len_bytes + arg
+                body += len_bytes + arg
             else:
                 logger.warn("Invalid argument type: %s, %s" % (type(arg), arg))
 
-        packet = self.packet_footer(packet)
-        self._write_packet(packet)
+        return self._write_packet(name, body)
 
-    def _write_packet(self, packet):
+    def _write_packet(self, name, body):
+        # the packet number is taken and incremented under the lock so concurrent writers never share one
         with self.write_lock:
+            packet_num = self.write_packet_num
+            packet = self.packet_footer(self.packet_header(packet_num, name) + body)
             logger.debug("Writing %s" % str(packet))
             try:
                 self.device.write(packet)
@@ -411,53 +456,13 @@ class Robot(Node):
 
             self.write_packet_num += 1
             time.sleep(0.0005)  # give the microcontroller a chance to not drop the next packet
+        return packet_num
 
-    def packet_header(self, name):
-        packet = self.to_int32_bytes(self.write_packet_num)
-        packet += str(name).encode() + self.PACKET_SEP
-        return packet
+    def packet_header(self, packet_num, name):
+        return packet_codec.packet_header(packet_num, name)
 
     def packet_footer(self, packet):
-        calc_checksum = 0
-        for val in packet:
-            calc_checksum += val
-        calc_checksum &= 0xff
-
-        packet += b"%02x" % calc_checksum
-
-        packet_len = len(packet)
-        packet_len_bytes = self.to_uint16_bytes(packet_len)
-
-        packet = self.PACKET_START_0 + self.PACKET_START_1 + packet_len_bytes + packet
-        packet += self.PACKET_STOP
-
-        return packet
-
-    def wait_for_packet_start(self):
-        begin_time = time.time()
-        msg_buffer = b""
-        c1 = ""
-        c2 = ""
-
-        while True:
-            if time.time() - begin_time > self.packet_read_timeout:
-                return False
-
-            if self.device.in_waiting() < 2:
-                continue
-
-            c1 = self.device.read(1)
-            # logger.info("buffer: %s" % msg_buffer)
-            if c1 == self.PACKET_START_0:
-                c2 = self.device.read(1)
-                if c2 == self.PACKET_START_1:
-                    return True
-            elif c1 == self.PACKET_STOP:
-                # time.sleep(self.update_delay)
-                logger.info("Device message: %s" % (msg_buffer))
-                msg_buffer = b""
-            else:
-                msg_buffer += c1
+        return packet_codec.packet_footer(packet)
 
     def get_next_segment(self, length=None, tab_separated=False):
         if self.buffer_index >= len(self.read_buffer):
@@ -484,110 +489,46 @@ class Robot(Node):
             return True
 
     def read(self):
+        """Process the complete packets that have arrived. Never waits for the rest of a partial packet"""
         with self.read_lock:
             return self._read()
 
-    def readline(self):
-        begin_time = time.time()
-        buffer = b""
-        len_bytes = b''
-        packet_len = 0
-        counter = 0
-        while True:
-            if time.time() - begin_time > self.packet_read_timeout:
-                break
-            if not self.device.in_waiting():
-                continue
-            c = self.device.read(1)
-            if len(len_bytes) < 2:
-                len_bytes += c
-                if len(len_bytes) == 2:
-                    packet_len = int.from_bytes(len_bytes, "big")
-                continue
-
-            counter += 1
-            if counter > packet_len:
-                if c != self.PACKET_STOP:
-                    logger.error("Packet didn't end with stop character: %s. buffer: %s" % (c, buffer))
-                    return None
-                break
-            buffer += c
-        return buffer
-
     def _read(self):
         # if self.serial_device_paused:
         #     logger.debug("Serial device is paused. Skipping read")
         #     return
 
-        if not self.wait_for_packet_start():
-            return False
-
-        buffer = self.readline()
-        if buffer is None:
-            logger.error("Error encountered while reading packet. Skipping packet")
-            return False
-
-        logger.debug("buffer: %s" % buffer)
-
-        if len(buffer) < 5:
-            logger.error("Received packet has an invalid number of characters! %s" % repr(buffer))
-            self.read_packet_num += 1
-            return False
-
-        calc_checksum = 0
-        for val in buffer[:-2]:
-            calc_checksum += val
-        calc_checksum &= 255
-
-        self.read_buffer = buffer
-        # try:
-        #     self.read_buffer = buffer.decode()
-        # except UnicodeDecodeError as e:
-        #     logger.error(e)
-        #     logger.error("buffer: %s" % buffer)
-        #     return False
-        try:
-            recv_checksum = int(self.read_buffer[-2:], 16)
-        except ValueError as e:
-            logger.error("Failed to parsed checksum as hex int: %s" % repr(self.read_buffer))
-            self.read_packet_num += 1
-            return False
-        if calc_checksum != recv_checksum:
-            logger.error(
-                "Checksum failed! recv %02x != calc %02x. %s" % (recv_checksum, calc_checksum, repr(self.read_buffer)))
-            self.read_packet_num += 1
-            return False
-        self.read_buffer = self.read_buffer[:-2]
-
-        self.buffer_index = 0
-
-        # get packet num segment
-        if not self.get_next_segment(4):
-            logger.error(
-                "Failed to find packet number segment %s! %s" % (repr(self.current_segment), repr(self.read_buffer)))
-            self.read_packet_num += 1
-            return False
-        self.recv_packet_num = int.from_bytes(self.current_segment, 'big')
+        num_waiting = self.device.in_waiting()
+        if num_waiting == 0:
+            return 0
+
+        num_errors = self.framer.num_errors
+        packets = self.framer.feed(self.device.read(num_waiting))
+        num_new_errors = self.framer.num_errors - num_errors
+        for index in range(-min(num_new_errors, len(self.framer.error_log)), 0):
+            logger.error(self.framer.error_log[index])
+        self.read_packet_num += num_new_errors
+        while len(self.framer.messages) > 0:
+            logger.info("Device message: %s" % self.framer.messages.popleft())
+
+        for packet in packets:
+            self.process_framed_packet(packet)
+        return len(packets)
+
+    def process_framed_packet(self, packet):
+        logger.debug("packet: %s" % str(packet))
+        self.recv_packet_num = packet.num
         if self.read_packet_num == -1:
             self.read_packet_num = self.recv_packet_num
         if self.recv_packet_num != self.read_packet_num:
             logger.warning("Received packet num doesn't match local count. "
                            "recv %s != local %s", self.recv_packet_num, self.read_packet_num)
-            logger.debug("Buffer: %s" % self.read_buffer)
             self.read_packet_num = self.recv_packet_num
 
-        # find category segment
-        if not self.get_next_segment(tab_separated=True):
-            logger.error(
-                "Failed to find category segment %s! %s" % (repr(self.current_segment), repr(self.read_buffer)))
-            self.read_packet_num += 1
-            return False
-        try:
-            category = self.current_segment.decode()
-        except UnicodeDecodeError:
-            logger.error("Category segment contains invalid characters: %s, %s" % (repr(self.current_segment), repr(self.read_buffer)))
-            self.read_packet_num += 1
-            return False
+        # segments are parsed from the payload after the category
+        self.read_buffer = packet.payload
+        self.buffer_index = 0
+        category = packet.category
         logger.debug("category: %s" % category)
 
         try:
@@ -641,13 +582,68 @@ class Robot(Node):
                 logger.info("Exiting read thread")
                 return
 
-            while self.device.in_waiting() > 2:
-                self.read()
+            self.read()
 
     def log_packet_error_code(self, error_code, packet_num):
         logger.warning("Packet %s returned an error:" % packet_num)
         logger.warning("\t%s" % self.packet_error_codes[error_code])
 
+    def get_warm_state(self):
+        name = self.ready_state["name"]
+        if isinstance(name, (bytes, bytearray)):
+            name = name.decode()
+        return {
+            "name": name,
+            "device_time_ms": self.offset_time_ms + int((time.time() - self.device_start_time) * 1000),
+            "time": time.time(),
+        }
+
+    def save_warm_state(self):
+        if not self.ready_state["is_ready"]:
+            return
+        state = self.get_warm_state()
+        with open(robot_config.warm_state_path, 'w') as file:
+            json.dump(state, file)
+        logger.info("Saved warm state: %s" % state)
+
+    def clear_warm_state(self):
+        if os.path.isfile(robot_config.warm_state_path):
+            os.remove(robot_config.warm_state_path)
+
+    def load_warm_state(self):
+        # the state only describes the process that saved it. Remove it so a later cold start can't use it
+        if not os.path.isfile(robot_config.warm_state_path):
+            return None
+        try:
+            with open(robot_config.warm_state_path) as file:
+                state = json.load(file)
+        except BaseException as e:
+            logger.error("Failed to load warm state: %s" % str(e), exc_info=True)
+            state = None
+        self.clear_warm_state()
+        logger.info("Loaded warm state: %s" % state)
+        return state
+
+    def check_warm_state(self):
+        """
+        The microcontroller kept running through the relaunch if its clock advanced by as much as the
+        wall clock did since the state was saved. If it restarted, its clock starts over near zero
+        """
+        if self.warm_state is None:
+            return False
+        elapsed_ms = (time.time() - self.warm_state["time"]) * 1000.0
+        expected_time_ms = self.warm_state["device_time_ms"] + elapsed_ms
+        name = self.get_warm_state()["name"]
+        if name != self.warm_state["name"]:
+            logger.info("Device name changed from %s to %s. Starting cold" % (self.warm_state["name"], name))
+            return False
+        if abs(self.ready_state["time_ms"] - expected_time_ms) > robot_config.warm_state_tolerance_ms:
+            logger.info("Device time is %sms. Expected %0.0fms if it hadn't restarted. Starting cold" % (
+                self.ready_state["time_ms"], expected_time_ms))
+            return False
+        logger.info("Device kept running through the relaunch. Starting warm")
+        return True
+
     def set_start_time(self, time_ms):
         self.device_start_time = time.time()
         self.offset_time_ms = time_ms
@@ -0,0 +1,59 @@
+import bisect
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+
+class StabilityTable:
+    """
+    Max safe deceleration (m/s^2) by linear axis height (mm) and payload (kg), generated by
+    calculations/tipping_calcs.py. Lookups interpolate bilinearly between grid points and clamp to
+    the table's edges, so nothing from the tipping model is evaluated at runtime.
+    """
+
+    def __init__(self, path):
+        import numpy as np  # kept out of the session import, only loading the csv needs it
+
+        rows = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+        self.heights = np.unique(rows[:, 0])
+        self.payloads = np.unique(rows[:, 1])
+        shape = (len(self.heights), len(self.payloads))
+        if len(rows) != shape[0] * shape[1]:
+            raise ValueError("%s isn't a full grid of heights and payloads" % path)
+
+        order = np.lexsort((rows[:, 1], rows[:, 0]))
+        self.forward = rows[order, 2].reshape(shape).tolist()
+        self.reverse = rows[order, 3].reshape(shape).tolist()
+        self.heights = self.heights.tolist()
+        self.payloads = self.payloads.tolist()
+        logger.info("Loaded %sx%s stability table from %s" % (shape[0], shape[1], path))
+
+    @staticmethod
+    def _neighbors(axis, value):
+        # index of the lower grid point and how far value is toward the next one
+        if value <= axis[0] or len(axis) == 1:
+            return 0, 0.0
+        if value >= axis[-1]:
+            return len(axis) - 2, 1.0
+        index = bisect.bisect_right(axis, value) - 1
+        return index, (value - axis[index]) / (axis[index + 1] - axis[index])
+
+    def _interpolate(self, grid, height_mm, payload_kg):
+        i, u = self._neighbors(self.heights, height_mm)
+        j, v = self._neighbors(self.payloads, payload_kg)
+        i1 = min(i + 1, len(self.heights) - 1)
+        j1 = min(j + 1, len(self.payloads) - 1)
+        low = grid[i][j] * (1.0 - v) + grid[i][j1] * v
+        high = grid[i1][j] * (1.0 - v) + grid[i1][j1] * v
+        return low * (1.0 - u) + high * u
+
+    def max_height(self):
+        return self.heights[-1]
+
+    def max_deceleration(self, height_mm, payload_kg):
+        """Returns the forward and reverse limits"""
+        return (
+            self._interpolate(self.forward, height_mm, payload_kg),
+            self._interpolate(self.reverse, height_mm, payload_kg)
+        )
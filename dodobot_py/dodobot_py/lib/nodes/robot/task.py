@@ -6,22 +6,42 @@ logger = LoggerManager.get_logger()
 
 
 class Task:
-    def __init__(self, task_fn):
+    def __init__(self, task_fn, name=None, daemon=False):
         self.should_stop = False
         self.task_fn = task_fn
+        self.name = name if name is not None else task_fn.__name__
+        self.daemon = daemon
         self.should_stop_fn = (lambda: self.should_stop,)
-        self.thread = threading.Thread(target=self.run, args=self.should_stop_fn)
+        self.thread = self._create_thread()
         self.thread_exception = None
         self.is_finished = False
+        self.supervisor = None  # set by Supervisor.supervise. Notified as soon as the task fails
+
+    def _create_thread(self):
+        thread = threading.Thread(target=self.run, args=self.should_stop_fn, name=self.name)
+        thread.daemon = self.daemon
+        return thread
 
     def start(self):
         self.thread.start()
 
+    def restart(self):
+        """Run task_fn again on a new thread. Only call once the previous run has finished"""
+        self.should_stop = False
+        self.thread_exception = None
+        self.is_finished = False
+        self.thread = self._create_thread()
+        self.thread.start()
+
     def stop(self):
         self.should_stop = True
 
+    def join(self, timeout=None):
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
     def is_errored(self):
-        return self.thread_exception is None
+        return self.thread_exception is not None
 
     def run(self, should_stop):
         try:
@@ -32,3 +52,5 @@ class Task:
             logger.error(str(e), exc_info=True)
             self.thread_exception = e
         self.is_finished = True
+        if self.thread_exception is not None and self.supervisor is not None:
+            self.supervisor.report(self, self.thread_exception)
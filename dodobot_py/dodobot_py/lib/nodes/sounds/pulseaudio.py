@@ -3,9 +3,6 @@ import os
 import time
 from subprocess import Popen, PIPE
 
-from pydub import AudioSegment
-from pydub.playback import _play_with_simpleaudio
-
 from lib.logger_manager import LoggerManager
 
 logger = LoggerManager.get_logger()
@@ -19,6 +16,13 @@ logger = LoggerManager.get_logger()
 # https://chrisjean.com/fix-for-usb-audio-is-too-loud-and-mutes-at-low-volume-in-ubuntu/
 
 
+def decode_audio_file(path):
+    # module level so a process pool can run it
+    from pydub import AudioSegment  # pydub and simpleaudio are only imported once sounds are enabled
+
+    return AudioSegment.from_file(os.path.expanduser(path))
+
+
 class Audio:
     def __init__(self):
         self.audio = None
@@ -26,8 +30,7 @@ class Audio:
 
     @classmethod
     def load_from_path(cls, path):
-        path = os.path.expanduser(path)
-        return cls.load(AudioSegment.from_file(path))
+        return cls.load(decode_audio_file(path))
 
     @classmethod
     def load(cls, audio_segment):
@@ -45,6 +48,7 @@ class Audio:
     def play(self):
         self.stop()
         if self.audio is not None:
+            from pydub.playback import _play_with_simpleaudio
             self.playback = _play_with_simpleaudio(self.audio)
 
     def is_playing(self):
@@ -67,6 +71,7 @@ class Pacmd:
         self.raw_volume = self.volume_raw_min
         self.sink_timeout_s = 30.0
 
+    def connect(self):
         self.wait_for_sinks()
         self.set_sink()
 
@@ -1,11 +1,11 @@
-from pydub import generators
-
 from lib.config import ConfigManager
 from lib.logger_manager import LoggerManager
-from .pulseaudio import Audio, Pacmd
+from lib.process_node import fork_context, fork_pipe, close_inherited_connections
+from .pulseaudio import Audio, Pacmd, decode_audio_file
 from ..node import Node
 
 sound_config = ConfigManager.get_sounds_config()
+general_config = ConfigManager.get_general_config()
 logger = LoggerManager.get_logger()
 
 
@@ -20,19 +20,47 @@ class Sounds(Node):
         )
 
         self.sounds = {}
-        self.load_audio(sound_config.sounds)
+        self.silent_audio = Audio()  # played for sounds that aren't loaded (yet)
+        self.decode_workers = []
+        if sound_config.enabled and "audio_decoding" in general_config.process_offload:
+            self.start_decode_workers(sound_config.sounds)
 
     def start(self):
+        for name, fn, after in self.startup_steps():
+            fn()
+
+    def startup_steps(self):
+        # waiting for the pulseaudio sink and decoding audio files are independent and both slow
+        return [
+            ("controller", self.start_controller, ()),
+            ("load", self.load_all_audio, ()),
+        ]
+
+    def start_controller(self):
+        if not sound_config.enabled:
+            logger.info("Sounds are disabled")
+            return
+        self.controller.connect()
         self.controller.set_volume(sound_config.volume)
 
+    def load_all_audio(self):
+        if not sound_config.enabled:
+            return
+        self.load_audio(sound_config.sounds)
+
     def stop(self):
+        self.close_decode_workers()
         for audio in self.sounds.values():
             audio.unload()
 
     def __getitem__(self, name):
-        return self.sounds[name]
+        return self.sounds.get(name, self.silent_audio)
 
     def load_audio(self, config: dict):
+        if "audio_decoding" in general_config.process_offload:
+            decoded = self.decode_in_processes(config)
+        else:
+            decoded = {}
         for name, value in config.items():
             if len(value) == 0:
                 logger.info("Skipping '%s' audio file" % str(name))
@@ -44,16 +72,80 @@ class Sounds(Node):
             else:
                 try:
                     logger.info("Loading '%s' as audio file: %s" % (name, value))
-                    self.sounds[name] = Audio.load_from_path(value)
+                    if name in decoded:
+                        self.sounds[name] = Audio.load(self.receive_decoded(decoded[name]))
+                    else:
+                        self.sounds[name] = Audio.load_from_path(value)
                 except BaseException as e:
                     logger.error(str(e), exc_info=True)
+        self.close_decode_workers()
+
+    @staticmethod
+    def audio_file_paths(config: dict):
+        return {name: value for name, value in config.items() if len(value) > 0 and not value.startswith(":generate:")}
 
+    def start_decode_workers(self, config: dict):
+        # forked while the session is being constructed, like ProcessNode. Spawned workers would
+        # re-import main.py and the whole session before decoding anything
+        num_workers = min(len(self.audio_file_paths(config)), sound_config.decode_processes)
+        for index in range(num_workers):
+            connection, child_connection = fork_pipe()
+            process = fork_context.Process(
+                target=self.run_decode_worker, args=(child_connection,), name="decode_audio_%s" % index
+            )
+            process.daemon = True
+            process.start()
+            child_connection.close()
+            self.decode_workers.append((process, connection))
+
+    @staticmethod
+    def run_decode_worker(connection):
+        close_inherited_connections()
+        try:
+            while True:
+                path = connection.recv()
+                try:
+                    connection.send(("audio", decode_audio_file(path)))
+                except BaseException as e:
+                    connection.send(("error", "%s: %s" % (type(e).__name__, e)))
+        except (EOFError, KeyboardInterrupt):
+            pass
+        finally:
+            connection.close()
+
+    def decode_in_processes(self, config: dict):
+        # each worker answers in the order it was sent paths, and load_audio reads them in that same order
+        if len(self.decode_workers) == 0:
+            return {}
+        decoded = {}
+        for index, (name, path) in enumerate(self.audio_file_paths(config).items()):
+            process, connection = self.decode_workers[index % len(self.decode_workers)]
+            connection.send(path)
+            decoded[name] = connection
+        return decoded
+
+    def receive_decoded(self, connection):
+        kind, value = connection.recv()
+        if kind == "error":
+            raise RuntimeError("Failed to decode audio in its process: %s" % value)
+        return value
+
+    def close_decode_workers(self):
+        for process, connection in self.decode_workers:
+            connection.close()
+        for process, connection in self.decode_workers:
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+        self.decode_workers = []
 
     def generate_sound(self, generate_params):
         class_name = generate_params.pop("class_name")
         duration = generate_params.pop("duration")
         volume = generate_params.pop("volume", 0.0)
 
+        from pydub import generators
+
         generator_class = getattr(generators, class_name)
 
         generator_class(**generate_params)
@@ -0,0 +1,273 @@
+import time
+import queue
+import itertools
+import threading
+import traceback
+import multiprocessing
+
+from lib.config import ConfigManager
+from lib.logger_manager import LoggerManager
+from lib.supervisor import Supervisor
+from lib.nodes.node import Node
+
+logger = LoggerManager.get_logger()
+general_config = ConfigManager.get_general_config()
+
+# Children are forked while the session is being constructed, before any node starts a thread,
+# so they start out with a copy of the loaded configs and logger and nothing else running
+fork_context = multiprocessing.get_context("fork")
+
+# Parent ends of the pipes to every forked child. A child inherits all of them, so it closes them
+# first thing. Otherwise a child keeps its own pipe open and never sees EOF when the parent closes it
+parent_connections = []
+
+
+def fork_pipe():
+    parent_connection, child_connection = fork_context.Pipe()
+    parent_connections.append(parent_connection)
+    return parent_connection, child_connection
+
+
+def close_inherited_connections():
+    for connection in parent_connections:
+        connection.close()
+    del parent_connections[:]
+
+
+class ProcessNodeError(Exception):
+    pass
+
+
+class ChildSession:
+    """What a node running in a child process sees as its session"""
+
+    def __init__(self):
+        self.io_loop = None
+        self.supervisor = Supervisor()
+
+
+def format_exception(e):
+    return "%s: %s\n%s" % (type(e).__name__, e, "".join(traceback.format_tb(e.__traceback__)))
+
+
+class ProcessNode(Node):
+    """
+    Runs node_class in a child process so its Python work doesn't compete with the serial thread
+    for the GIL. The session calls start/update/stop on this proxy like on any other node.
+    Errors raised in the child are raised from update() as ProcessNodeError.
+    """
+
+    def __init__(self, session, node_class, *args):
+        super(ProcessNode, self).__init__(session)
+        self.name = node_class.__name__
+        self.update_rate_hz = node_class.update_rate_hz
+        self.stop_timeout = 2.0
+
+        self.connection, child_connection = fork_pipe()
+        self.process = fork_context.Process(
+            target=self.run_child, args=(child_connection, node_class, args), name=self.name
+        )
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+        logger.info("Started %s in process %s" % (self.name, self.process.pid))
+
+    @staticmethod
+    def run_child(connection, node_class, args):
+        close_inherited_connections()
+        session = ChildSession()
+        node = None
+        try:
+            node = node_class(session, *args)
+            rate_hz = node.update_rate_hz if node.update_rate_hz is not None else general_config.update_rate_hz
+            update_delay = 1.0 / rate_hz
+            next_update_time = time.monotonic()
+            while True:
+                if connection.poll(max(0.0, next_update_time - time.monotonic())):
+                    command = connection.recv()
+                    if command == "start":
+                        node.start()
+                    elif command == "stop":
+                        break
+                session.supervisor.check()
+                if time.monotonic() >= next_update_time:
+                    next_update_time += update_delay
+                    node.update()
+        except (KeyboardInterrupt, EOFError):
+            pass
+        except BaseException as e:
+            logger.error(str(e), exc_info=True)
+            try:
+                connection.send(("error", format_exception(e)))
+            except BaseException:
+                pass
+        finally:
+            if node is not None:
+                node.stop()
+            connection.close()
+
+    def start(self):
+        self.connection.send("start")
+
+    def update(self):
+        if self.connection.poll():
+            message, details = self.connection.recv()
+            raise ProcessNodeError("%s failed in its process: %s" % (self.name, details))
+        if not self.process.is_alive():
+            raise ProcessNodeError("%s process exited with code %s" % (self.name, self.process.exitcode))
+
+    def stop(self):
+        if not self.process.is_alive():
+            return
+        try:
+            self.connection.send("stop")
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(self.stop_timeout)
+        if self.process.is_alive():
+            logger.warning("%s process didn't stop in %ss. Terminating it" % (self.name, self.stop_timeout))
+            self.process.terminate()
+
+
+class ProcessProxy:
+    """
+    Calls the methods of an object that lives in a child process. Calls block the calling thread
+    until the child answers, but not the other threads, and several threads can call at once.
+    Generator methods listed in iter_methods are streamed: each item is sent as the child produces it,
+    and closing the generator early closes it in the child too.
+
+        network_proxy = ProcessProxy(NetworkProxy, iter_methods=["iter_rescan", "iter_list_report"])
+        info, devices = network_proxy.get_report()
+    """
+
+    def __init__(self, factory, iter_methods=()):
+        self.name = getattr(factory, "__name__", str(factory))
+        self.iter_methods = set(iter_methods)
+        self.request_ids = itertools.count()
+        self.responses = {}
+        self.responses_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+        self.connection, child_connection = fork_pipe()
+        self.process = fork_context.Process(target=self.run_child, args=(child_connection, factory), name=self.name)
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+        logger.info("Started %s proxy in process %s" % (self.name, self.process.pid))
+
+        self.receive_thread = None  # started on first use. The child has to be forked before any threads exist
+
+    @staticmethod
+    def run_child(connection, factory):
+        close_inherited_connections()
+        obj = factory()
+        send_lock = threading.Lock()
+        closed_requests = set()
+
+        def send(*message):
+            with send_lock:
+                connection.send(message)
+
+        def handle(request_id, kind, name, args, kwargs):
+            try:
+                result = getattr(obj, name)(*args, **kwargs)
+                if kind == "iter":
+                    try:
+                        for item in result:
+                            if request_id in closed_requests:
+                                break
+                            send(request_id, "item", item)
+                    finally:
+                        result.close()
+                        closed_requests.discard(request_id)
+                    send(request_id, "done", None)
+                else:
+                    send(request_id, "result", result)
+            except BaseException as e:
+                logger.error(str(e), exc_info=True)
+                send(request_id, "error", format_exception(e))
+
+        try:
+            while True:
+                request_id, kind, name, args, kwargs = connection.recv()
+                if kind == "close":
+                    closed_requests.add(request_id)
+                    continue
+                thread = threading.Thread(target=handle, args=(request_id, kind, name, args, kwargs))
+                thread.daemon = True
+                thread.start()
+        except (EOFError, KeyboardInterrupt):
+            pass
+
+    def _receive_task(self):
+        try:
+            while True:
+                request_id, kind, value = self.connection.recv()
+                with self.responses_lock:
+                    response_queue = self.responses.get(request_id)
+                if response_queue is not None:
+                    response_queue.put((kind, value))
+        except (EOFError, OSError):
+            with self.responses_lock:
+                for response_queue in self.responses.values():
+                    response_queue.put(("error", "%s process exited" % self.name))
+
+    def _send(self, kind, name, args, kwargs):
+        with self.send_lock:
+            if self.receive_thread is None:
+                self.receive_thread = threading.Thread(target=self._receive_task, name=self.name + "_proxy")
+                self.receive_thread.daemon = True
+                self.receive_thread.start()
+            request_id = next(self.request_ids)
+            response_queue = queue.Queue()
+            with self.responses_lock:
+                self.responses[request_id] = response_queue
+            self.connection.send((request_id, kind, name, args, kwargs))
+        return request_id, response_queue
+
+    def _finish(self, request_id):
+        with self.responses_lock:
+            self.responses.pop(request_id, None)
+
+    def call(self, name, *args, **kwargs):
+        request_id, response_queue = self._send("call", name, args, kwargs)
+        try:
+            kind, value = response_queue.get()
+        finally:
+            self._finish(request_id)
+        if kind == "error":
+            raise ProcessNodeError("%s.%s failed in its process: %s" % (self.name, name, value))
+        return value
+
+    def iterate(self, name, *args, **kwargs):
+        request_id, response_queue = self._send("iter", name, args, kwargs)
+        is_done = False
+        try:
+            while True:
+                kind, value = response_queue.get()
+                if kind == "item":
+                    yield value
+                elif kind == "done":
+                    is_done = True
+                    return
+                else:
+                    is_done = True
+                    raise ProcessNodeError("%s.%s failed in its process: %s" % (self.name, name, value))
+        finally:
+            if not is_done and self.process.is_alive():
+                with self.send_lock:
+                    self.connection.send((request_id, "close", name, (), {}))
+            self._finish(request_id)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self.iter_methods:
+            return lambda *args, **kwargs: self.iterate(name, *args, **kwargs)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def close(self):
+        self.connection.close()
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
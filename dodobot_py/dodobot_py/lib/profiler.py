@@ -0,0 +1,122 @@
+import time
+import collections
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+
+class RollingStats:
+    """Keeps the last window_size samples. Percentiles are computed only when asked for"""
+
+    def __init__(self, window_size=512):
+        self.samples = collections.deque(maxlen=window_size)
+        self.count = 0
+        self.max_value = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        if value > self.max_value:
+            self.max_value = value
+
+    def percentile(self, fraction, sorted_samples=None):
+        if sorted_samples is None:
+            sorted_samples = sorted(self.samples)
+        if len(sorted_samples) == 0:
+            return 0.0
+        index = min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))
+        return sorted_samples[index]
+
+    def summary(self):
+        sorted_samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "p50": self.percentile(0.5, sorted_samples),
+            "p99": self.percentile(0.99, sorted_samples),
+            "window_max": sorted_samples[-1] if sorted_samples else 0.0,
+            "max": self.max_value,
+        }
+
+
+class NodeTiming:
+    def __init__(self, window_size):
+        self.durations = collections.defaultdict(lambda: RollingStats(window_size))
+        self.lateness = RollingStats(window_size)
+        self.period = None
+        self.num_overruns = 0
+
+
+class NodeProfiler:
+    """
+    Times every node's start, update and stop calls. An update overruns when it takes longer
+    than the node's period, since the node can't keep its rate then. lateness is how long after
+    its deadline an update started, which shows which node held up the others.
+    """
+
+    def __init__(self, window_size=512, report_interval=60.0):
+        self.window_size = window_size
+        self.report_interval = report_interval
+        self.nodes = collections.OrderedDict()
+        self.prev_report_time = time.monotonic()
+        self.report_requested = False
+
+    def get_node(self, name):
+        timing = self.nodes.get(name)
+        if timing is None:
+            timing = NodeTiming(self.window_size)
+            self.nodes[name] = timing
+        return timing
+
+    def call(self, name, phase, fn):
+        start_time = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.get_node(name).durations[phase].add(time.perf_counter() - start_time)
+
+    def record_update(self, name, period, duration, lateness):
+        timing = self.get_node(name)
+        timing.period = period
+        timing.durations["update"].add(duration)
+        timing.lateness.add(lateness)
+        if duration > period:
+            timing.num_overruns += 1
+
+    def request_report(self):
+        """Safe to call from a signal handler. The report is logged on the next check()"""
+        self.report_requested = True
+
+    def check(self):
+        current_time = time.monotonic()
+        if self.report_requested or current_time - self.prev_report_time > self.report_interval:
+            self.report_requested = False
+            self.prev_report_time = current_time
+            self.log_report()
+
+    def get_report(self):
+        report = collections.OrderedDict()
+        for name, timing in self.nodes.items():
+            report[name] = {
+                "rate_hz": 1.0 / timing.period if timing.period else None,
+                "overruns": timing.num_overruns,
+                "lateness": timing.lateness.summary(),
+            }
+            for phase, stats in timing.durations.items():
+                report[name][phase] = stats.summary()
+        return report
+
+    def log_report(self):
+        lines = ["Node timing (ms):"]
+        for name, timing in self.nodes.items():
+            update = timing.durations["update"].summary()
+            lateness = timing.lateness.summary()
+            line = "%s: updates=%s p50=%0.3f p99=%0.3f max=%0.3f overruns=%s late_p99=%0.3f" % (
+                name, update["count"], update["p50"] * 1000.0, update["p99"] * 1000.0, update["max"] * 1000.0,
+                timing.num_overruns, lateness["p99"] * 1000.0
+            )
+            for phase in ("start", "stop"):
+                if phase in timing.durations:
+                    line += " %s=%0.3f" % (phase, timing.durations[phase].max_value * 1000.0)
+            lines.append(line)
+        logger.info("\n\t".join(lines))
@@ -0,0 +1,96 @@
+import time
+import heapq
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+
+class ScheduledNode:
+    def __init__(self, name, callback, period, order):
+        self.name = name
+        self.callback = callback
+        self.period = period
+        self.order = order  # breaks deadline ties so nodes due together run in registration order
+        self.deadline = 0.0
+        self.num_runs = 0
+        self.num_missed = 0
+
+
+class Scheduler:
+    """
+    Runs each node's update at its own rate. Deadlines are kept in a heap so the main loop
+    only wakes up when something is due:
+
+        scheduler.add("robot", robot.update, 30.0)
+        scheduler.add("data_logger", data_logger.update, 0.05)
+        while True:
+            scheduler.run_pending()
+            time.sleep(scheduler.time_until_next())
+
+    The next deadline is the previous deadline plus the period, so a node's rate doesn't drift
+    with how long its update takes. A node that falls more than a period behind skips the missed
+    updates instead of running them back to back.
+    """
+
+    def __init__(self, default_rate_hz):
+        self.default_rate_hz = default_rate_hz
+        self.nodes = {}
+        self.queue = []
+        self.num_wakeups = 0
+        self.profiler = None  # set to a NodeProfiler to time every update
+
+    def add(self, name, callback, rate_hz=None):
+        if rate_hz is None:
+            rate_hz = self.default_rate_hz
+        if rate_hz <= 0.0:
+            raise ValueError("Update rate for %s must be positive: %s" % (name, rate_hz))
+        entry = ScheduledNode(name, callback, 1.0 / rate_hz, len(self.nodes))
+        entry.deadline = time.monotonic()
+        self.nodes[name] = entry
+        heapq.heappush(self.queue, (entry.deadline, entry.order, entry))
+        logger.info("Scheduling %s at %0.3f Hz" % (name, rate_hz))
+        return entry
+
+    def time_until_next(self):
+        if not self.queue:
+            return 1.0 / self.default_rate_hz
+        return max(0.0, self.queue[0][0] - time.monotonic())
+
+    def run_pending(self):
+        """Run every node whose deadline has passed. Returns the number of updates run"""
+        self.num_wakeups += 1
+        num_run = 0
+        current_time = time.monotonic()
+        while self.queue and self.queue[0][0] <= current_time:
+            deadline, order, entry = heapq.heappop(self.queue)
+            entry.deadline = deadline + entry.period
+            if entry.deadline <= current_time:
+                missed = int((current_time - deadline) / entry.period)
+                entry.num_missed += missed
+                entry.deadline = deadline + (missed + 1) * entry.period
+            heapq.heappush(self.queue, (entry.deadline, entry.order, entry))
+
+            if self.profiler is None:
+                entry.callback()
+            else:
+                start_time = time.monotonic()
+                try:
+                    entry.callback()
+                finally:
+                    self.profiler.record_update(
+                        entry.name, entry.period, time.monotonic() - start_time, start_time - deadline
+                    )
+            entry.num_runs += 1
+            num_run += 1
+        return num_run
+
+    def get_stats(self):
+        return {
+            name: {
+                "rate_hz": 1.0 / entry.period,
+                "runs": entry.num_runs,
+                "missed": entry.num_missed,
+            }
+            for name, entry in self.nodes.items()
+        }
@@ -1,35 +1,105 @@
+from lib.config import ConfigManager
+from lib.logger_manager import LoggerManager
+from lib.io_loop import IOLoop
+from lib.scheduler import Scheduler
+from lib.profiler import NodeProfiler
+from lib.startup import StartupGraph
+from lib.supervisor import Supervisor
+from lib.process_node import ProcessNode
 from lib.nodes.robot import Dodobot
+from lib.nodes.robot.fleet import RobotFleet
 from lib.nodes.joystick import Joystick
 from lib.nodes.data_logger import DataLogger
 from lib.nodes.sounds import Sounds
 from lib.nodes.jetson_stats import JetsonStats
 
+general_config = ConfigManager.get_general_config()
+logger = LoggerManager.get_logger()
+
 
 class Session:
     def __init__(self):
+        if general_config.use_io_loop:
+            self.io_loop = IOLoop()
+        else:
+            self.io_loop = None
+        self.supervisor = Supervisor(self.io_loop)
+
         self.robot = Dodobot(self)
         self.joystick = Joystick(self)
         self.data_logger = DataLogger(self)
         self.sounds = Sounds(self)
-        self.jetson_stats = JetsonStats(self)
+        if "jetson_stats" in general_config.process_offload:
+            self.jetson_stats = ProcessNode(self, JetsonStats)
+        else:
+            self.jetson_stats = JetsonStats(self)
+        self.fleet = RobotFleet(self)
+
+        self.scheduler = Scheduler(general_config.update_rate_hz)
+        self.nodes = {
+            "robot": self.robot,
+            "joystick": self.joystick,
+            "data_logger": self.data_logger,
+            "sounds": self.sounds,
+            "jetson_stats": self.jetson_stats,
+            "fleet": self.fleet,
+        }
+
+        if general_config.profile_nodes:
+            self.profiler = NodeProfiler(general_config.profile_window_size, general_config.profile_report_interval)
+            self.scheduler.profiler = self.profiler
+        else:
+            self.profiler = None
+
+    def call_node(self, name, phase):
+        fn = getattr(self.nodes[name], phase)
+        if self.profiler is None:
+            return fn()
+        else:
+            return self.profiler.call(name, phase, fn)
 
     def start(self):
-        self.sounds.start()
-        self.robot.start()
-        self.joystick.start()
-        self.data_logger.start()
-        self.jetson_stats.start()
+        startup = StartupGraph(general_config.parallel_startup)
+        for name in ("sounds", "robot", "joystick", "data_logger", "jetson_stats", "fleet"):
+            for step_name, fn, after in self.nodes[name].startup_steps():
+                after = [dependency if "." in dependency else name + "." + dependency for dependency in after]
+                startup.add(name + "." + step_name, fn, after)
+        try:
+            startup.run()
+        finally:
+            startup.log_timeline()
+            if self.profiler is not None:
+                for name in self.nodes.keys():
+                    durations = startup.get_durations(name + ".")
+                    if durations:
+                        self.profiler.get_node(name).durations["start"].add(sum(durations.values()))
+
+        for name, node in self.nodes.items():
+            rate_hz = general_config.node_rates_hz.get(name, node.update_rate_hz)
+            self.scheduler.add(name, node.update, rate_hz)
 
     def update(self):
-        self.robot.update()
-        self.joystick.update()
-        self.data_logger.update()
-        self.sounds.update()
-        self.jetson_stats.update()
+        self.supervisor.check()
+        self.scheduler.run_pending()
+        if self.profiler is not None:
+            self.profiler.check()
+
+    def wait_for_next_update(self):
+        # sleep only until the next node is due. A failing task cuts the wait short
+        timeout = self.scheduler.time_until_next()
+        if self.io_loop is not None:
+            next_restart = self.supervisor.time_until_next_restart()
+            if next_restart is not None:
+                timeout = min(timeout, next_restart)
+            self.io_loop.run_once(timeout)
+        else:
+            self.supervisor.wait(timeout)
 
     def stop(self):
-        self.robot.stop()
-        self.joystick.stop()
-        self.data_logger.stop()
-        self.sounds.stop()
-        self.jetson_stats.stop()
+        for name in self.nodes.keys():
+            self.call_node(name, "stop")
+        if self.profiler is not None:
+            self.profiler.log_report()
+        logger.info("Task stats: %s" % self.supervisor.get_stats())
+        if self.io_loop is not None:
+            self.io_loop.stop()
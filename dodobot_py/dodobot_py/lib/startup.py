@@ -0,0 +1,125 @@
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+StartupStep = collections.namedtuple("StartupStep", "name fn after")
+TimelineEntry = collections.namedtuple("TimelineEntry", "name start duration thread error")
+
+
+class StartupGraph:
+    """
+    Runs startup steps as soon as the steps they depend on have finished:
+
+        graph.add("sounds.load", sounds.load_all_audio)
+        graph.add("robot.handshake", robot.handshake, after=["robot.configure"])
+        graph.run()
+
+    Independent steps run concurrently on a thread pool. With parallel=False the steps run
+    one at a time in the order they were added (dependencies still come first).
+    The first step to raise stops any new steps from starting and the exception is re-raised
+    from run() once the running steps are done.
+    """
+
+    def __init__(self, parallel=True, max_workers=4):
+        self.parallel = parallel
+        self.max_workers = max_workers
+        self.steps = collections.OrderedDict()
+        self.timeline = []
+        self.timeline_lock = threading.Lock()
+        self.start_time = 0.0
+
+    def add(self, name, fn, after=()):
+        if name in self.steps:
+            raise ValueError("Startup step %s was added twice" % name)
+        self.steps[name] = StartupStep(name, fn, list(after))
+
+    def check(self):
+        for step in self.steps.values():
+            for dependency in step.after:
+                if dependency not in self.steps:
+                    raise ValueError("Startup step %s depends on unknown step %s" % (step.name, dependency))
+
+    def run(self):
+        self.check()
+        self.start_time = time.monotonic()
+        if self.parallel:
+            self._run_parallel()
+        else:
+            self._run_sequential()
+        logger.info("Startup finished in %0.3fs" % (time.monotonic() - self.start_time))
+
+    def _ready_steps(self, finished, started):
+        for step in self.steps.values():
+            if step.name in started:
+                continue
+            if all(dependency in finished for dependency in step.after):
+                yield step
+
+    def _run_sequential(self):
+        finished = set()
+        while len(finished) < len(self.steps):
+            step = next(self._ready_steps(finished, finished), None)
+            if step is None:
+                raise ValueError("Startup steps have a dependency cycle: %s" % (set(self.steps) - finished))
+            self._run_step(step)
+            finished.add(step.name)
+
+    def _run_parallel(self):
+        finished = set()
+        started = set()
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup") as executor:
+            while True:
+                if error is None:
+                    for step in list(self._ready_steps(finished, started)):
+                        started.add(step.name)
+                        running[executor.submit(self._run_step, step)] = step
+                if not running:
+                    break
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    if future.exception() is not None:
+                        if error is None:
+                            error = future.exception()
+                    else:
+                        finished.add(step.name)
+
+        if error is not None:
+            raise error
+        if len(finished) < len(self.steps):
+            raise ValueError("Startup steps have a dependency cycle: %s" % (set(self.steps) - finished))
+
+    def _run_step(self, step):
+        start_time = time.monotonic()
+        error = None
+        try:
+            step.fn()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            entry = TimelineEntry(
+                step.name, start_time - self.start_time, time.monotonic() - start_time,
+                threading.current_thread().name, error
+            )
+            with self.timeline_lock:
+                self.timeline.append(entry)
+
+    def get_durations(self, prefix=""):
+        return {entry.name: entry.duration for entry in self.timeline if entry.name.startswith(prefix)}
+
+    def log_timeline(self):
+        lines = ["Startup timeline (s):"]
+        for entry in sorted(self.timeline, key=lambda entry: entry.start):
+            line = "%7.3f +%6.3f  %-28s %s" % (entry.start, entry.duration, entry.name, entry.thread)
+            if entry.error is not None:
+                line += "  FAILED: %s" % entry.error
+            lines.append(line)
+        logger.info("\n\t".join(lines))
@@ -0,0 +1,149 @@
+import time
+import queue
+import threading
+import collections
+
+from lib.logger_manager import LoggerManager
+
+logger = LoggerManager.get_logger()
+
+
+class RestartPolicy:
+    """
+    What to do when a supervised task fails. restart=False raises the task's exception in the main
+    loop (the old behavior). Otherwise the task is restarted after a backoff that doubles with each
+    crash in a row, up to max_backoff. A task that ran for reset_after seconds is considered healthy
+    again. After max_restarts crashes in a row, the exception is raised if escalate is True, or the
+    task is left stopped if not.
+    """
+
+    def __init__(self, restart=True, initial_backoff=0.05, max_backoff=5.0, backoff_factor=2.0,
+                 reset_after=30.0, max_restarts=None, escalate=True):
+        self.restart = restart
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff_factor = backoff_factor
+        self.reset_after = reset_after
+        self.max_restarts = max_restarts
+        self.escalate = escalate
+
+    def get_backoff(self, num_crashes_in_a_row):
+        return min(self.max_backoff, self.initial_backoff * self.backoff_factor ** max(0, num_crashes_in_a_row - 1))
+
+
+ESCALATE = RestartPolicy(restart=False)
+
+
+class SupervisedTask:
+    def __init__(self, task, policy, on_restart):
+        self.task = task
+        self.policy = policy
+        self.on_restart = on_restart
+        self.num_crashes = 0
+        self.num_restarts = 0
+        self.crashes_in_a_row = 0
+        self.start_time = time.monotonic()
+        self.restart_time = None
+        self.last_error = None
+
+
+class Supervisor:
+    """
+    Tasks report their own failure the moment their thread exits with an exception. The report wakes
+    the main loop (wait() returns early, or the IO loop is woken) so the failure is handled right
+    away instead of on the next poll of each node.
+    """
+
+    def __init__(self, io_loop=None):
+        self.io_loop = io_loop
+        self.tasks = collections.OrderedDict()
+        self.failures = queue.Queue()
+        self.failure_event = threading.Event()
+
+    def supervise(self, task, policy=ESCALATE, on_restart=None):
+        """on_restart() runs on the main thread right before the task is restarted. Use it to reset state"""
+        task.supervisor = self
+        self.tasks[task.name] = SupervisedTask(task, policy, on_restart)
+        return task
+
+    def report(self, task, exception):
+        # called from the failing task's thread
+        self.failures.put((task, exception))
+        self.failure_event.set()
+        if self.io_loop is not None:
+            self.io_loop.wakeup()
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds. Returns early if a task fails"""
+        next_restart = self.time_until_next_restart()
+        if next_restart is not None:
+            timeout = min(timeout, next_restart)
+        self.failure_event.wait(timeout)
+
+    def time_until_next_restart(self):
+        restart_times = [entry.restart_time for entry in self.tasks.values() if entry.restart_time is not None]
+        if not restart_times:
+            return None
+        return max(0.0, min(restart_times) - time.monotonic())
+
+    def check(self):
+        """Handle reported failures and due restarts. Runs on the main thread. Raises escalated exceptions"""
+        self.failure_event.clear()
+        while True:
+            try:
+                task, exception = self.failures.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_failure(self.tasks[task.name], exception)
+
+        current_time = time.monotonic()
+        for entry in self.tasks.values():
+            if entry.restart_time is not None and current_time >= entry.restart_time:
+                entry.restart_time = None
+                self.restart(entry)
+
+    def handle_failure(self, entry, exception):
+        current_time = time.monotonic()
+        entry.num_crashes += 1
+        entry.last_error = exception
+        if current_time - entry.start_time > entry.policy.reset_after:
+            entry.crashes_in_a_row = 0
+        entry.crashes_in_a_row += 1
+
+        policy = entry.policy
+        if not policy.restart:
+            logger.error("Task %s failed. Raising exception" % entry.task.name)
+            raise exception
+        if policy.max_restarts is not None and entry.crashes_in_a_row > policy.max_restarts:
+            if policy.escalate:
+                logger.error("Task %s failed %s times in a row. Raising exception" % (
+                    entry.task.name, entry.crashes_in_a_row))
+                raise exception
+            logger.error("Task %s failed %s times in a row. Leaving it stopped" % (
+                entry.task.name, entry.crashes_in_a_row))
+            return
+
+        backoff = policy.get_backoff(entry.crashes_in_a_row)
+        entry.restart_time = current_time + backoff
+        logger.warning("Task %s failed (%s crashes, %s in a row): %s. Restarting in %0.3fs" % (
+            entry.task.name, entry.num_crashes, entry.crashes_in_a_row, exception, backoff))
+
+    def restart(self, entry):
+        if entry.task.should_stop:
+            return  # stopped while waiting to restart
+        if entry.on_restart is not None:
+            entry.on_restart()
+        entry.num_restarts += 1
+        entry.start_time = time.monotonic()
+        logger.info("Restarting task %s (restart #%s)" % (entry.task.name, entry.num_restarts))
+        entry.task.restart()
+
+    def get_stats(self):
+        return {
+            name: {
+                "crashes": entry.num_crashes,
+                "restarts": entry.num_restarts,
+                "last_error": repr(entry.last_error) if entry.last_error is not None else None,
+            }
+            for name, entry in self.tasks.items()
+        }
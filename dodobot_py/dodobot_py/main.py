@@ -1,8 +1,11 @@
 import os
 import sys
 import time
+import signal
 import subprocess
 
+import_start_time = time.perf_counter()
+
 from lib import arguments
 arguments.init()  # initialize ConfigManager and LoggerManager
 
@@ -15,6 +18,8 @@ from lib.session import Session
 logger = LoggerManager.get_logger()
 general_config = ConfigManager.get_general_config()
 
+import_time_ms = (time.perf_counter() - import_start_time) * 1000.0
+
 
 def shutdown(session):
     logger.warn("Shutdown function called. Shutting down everything.")
@@ -26,8 +31,16 @@ def reboot(session):
     session.stop()
     subprocess.call("sudo reboot now", shell=True)
 
-def relaunch(session):
+def relaunch(session, warm=False):
     logger.warn("Relaunch function called.")
+    # a warm relaunch tells the next process what the microcontroller already has so it can skip re-sending it
+    try:
+        if warm:
+            session.robot.save_warm_state()
+        else:
+            session.robot.clear_warm_state()
+    except BaseException as e:
+        logger.error(e, exc_info=True)
     session.stop()
 
     # os.execv(sys.argv[0], sys.argv)
@@ -48,23 +61,32 @@ def close(session):
 
 def main():
     logger.info("Starting robot")
+    if import_time_ms > general_config.import_budget_ms:
+        logger.warning("Imports took %0.1fms. Budget is %0.1fms. Run import_time_check.py for details" % (
+            import_time_ms, general_config.import_budget_ms))
+    else:
+        logger.info("Imports took %0.1fms" % import_time_ms)
 
     session = Session()
-    update_delay = 1.0 / general_config.update_rate_hz
+    if session.profiler is not None:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: session.profiler.request_report())
     try:
         session.start()
         while True:
             session.update()
-            time.sleep(update_delay)
+            session.wait_for_next_update()
     except (LowBatteryException, ShutdownException) as e:
         logger.error(str(e), exc_info=True)
         shutdown(session)
     except RebootException as e:
         logger.error(str(e), exc_info=True)
         reboot(session)
-    except (RelaunchException, DeviceRestartException) as e:
+    except RelaunchException as e:
+        logger.error(str(e), exc_info=True)
+        relaunch(session, warm=True)
+    except DeviceRestartException as e:
         logger.error(str(e), exc_info=True)
-        relaunch(session)
+        relaunch(session, warm=False)
 
     except BaseException as e:
         logger.error(str(e), exc_info=True)
@@ -0,0 +1,168 @@
+import os
+import math
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+import yaml
+
+from lib import arguments
+arguments.init()  # initialize ConfigManager and LoggerManager
+
+from lib.config import ConfigManager
+from lib.logger_manager import LoggerManager
+from lib.nodes.joystick_recording import write_recording
+
+logger = LoggerManager.get_logger()
+joystick_config = ConfigManager.get_joystick_config()
+
+# Drives the whole teleop path (joystick reader -> Dodobot -> serial write) from joystick recordings,
+# with the microcontroller replaced by the emulator. Usage:
+#   python3 teleop_bench.py <base_dir>
+# Each scenario runs in a fresh process against a copy of <base_dir>/config. If joystick.yaml has a
+# replay_path, that recording is played at its recorded speed too.
+# Nothing that imports lib.nodes.robot may be imported up here. Its modules bind their configs on import.
+
+STICK_SWEEP_HZ = 0.5  # how fast the generated input sweeps the stick back and forth
+SCENARIOS = [
+    # name, generated event rate (Hz), duration (s), replay speed (0.0 is as fast as the reader takes them)
+    ("gamepad 250Hz", 250.0, 5.0, 1.0),
+    ("storm 1000Hz", 1000.0, 5.0, 1.0),
+    ("storm flat out", 1000.0, 5.0, 0.0),
+]
+TELEOP_PATHS = [True, False]  # robot.yaml direct_teleop
+REPLAY_TIMEOUT_S = 60.0
+
+axis_map = ["x", "y", "rx", "ry", "hat0x", "hat0y"]
+button_map = ["a", "b", "x", "y", "tl", "tr"]
+
+
+def make_sweep_events(rate_hz, duration):
+    # the left stick traced around a circle, alternating x and y events
+    events = []
+    for index in range(int(rate_hz * duration)):
+        time_ms = int(index * 1000.0 / rate_hz)
+        angle = 2.0 * math.pi * STICK_SWEEP_HZ * time_ms / 1000.0
+        number = index % 2
+        value = math.cos(angle) if number == 0 else math.sin(angle)
+        events.append((time_ms, int(32767 * value), 0x02, number))
+    return events
+
+
+def update_yaml(path, **values):
+    with open(path) as file:
+        config = yaml.safe_load(file.read())
+    config.update(values)
+    with open(path, "w") as file:
+        file.write(yaml.safe_dump(config))
+
+
+def make_base_dir(recording_path, speed, direct_teleop):
+    base_dir = tempfile.mkdtemp(prefix="teleop_bench_")
+    config_dir = os.path.join(base_dir, "config")
+    shutil.copytree(os.path.join(joystick_config.base_dir, "config"), config_dir)
+    update_yaml(os.path.join(config_dir, "joystick.yaml"), enabled=True, replay_path=recording_path,
+                replay_speed=speed, record_path="")
+    update_yaml(os.path.join(config_dir, "robot.yaml"), direct_teleop=direct_teleop, warm_relaunch=False)
+    update_yaml(os.path.join(config_dir, "sounds.yaml"), enabled=False)
+    update_yaml(os.path.join(config_dir, "general.yaml"), jetson_stats_enabled=False, profile_nodes=True,
+                process_offload=[])
+    return base_dir
+
+
+def run_scenario(connection, base_dir):
+    # the session's modules read their configs on import, so load the scenario's configs first
+    ConfigManager.init_configs(base_dir)
+    from lib.nodes.robot.emulator import DeviceEmulator
+    emulator = DeviceEmulator().start()
+    ConfigManager.get_device_port_config().address = emulator.address
+
+    from lib.session import Session
+    session = Session()
+    try:
+        session.start()
+
+        start_time = time.monotonic()
+        start_cpu_time = time.process_time()
+        while not session.joystick.is_replay_finished():
+            if time.monotonic() - start_time > REPLAY_TIMEOUT_S:
+                logger.warning("Replay didn't finish in %ss" % REPLAY_TIMEOUT_S)
+                break
+            session.update()
+            session.wait_for_next_update()
+        # a replay faster than the main loop closes before any update has taken its events.
+        # Keep updating until they're taken and at least one drive command period has passed
+        robot_config = ConfigManager.get_robot_config()
+        if robot_config.drive_control_thread:
+            drive_period = 1.0 / robot_config.drive_control_rate_hz
+        else:
+            drive_period = 1.0 / ConfigManager.get_general_config().update_rate_hz
+        drain_end_time = time.monotonic() + drive_period
+        while session.joystick.has_pending_events() or time.monotonic() < drain_end_time:
+            session.update()
+            session.wait_for_next_update()
+        duration = time.monotonic() - start_time
+        cpu_time = time.process_time() - start_cpu_time
+
+        robot_update = session.profiler.get_report()["robot"]["update"]
+        events = session.joystick.events
+        connection.send(dict(
+            duration=duration,
+            cpu=cpu_time / duration,
+            events=session.joystick.replay.num_events,
+            coalesced=events.num_coalesced_axis_events,
+            drive_writes=emulator.received["drive"],
+            latency=session.robot.teleop_latency.summary(),
+            update_p99=robot_update["p99"],
+        ))
+    finally:
+        session.stop()
+        emulator.stop()
+
+
+def measure(recording_path, speed, direct_teleop):
+    base_dir = make_base_dir(recording_path, speed, direct_teleop)
+    try:
+        context = multiprocessing.get_context("fork")
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=run_scenario, args=(child_connection, base_dir))
+        process.start()
+        child_connection.close()  # so recv() raises EOFError if the child dies without sending
+        result = connection.recv()
+        process.join()
+        return result
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main():
+    scenarios = []
+    recordings_dir = tempfile.mkdtemp(prefix="teleop_recordings_")
+    for name, rate_hz, duration, speed in SCENARIOS:
+        path = os.path.join(recordings_dir, name.replace(" ", "_") + ".jsrec")
+        write_recording(path, axis_map, button_map, make_sweep_events(rate_hz, duration))
+        scenarios.append((name, path, speed))
+    if joystick_config.replay_path:
+        scenarios.append(("recording", os.path.expanduser(joystick_config.replay_path), 1.0))
+
+    logger.info("scenario\tpath\tevents\twrites\tcoalesced\tlat p50\tlat p99\tlat max\tupdate p99\tcpu %")
+    try:
+        for name, path, speed in scenarios:
+            for direct_teleop in TELEOP_PATHS:
+                result = measure(path, speed, direct_teleop)
+                latency = result["latency"]
+                if latency["count"] == 0:
+                    latency_columns = "n/a\tn/a\tn/a"  # no drive command was written from a stick event
+                else:
+                    latency_columns = "%0.2f\t%0.2f\t%0.2f" % (latency["p50"], latency["p99"], latency["max"])
+                logger.info("%s\t%s\t%s\t%s\t%s\t%s\t%0.3f\t%0.1f" % (
+                    name, "direct" if direct_teleop else "update", result["events"], result["drive_writes"],
+                    result["coalesced"], latency_columns, result["update_p99"] * 1000.0, result["cpu"] * 100.0
+                ))
+    finally:
+        shutil.rmtree(recordings_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()